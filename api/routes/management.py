@@ -6,24 +6,32 @@ import asyncio
 from typing import Literal
 
 import psutil
-from aiogram import Bot
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy import distinct, exists, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.depends import get_session, verify_admin_token
-from config import API_TOKEN
 from core.bootstrap import MANAGEMENT_CONFIG
 from core.settings.management_config import update_management_config
+from database import async_session_maker
 from database.models import Key, User
 from database.models import Server
-from handlers.admin.sender.sender_service import BroadcastService
-from handlers.admin.sender.sender_utils import get_recipients, parse_message_buttons
+from database.broadcasts import get_broadcast_job, get_broadcast_jobs
+from database.referrals import rebuild_referral_stats
+from handlers.admin.sender.broadcast_jobs import (
+    cancel_broadcast,
+    enqueue_broadcast,
+    pause_broadcast,
+    resume_broadcast,
+)
+from handlers.admin.sender.sender_utils import parse_message_buttons
 from logger import logger
 from utils.backup import backup_database
+from utils.cache import get_cache_stats
+from utils.csv_export import EXPORTS, stream_export
+from utils.send_scheduler import send_scheduler
 
 
 router = APIRouter()
@@ -43,17 +51,6 @@ class BroadcastLaunchPayload(BaseModel):
     photo: str | None = None
     cluster_name: str | None = None
     workers: int = 5
-    messages_per_second: int = 35
-
-
-_broadcast_bot: Bot | None = None
-
-
-def _get_broadcast_bot() -> Bot:
-    global _broadcast_bot
-    if _broadcast_bot is None:
-        _broadcast_bot = Bot(token=API_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    return _broadcast_bot
 
 
 async def _restart_bot() -> None:
@@ -80,6 +77,8 @@ async def get_status(admin=Depends(verify_admin_token)):
     return {
         "maintenance_enabled": bool(MANAGEMENT_CONFIG.get("MAINTENANCE_ENABLED", False)),
         "management": dict(MANAGEMENT_CONFIG or {}),
+        "caches": get_cache_stats(),
+        "send_scheduler": send_scheduler.stats(),
     }
 
 
@@ -152,6 +151,15 @@ async def restore_trials(
     return {"restored": result.rowcount or 0}
 
 
+@router.post("/rebuild-referral-stats")
+async def rebuild_referral_stats_route(
+    admin=Depends(verify_admin_token),
+    session: AsyncSession = Depends(get_session),
+):
+    referrers = await rebuild_referral_stats(session)
+    return {"referrers": referrers}
+
+
 @router.post("/backup")
 async def trigger_backup(admin=Depends(verify_admin_token)):
     async def _run_backup() -> None:
@@ -192,28 +200,78 @@ async def launch_broadcast(
     if len(clean_text) > max_len:
         raise HTTPException(status_code=400, detail=f"Message too long. Max {max_len} symbols")
 
-    tg_ids, total_users = await get_recipients(session, payload.send_to, (payload.cluster_name or None))
-    if not tg_ids:
+    workers = max(1, min(int(payload.workers or 5), 30))
+    job = await enqueue_broadcast(
+        session,
+        send_to=payload.send_to,
+        cluster_name=(payload.cluster_name or None),
+        text=clean_text,
+        photo=payload.photo,
+        keyboard=keyboard,
+        workers=workers,
+    )
+    if not job:
         return {"success": False, "message": "No recipients found", "stats": {"total_messages": 0}}
 
-    bot = _get_broadcast_bot()
-    messages = [
-        {
-            "tg_id": tg_id,
-            "text": clean_text,
-            "photo": payload.photo,
-            "keyboard": keyboard,
-        }
-        for tg_id in tg_ids
-    ]
-
-    workers = max(1, min(int(payload.workers or 5), 30))
-    rate = max(1, min(int(payload.messages_per_second or 35), 60))
-    broadcast_service = BroadcastService(bot=bot, session=session, messages_per_second=rate)
-    stats = await broadcast_service.broadcast(messages, workers=workers)
     return {
         "success": True,
-        "message": "Broadcast completed",
-        "recipients": total_users,
-        "stats": stats,
+        "message": "Broadcast queued",
+        "job_id": job["id"],
+        "recipients": job["total"],
     }
+
+
+@router.get("/broadcast/jobs")
+async def list_broadcast_jobs(
+    limit: int = 20,
+    admin=Depends(verify_admin_token),
+    session: AsyncSession = Depends(get_session),
+):
+    return {"jobs": await get_broadcast_jobs(session, limit=max(1, min(limit, 100)))}
+
+
+@router.get("/broadcast/jobs/{job_id}")
+async def get_broadcast_job_status(
+    job_id: int,
+    admin=Depends(verify_admin_token),
+    session: AsyncSession = Depends(get_session),
+):
+    job = await get_broadcast_job(session, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Broadcast job not found")
+    return job
+
+
+@router.post("/broadcast/jobs/{job_id}/{action}")
+async def control_broadcast_job(
+    job_id: int,
+    action: Literal["pause", "resume", "cancel"],
+    admin=Depends(verify_admin_token),
+    session: AsyncSession = Depends(get_session),
+):
+    handlers = {"pause": pause_broadcast, "resume": resume_broadcast, "cancel": cancel_broadcast}
+    if not await handlers[action](session, job_id):
+        raise HTTPException(status_code=409, detail=f"Cannot {action} broadcast job in its current state")
+    return await get_broadcast_job(session, job_id)
+
+
+@router.get("/export/{kind}")
+async def export_table_csv(
+    kind: Literal["users", "payments", "hot_leads", "keys"],
+    gzip: bool = False,
+    admin=Depends(verify_admin_token),
+):
+    export = EXPORTS[kind]()
+
+    async def _stream():
+        # Своя сессия: ответ читается из курсора уже после выхода из обработчика
+        async with async_session_maker() as session:
+            async for chunk in stream_export(session, export, compress=gzip):
+                yield chunk
+
+    filename = f"{export.filename}.gz" if gzip else export.filename
+    return StreamingResponse(
+        _stream(),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
@@ -3,17 +3,34 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
+import config as cfg
+
 from config import API_TOKEN
 from filters.private import IsPrivateFilter
+from panels.remnawave_pool import close_remnawave_clients
+from panels.xui_pool import close_xui_clients
 from utils.button_icons import apply_button_icons_patch, set_button_icon_config
 from utils.custom_emojis import initialize_custom_emojis
 from utils.errors import setup_error_handlers
 from utils.modules_loader import load_modules_from_folder, modules_hub
+from utils.send_scheduler import setup_send_scheduler
+from utils.sharding import IS_SHARD_WORKER, SHARDING_ENABLED, setup_sharding
 
 apply_button_icons_patch()
 
 bot = Bot(token=API_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-storage = MemoryStorage()
+
+FSM_STORAGE = str(getattr(cfg, "FSM_STORAGE", "memory")).lower()
+
+# Во фронт-процессе многопроцессного режима FSM не используется: апдейты пользователей обрабатывают воркеры
+if FSM_STORAGE == "postgres" and (IS_SHARD_WORKER or not SHARDING_ENABLED):
+    from database.db import async_session_maker
+    from utils.fsm_storage import PostgresStorage
+
+    storage = PostgresStorage(async_session_maker)
+else:
+    storage = MemoryStorage()
+
 dp = Dispatcher(bot=bot, storage=storage)
 
 dp.include_router(modules_hub)
@@ -28,4 +45,8 @@ dp.message.filter(IsPrivateFilter())
 dp.callback_query.filter(IsPrivateFilter())
 
 setup_error_handlers(dp)
+setup_send_scheduler(bot, dp)
+dp.shutdown.register(close_remnawave_clients)
+dp.shutdown.register(close_xui_clients)
+setup_sharding(dp)
 initialize_custom_emojis()
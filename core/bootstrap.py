@@ -1,4 +1,5 @@
 from database import async_session_maker
+from database.admins import load_admin_roles
 from database.db import warm_pool
 from database.tariffs import initialize_all_tariff_weights
 
@@ -16,6 +17,7 @@ async def bootstrap() -> None:
     await warm_pool()
     async with async_session_maker() as session:
         await initialize_all_tariff_weights(session)
+        await load_admin_roles(session)
         await load_buttons_config(session)
         await load_notifications_config(session)
         await load_modes_config(session)
@@ -1,4 +1,6 @@
+from .admins import *
 from .bans import *
+from .broadcasts import *
 from .coupons import *
 from .db import async_session_maker
 from .gifts import *
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import ADMIN_ID
+from database.invalidation import on_tables_committed
+from database.models import Admin
+from logger import logger
+
+
+ADMIN_ROLES_RECONCILE_SEC = 300
+
+_ROOT_ADMIN_IDS: frozenset[int] = frozenset(ADMIN_ID) if isinstance(ADMIN_ID, list | tuple) else frozenset({ADMIN_ID})
+
+_admin_roles: dict[int, str] = {}
+_admin_roles_loaded_at: float | None = None
+_reload_lock = asyncio.Lock()
+
+
+async def load_admin_roles(session: AsyncSession) -> dict[int, str]:
+    """Загружает таблицу admins в память целиком."""
+    global _admin_roles, _admin_roles_loaded_at
+
+    result = await session.execute(select(Admin.tg_id, Admin.role))
+    _admin_roles = dict(result.all())
+    _admin_roles_loaded_at = time.monotonic()
+    logger.debug(f"[Admins] Загружено админов: {len(_admin_roles)}")
+    return _admin_roles
+
+
+def admin_roles_stale() -> bool:
+    """True, если снимок не загружен или пора сверить его с БД."""
+    if _admin_roles_loaded_at is None:
+        return True
+    return time.monotonic() - _admin_roles_loaded_at >= ADMIN_ROLES_RECONCILE_SEC
+
+
+@on_tables_committed("admins")
+def _mark_admin_roles_stale() -> None:
+    global _admin_roles_loaded_at
+    _admin_roles_loaded_at = None
+
+
+async def ensure_admin_roles(session: AsyncSession) -> None:
+    """Перечитывает снимок админов, если он устарел (страховка от изменений в обход бота)."""
+    if not admin_roles_stale():
+        return
+    async with _reload_lock:
+        if admin_roles_stale():
+            await load_admin_roles(session)
+
+
+def set_cached_admin_role(tg_id: int, role: str) -> None:
+    _admin_roles[tg_id] = role
+
+
+def drop_cached_admin(tg_id: int) -> None:
+    _admin_roles.pop(tg_id, None)
+
+
+def is_admin_cached(tg_id: int) -> bool:
+    return tg_id in _ROOT_ADMIN_IDS or tg_id in _admin_roles
+
+
+def is_superadmin_cached(tg_id: int) -> bool:
+    role = _admin_roles.get(tg_id)
+    if role is None:
+        return tg_id in _ROOT_ADMIN_IDS
+    return role != "moderator"
@@ -0,0 +1,150 @@
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.models import BroadcastJob
+from logger import logger
+
+
+BROADCAST_ACTIVE_STATUSES = ("pending", "running", "paused")
+BROADCAST_FINISHED_STATUSES = ("completed", "cancelled", "failed")
+
+
+async def create_broadcast_job(session: AsyncSession, **fields: Any) -> dict:
+    """Создаёт задание рассылки в статусе pending и сразу фиксирует его в БД."""
+    try:
+        job = BroadcastJob(status="pending", updated_at=datetime.utcnow(), **fields)
+        session.add(job)
+        await session.commit()
+        logger.info(f"[Broadcast] Создана рассылка #{job.id} ({job.send_to}, получателей: {job.total})")
+        return job.to_dict()
+    except SQLAlchemyError as e:
+        logger.error(f"[Broadcast] Ошибка при создании рассылки: {e}")
+        await session.rollback()
+        raise
+
+
+async def get_broadcast_job(session: AsyncSession, job_id: int) -> dict | None:
+    job = await session.get(BroadcastJob, job_id, populate_existing=True)
+    return job.to_dict() if job else None
+
+
+async def get_broadcast_jobs(
+    session: AsyncSession, statuses: tuple[str, ...] | None = None, limit: int = 10
+) -> list[dict]:
+    query = select(BroadcastJob).order_by(BroadcastJob.id.desc()).limit(limit)
+    if statuses:
+        query = query.where(BroadcastJob.status.in_(statuses))
+    result = await session.execute(query)
+    return [job.to_dict() for job in result.scalars().all()]
+
+
+async def set_broadcast_job_status(
+    session: AsyncSession, job_id: int, status: str, from_statuses: tuple[str, ...]
+) -> bool:
+    """
+    Переводит рассылку в status, только если текущий статус входит в from_statuses.
+    Возвращает False, если переход невозможен (рассылка уже завершена, снята и т.п.).
+    """
+    values = {"status": status, "updated_at": datetime.utcnow()}
+    if status in BROADCAST_FINISHED_STATUSES:
+        values["finished_at"] = datetime.utcnow()
+    elif status == "pending":
+        # Возобновление после ошибки: прошлый итог больше не актуален
+        values["error"] = None
+        values["finished_at"] = None
+    try:
+        result = await session.execute(
+            update(BroadcastJob)
+            .where(BroadcastJob.id == job_id, BroadcastJob.status.in_(from_statuses))
+            .values(**values)
+            .returning(BroadcastJob.id)
+        )
+        changed = result.scalar_one_or_none() is not None
+        await session.commit()
+        return changed
+    except SQLAlchemyError as e:
+        logger.error(f"[Broadcast] Ошибка смены статуса рассылки #{job_id} на {status}: {e}")
+        await session.rollback()
+        return False
+
+
+async def claim_broadcast_job(session: AsyncSession) -> dict | None:
+    """Забирает самую старую рассылку в статусе pending и переводит её в running."""
+    next_id = (
+        select(BroadcastJob.id)
+        .where(BroadcastJob.status == "pending")
+        .order_by(BroadcastJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    result = await session.execute(
+        update(BroadcastJob)
+        .where(BroadcastJob.id == next_id, BroadcastJob.status == "pending")
+        .values(status="running", updated_at=datetime.utcnow())
+        .returning(*BroadcastJob.__table__.columns)
+    )
+    row = result.mappings().first()
+    await session.commit()
+    return dict(row) if row else None
+
+
+async def save_broadcast_checkpoint(
+    session: AsyncSession,
+    job_id: int,
+    cursor: int,
+    sent: int,
+    failed: int,
+    blocked: int,
+    elapsed_sec: float,
+) -> str | None:
+    """
+    Сохраняет прогресс рассылки: курсор (последний обработанный tg_id) и счётчики.
+    Возвращает текущий статус — так исполнитель узнаёт о паузе или отмене.
+    """
+    result = await session.execute(
+        update(BroadcastJob)
+        .where(BroadcastJob.id == job_id)
+        .values(
+            cursor=cursor,
+            sent=sent,
+            failed=failed,
+            blocked=blocked,
+            elapsed_sec=elapsed_sec,
+            updated_at=datetime.utcnow(),
+        )
+        .returning(BroadcastJob.status)
+    )
+    status = result.scalar_one_or_none()
+    await session.commit()
+    return status
+
+
+async def finish_broadcast_job(session: AsyncSession, job_id: int, status: str, error: str | None = None) -> bool:
+    """Завершает рассылку, если её не отменили и не поставили на паузу раньше."""
+    result = await session.execute(
+        update(BroadcastJob)
+        .where(BroadcastJob.id == job_id, BroadcastJob.status == "running")
+        .values(status=status, error=error, updated_at=datetime.utcnow(), finished_at=datetime.utcnow())
+        .returning(BroadcastJob.id)
+    )
+    finished = result.scalar_one_or_none() is not None
+    await session.commit()
+    return finished
+
+
+async def requeue_running_broadcast_jobs(session: AsyncSession) -> int:
+    """Возвращает в очередь рассылки, прерванные перезапуском: они продолжатся с сохранённого курсора."""
+    result = await session.execute(
+        update(BroadcastJob)
+        .where(BroadcastJob.status == "running")
+        .values(status="pending", updated_at=datetime.utcnow())
+        .returning(BroadcastJob.id)
+    )
+    ids = result.scalars().all()
+    await session.commit()
+    return len(ids)
@@ -12,6 +12,7 @@ MAX_UPDATE_AGE_SEC = 28
 CONCURRENT_UPDATES_WAIT_TIMEOUT_SEC = 8
 CONCURRENT_UPDATES_GATE_LIMIT = 150
 CONCURRENT_UPDATES_GATE_WAIT_SEC = 2
+BULK_CHUNK_SIZE = 1000
 
 engine = create_async_engine(
     DATABASE_URL,
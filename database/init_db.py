@@ -1,13 +1,24 @@
+import asyncio
+
 from datetime import datetime
 
-from sqlalchemy import select
+from sqlalchemy import Index, select, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.schema import CreateIndex
 
 from config import ADMIN_ID
+from database.admins import load_admin_roles
 from database.db import async_session_maker, engine
 from database.models import Admin, Base, User
+from logger import logger
+
+
+_index_migration_task: asyncio.Task | None = None
 
 
 async def init_db():
+    global _index_migration_task
+
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
@@ -34,3 +45,53 @@ async def init_db():
                     )
                 )
         await session.commit()
+        await load_admin_roles(session)
+
+    if _index_migration_task is None or _index_migration_task.done():
+        _index_migration_task = asyncio.create_task(ensure_indexes())
+
+
+def _concurrent_index_ddl(index: Index, dialect) -> str:
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect))
+    return ddl.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+
+
+async def ensure_indexes() -> None:
+    """
+    Досоздаёт объявленные в моделях индексы, которых нет в существующей БД.
+    create_all не трогает уже созданные таблицы, поэтому индексы строятся здесь через
+    CREATE INDEX CONCURRENTLY — без блокировки записи, пока бот работает.
+    Невалидные индексы (после прерванной сборки) пересоздаются.
+    """
+    indexes = [index for table in Base.metadata.sorted_tables for index in table.indexes if index.name]
+
+    try:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            for index in sorted(indexes, key=lambda i: i.name):
+                is_valid = await conn.scalar(
+                    text(
+                        """
+                        SELECT i.indisvalid
+                        FROM pg_class c
+                        JOIN pg_index i ON i.indexrelid = c.oid
+                        WHERE c.relname = :name
+                        """
+                    ),
+                    {"name": index.name},
+                )
+                if is_valid:
+                    continue
+
+                if is_valid is False:
+                    logger.warning(f"[DB] Индекс {index.name} невалиден, пересоздаём")
+                    await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+
+                logger.info(f"[DB] Создание индекса {index.name} (CONCURRENTLY)...")
+                try:
+                    await conn.execute(text(_concurrent_index_ddl(index, conn.dialect)))
+                    logger.info(f"[DB] Индекс {index.name} создан")
+                except SQLAlchemyError as e:
+                    logger.error(f"[DB] Не удалось создать индекс {index.name}: {e}")
+    except SQLAlchemyError as e:
+        logger.error(f"[DB] Ошибка миграции индексов: {e}")
@@ -0,0 +1,121 @@
+from collections.abc import Callable, Iterable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from logger import logger
+
+
+_SESSION_KEY = "changed_tables"
+
+_listeners: list[tuple[frozenset[str], Callable[[], None]]] = []
+_remote_listeners: list[tuple[frozenset[str], Callable[[], None]]] = []
+_publishers: list[Callable[[set[str]], None]] = []
+
+
+def on_tables_committed(*tables: str):
+    """
+    Регистрирует синхронный колбэк, который вызывается после коммита любой сессии,
+    изменившей одну из перечисленных таблиц (ORM-объекты или insert/update/delete).
+    """
+    names = frozenset(tables)
+
+    def deco(func: Callable[[], None]) -> Callable[[], None]:
+        _listeners.append((names, func))
+        return func
+
+    return deco
+
+
+def on_tables_changed_elsewhere(*tables: str):
+    """
+    Как on_tables_committed, но колбэк вызывается только для изменений, пришедших из других процессов.
+    Нужен кешам, которые в своём процессе поддерживаются точечно и не должны сбрасываться на своих коммитах.
+    """
+    names = frozenset(tables)
+
+    def deco(func: Callable[[], None]) -> Callable[[], None]:
+        _remote_listeners.append((names, func))
+        return func
+
+    return deco
+
+
+def add_commit_publisher(func: Callable[[set[str]], None]) -> None:
+    """
+    Регистрирует синхронный колбэк, получающий набор изменённых таблиц после каждого коммита.
+    Используется для рассылки инвалидаций другим процессам.
+    """
+    _publishers.append(func)
+
+
+def fire_tables_changed(tables: Iterable[str]) -> None:
+    """Вызывает колбэки on_tables_committed и on_tables_changed_elsewhere для таблиц, изменённых вне этого процесса."""
+    changed = set(tables)
+    _notify(changed)
+    _notify(changed, _remote_listeners)
+
+
+def watched_tables() -> set[str]:
+    """Таблицы, на изменения которых подписан хотя бы один колбэк."""
+    return set().union(*(tables for tables, _ in _listeners + _remote_listeners))
+
+
+def session_changed_tables(session) -> set[str]:
+    """Таблицы, изменённые в текущей (ещё не закоммиченной) транзакции сессии."""
+    return set(session.info.get(_SESSION_KEY, ()))
+
+
+def mark_tables_changed(session: Session, *names: str) -> None:
+    """
+    Помечает в транзакции сессии изменёнными условные имена (не только таблицы): после коммита
+    по ним сработают колбэки и рассылка инвалидации другим процессам.
+    """
+    _mark(session, names)
+
+
+def _mark(session: Session, names: Iterable[str]) -> None:
+    names = {n for n in names if n}
+    if names:
+        session.info.setdefault(_SESSION_KEY, set()).update(names)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement(state) -> None:
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    table = getattr(state.statement, "table", None)
+    _mark(state.session, [getattr(table, "name", None)])
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session: Session, flush_context) -> None:
+    objects = list(session.new) + list(session.dirty) + list(session.deleted)
+    _mark(session, [getattr(getattr(obj, "__table__", None), "name", None) for obj in objects])
+
+
+@event.listens_for(Session, "after_commit")
+def _fire_listeners(session: Session) -> None:
+    changed = session.info.pop(_SESSION_KEY, None)
+    if not changed:
+        return
+    _notify(changed)
+    for publish in _publishers:
+        try:
+            publish(changed)
+        except Exception as e:
+            logger.error(f"[Invalidation] Ошибка публикации инвалидации: {e}")
+
+
+def _notify(changed: set[str], listeners: list[tuple[frozenset[str], Callable[[], None]]] = _listeners) -> None:
+    for tables, func in listeners:
+        if tables & changed:
+            try:
+                func()
+            except Exception as e:
+                logger.error(f"[Invalidation] Ошибка в {getattr(func, '__name__', func)}: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _reset_on_rollback(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
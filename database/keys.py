@@ -1,13 +1,134 @@
+import asyncio
+import time
+
 from datetime import datetime
 
-from sqlalchemy import delete, func, select, text, update
+from sqlalchemy import BigInteger, Integer, String, column, delete, event, func, inspect, select, text, update, values
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
+from database.db import BULK_CHUNK_SIZE
+from database.invalidation import mark_tables_changed, on_tables_changed_elsewhere, on_tables_committed
 from database.models import Key, User
 from logger import logger
 
 
+SERVER_KEY_COUNTS_RECONCILE_SEC = 60
+
+_PENDING_DELTAS = "server_key_count_deltas"
+_PENDING_RELOAD = "server_key_counts_reload"
+_TRACKED_OPTION = "server_key_counts_tracked"
+# Условное имя для шины инвалидации: ключи перенесены, созданы или удалены. Обычные правки ключей
+# (срок, трафик) его не выставляют и не сбрасывают счётчики в других процессах.
+SERVER_KEY_COUNTS_CHANGED = "server_key_counts"
+
+_server_key_counts: dict[str, int] = {}
+_server_key_counts_loaded_at: float | None = None
+_server_key_counts_lock = asyncio.Lock()
+
+
+def _server_key_counts_fresh() -> bool:
+    if _server_key_counts_loaded_at is None:
+        return False
+    return time.monotonic() - _server_key_counts_loaded_at < SERVER_KEY_COUNTS_RECONCILE_SEC
+
+
+@on_tables_committed("servers")
+@on_tables_changed_elsewhere(SERVER_KEY_COUNTS_CHANGED)
+def invalidate_server_key_counts() -> None:
+    """Помечает счётчики устаревшими: следующий запрос пересчитает их одним GROUP BY."""
+    global _server_key_counts_loaded_at
+    _server_key_counts_loaded_at = None
+
+
+async def get_server_key_counts(session: AsyncSession) -> dict[str, int]:
+    """
+    Количество ключей по server_id (имя сервера или кластера) для всех серверов сразу.
+    Счётчики поддерживаются в памяти по коммитам ключей и сверяются с БД
+    раз в SERVER_KEY_COUNTS_RECONCILE_SEC. Коммиты других процессов приходят через шину
+    инвалидации и сбрасывают счётчики целиком. Возвращаемый словарь менять нельзя.
+    """
+    global _server_key_counts, _server_key_counts_loaded_at
+
+    if _server_key_counts_fresh():
+        return _server_key_counts
+
+    async with _server_key_counts_lock:
+        if not _server_key_counts_fresh():
+            result = await session.execute(select(Key.server_id, func.count()).group_by(Key.server_id))
+            _server_key_counts = {server_id: count for server_id, count in result.all() if server_id}
+            _server_key_counts_loaded_at = time.monotonic()
+    return _server_key_counts
+
+
+async def get_server_key_count(session: AsyncSession, server_id: str) -> int:
+    counts = await get_server_key_counts(session)
+    return counts.get(server_id, 0)
+
+
+def _add_pending_delta(session: Session, server_id: str | None, delta: int) -> None:
+    if not server_id:
+        return
+    deltas = session.info.setdefault(_PENDING_DELTAS, {})
+    deltas[server_id] = deltas.get(server_id, 0) + delta
+    mark_tables_changed(session, SERVER_KEY_COUNTS_CHANGED)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_key_count_deltas(session: Session, flush_context) -> None:
+    for obj in session.new:
+        if isinstance(obj, Key):
+            _add_pending_delta(session, obj.server_id, 1)
+    for obj in session.deleted:
+        if isinstance(obj, Key):
+            _add_pending_delta(session, obj.server_id, -1)
+    for obj in session.dirty:
+        if isinstance(obj, Key):
+            history = inspect(obj).attrs.server_id.history
+            for old in history.deleted or ():
+                _add_pending_delta(session, old, -1)
+            for new in history.added or ():
+                _add_pending_delta(session, new, 1)
+
+
+def _sets_server_id(statement) -> bool:
+    values = list(getattr(statement, "_values", None) or ())
+    values += [col for col, _ in getattr(statement, "_ordered_values", None) or ()]
+    return any(getattr(col, "key", col) == "server_id" for col in values)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_bulk_key_changes(state) -> None:
+    # Массовый UPDATE, переносящий ключи на другой сервер, тоже сдвигает счётчики
+    if not (state.is_insert or state.is_delete or (state.is_update and _sets_server_id(state.statement))):
+        return
+    if state.execution_options.get(_TRACKED_OPTION):
+        return
+    table = getattr(state.statement, "table", None)
+    if getattr(table, "name", None) == Key.__tablename__:
+        state.session.info[_PENDING_RELOAD] = True
+        mark_tables_changed(state.session, SERVER_KEY_COUNTS_CHANGED)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_key_count_deltas(session: Session) -> None:
+    deltas = session.info.pop(_PENDING_DELTAS, None)
+    if session.info.pop(_PENDING_RELOAD, False):
+        invalidate_server_key_counts()
+        return
+    if not deltas or _server_key_counts_loaded_at is None:
+        return
+    for server_id, delta in deltas.items():
+        _server_key_counts[server_id] = max(0, _server_key_counts.get(server_id, 0) + delta)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_key_count_deltas(session: Session) -> None:
+    session.info.pop(_PENDING_DELTAS, None)
+    session.info.pop(_PENDING_RELOAD, None)
+
+
 async def store_key(
     session: AsyncSession,
     tg_id: int,
@@ -98,6 +219,31 @@ async def get_all_keys(session: AsyncSession):
     return result.scalars().all()
 
 
+async def stream_active_keys(
+    session: AsyncSession,
+    *,
+    expiry_before: int | None = None,
+    batch_size: int = BULK_CHUNK_SIZE,
+):
+    """
+    Отдаёт пачками незамороженные ключи вместе с балансом владельца (строки Key, balance).
+    Результат читается серверным курсором, поэтому в памяти одновременно не больше batch_size строк.
+    expiry_before ограничивает выборку ключами, истекающими не позже указанного момента (мс).
+    """
+    stmt = (
+        select(Key, User.balance)
+        .outerjoin(User, Key.tg_id == User.tg_id)
+        .where(Key.is_frozen.is_(False))
+        .execution_options(yield_per=batch_size)
+    )
+    if expiry_before is not None:
+        stmt = stmt.where(Key.expiry_time <= expiry_before)
+
+    result = await session.stream(stmt)
+    async for partition in result.partitions():
+        yield partition
+
+
 async def get_key_by_server(session: AsyncSession, tg_id: int, client_id: str):
     stmt = select(Key).where(Key.tg_id == tg_id, Key.client_id == client_id)
     result = await session.execute(stmt)
@@ -157,8 +303,15 @@ async def get_key_count(session: AsyncSession, tg_id: int) -> int:
 
 
 async def delete_key(session: AsyncSession, identifier: int | str, commit: bool = True):
-    stmt = delete(Key).where(Key.tg_id == identifier if str(identifier).isdigit() else Key.client_id == identifier)
-    await session.execute(stmt)
+    stmt = (
+        delete(Key)
+        .where(Key.tg_id == identifier if str(identifier).isdigit() else Key.client_id == identifier)
+        .returning(Key.server_id)
+        .execution_options(**{_TRACKED_OPTION: True})
+    )
+    result = await session.execute(stmt)
+    for server_id in result.scalars().all():
+        _add_pending_delta(session.sync_session, server_id, -1)
     if commit:
         await session.commit()
     logger.info(f"Ключ с идентификатором {identifier} удалён")
@@ -170,6 +323,42 @@ async def update_key_expiry(session: AsyncSession, client_id: str, new_expiry_ti
     logger.info(f"Срок действия ключа {client_id} обновлён до {new_expiry_time}")
 
 
+async def _bulk_update_key_column(session: AsyncSession, field: str, value_type, updates: dict[str, int]) -> None:
+    rows = list(updates.items())
+    for i in range(0, len(rows), BULK_CHUNK_SIZE):
+        batch = values(column("client_id", String), column("value", value_type), name="key_updates").data(
+            rows[i : i + BULK_CHUNK_SIZE]
+        )
+        await session.execute(
+            update(Key)
+            .where(Key.client_id == batch.c.client_id)
+            .values({field: batch.c.value})
+            .execution_options(synchronize_session=False)
+        )
+
+
+async def bulk_update_key_expiry(session: AsyncSession, updates: list[tuple[str, int]]) -> None:
+    """Обновляет сроки ключей одним UPDATE ... FROM (VALUES ...) на пачку. Без коммита."""
+    await _bulk_update_key_column(session, "expiry_time", BigInteger, dict(updates))
+
+
+async def bulk_update_key_tariff(session: AsyncSession, updates: list[tuple[str, int]]) -> None:
+    """Обновляет тарифы ключей одним UPDATE ... FROM (VALUES ...) на пачку. Без коммита."""
+    await _bulk_update_key_column(session, "tariff_id", Integer, dict(updates))
+
+
+async def bulk_update_keys(session: AsyncSession, client_ids: list[str], fields: dict) -> None:
+    """Проставляет одинаковые значения полей пачке ключей. Без коммита."""
+    ids = list(dict.fromkeys(client_ids))
+    for i in range(0, len(ids), BULK_CHUNK_SIZE):
+        await session.execute(
+            update(Key)
+            .where(Key.client_id.in_(ids[i : i + BULK_CHUNK_SIZE]))
+            .values(**fields)
+            .execution_options(synchronize_session=False)
+        )
+
+
 async def get_client_id_by_email(session: AsyncSession, email: str):
     result = await session.execute(select(Key.client_id).where(Key.email == email))
     return result.scalar_one_or_none()
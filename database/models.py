@@ -11,6 +11,7 @@ from sqlalchemy import (
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     Numeric,
     String,
@@ -85,6 +86,13 @@ class Key(DictLikeMixin, Base):
     current_device_limit = Column(Integer, nullable=True)
     current_traffic_limit = Column(BigInteger, nullable=True)
 
+    __table_args__ = (
+        Index("ix_keys_tg_id", "tg_id"),
+        Index("ix_keys_server_id", "server_id"),
+        Index("ix_keys_tariff_id", "tariff_id"),
+        Index("ix_keys_active_expiry_time", "expiry_time", postgresql_where=text("is_frozen IS FALSE")),
+    )
+
 
 class Tariff(DictLikeMixin, Base):
     __tablename__ = "tariffs"
@@ -173,6 +181,11 @@ class Payment(DictLikeMixin, Base):
     payment_id = Column(String(128), nullable=True, index=True)
     metadata_ = Column("metadata", JSONB, nullable=True)
 
+    __table_args__ = (
+        Index("ix_payments_tg_id", "tg_id"),
+        Index("ix_payments_status_created_at", "status", "created_at"),
+    )
+
 
 class Coupon(DictLikeMixin, Base):
     __tablename__ = "coupons"
@@ -206,6 +219,19 @@ class Referral(DictLikeMixin, Base):
     referrer_tg_id = Column(BigInteger, ForeignKey("users.tg_id", ondelete="CASCADE"), primary_key=True)
     reward_issued = Column(Boolean, default=False)
 
+    __table_args__ = (Index("ix_referrals_referrer_tg_id", "referrer_tg_id"),)
+
+
+class ReferralStat(DictLikeMixin, Base):
+    __tablename__ = "referral_stats"
+
+    referrer_tg_id = Column(BigInteger, ForeignKey("users.tg_id", ondelete="CASCADE"), primary_key=True)
+    total_referrals = Column(Integer, nullable=False, default=0)
+    active_referrals = Column(Integer, nullable=False, default=0)
+    referrals_by_level = Column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    total_referral_bonus = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
 
 class Notification(DictLikeMixin, Base):
     __tablename__ = "notifications"
@@ -214,6 +240,8 @@ class Notification(DictLikeMixin, Base):
     notification_type = Column(String, primary_key=True)
     last_notification_time = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (Index("ix_notifications_type_tg_id", "notification_type", "tg_id", "last_notification_time"),)
+
 
 class Gift(DictLikeMixin, Base):
     __tablename__ = "gifts"
@@ -262,6 +290,47 @@ class TemporaryData(DictLikeMixin, Base):
     updated_at = Column(DateTime, default=datetime.utcnow)
 
 
+class FsmState(DictLikeMixin, Base):
+    __tablename__ = "fsm_states"
+
+    key = Column(String, primary_key=True)
+    state = Column(String, nullable=True)
+    data = Column(JSONB, nullable=False, server_default=text("'{}'::jsonb"))
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (Index("ix_fsm_states_updated_at", "updated_at"),)
+
+
+class BroadcastJob(DictLikeMixin, Base):
+    __tablename__ = "broadcast_jobs"
+
+    id = Column(Integer, primary_key=True)
+    status = Column(String(16), nullable=False, default="pending")
+    send_to = Column(String, nullable=False, default="all")
+    cluster_name = Column(String, nullable=True)
+    text = Column(Text, nullable=False, default="")
+    photo = Column(String, nullable=True)
+    keyboard = Column(JSONB, nullable=True)
+    workers = Column(Integer, nullable=False, default=5)
+
+    cursor = Column(BigInteger, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    blocked = Column(Integer, nullable=False, default=0)
+    elapsed_sec = Column(Float, nullable=False, default=0.0)
+    error = Column(Text, nullable=True)
+
+    created_by = Column(BigInteger, nullable=True)
+    chat_id = Column(BigInteger, nullable=True)
+    message_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (Index("ix_broadcast_jobs_status", "status"),)
+
+
 class BlockedUser(DictLikeMixin, Base):
     __tablename__ = "blocked_users"
 
@@ -1,12 +1,13 @@
 from datetime import datetime, timedelta
 
-from sqlalchemy import and_, delete, func, select
+from sqlalchemy import and_, delete, func, select, tuple_
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import DISCOUNT_ACTIVE_HOURS
 from core.bootstrap import NOTIFICATIONS_CONFIG
+from database.db import BULK_CHUNK_SIZE
 from database.models import Key, Notification, User
 from logger import logger
 
@@ -45,6 +46,34 @@ async def delete_notification(session: AsyncSession, tg_id: int, notification_ty
     logger.debug(f"🗑 Уведомление {notification_type} для пользователя {tg_id} удалено")
 
 
+async def bulk_add_notifications(session: AsyncSession, pairs: list[tuple[int, str]]) -> None:
+    """Пачечный upsert уведомлений (INSERT ... ON CONFLICT DO UPDATE). Без коммита."""
+    now = datetime.utcnow()
+    rows = [
+        {"tg_id": tg_id, "notification_type": notification_type, "last_notification_time": now}
+        for tg_id, notification_type in dict.fromkeys(pairs)
+    ]
+    for i in range(0, len(rows), BULK_CHUNK_SIZE):
+        stmt = insert(Notification).values(rows[i : i + BULK_CHUNK_SIZE])
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[Notification.tg_id, Notification.notification_type],
+                set_={"last_notification_time": stmt.excluded.last_notification_time},
+            )
+        )
+
+
+async def bulk_delete_notifications(session: AsyncSession, pairs: list[tuple[int, str]]) -> None:
+    """Пачечное удаление уведомлений по парам (tg_id, notification_type). Без коммита."""
+    rows = list(dict.fromkeys(pairs))
+    for i in range(0, len(rows), BULK_CHUNK_SIZE):
+        await session.execute(
+            delete(Notification)
+            .where(tuple_(Notification.tg_id, Notification.notification_type).in_(rows[i : i + BULK_CHUNK_SIZE]))
+            .execution_options(synchronize_session=False)
+        )
+
+
 async def check_notification_time(session: AsyncSession, tg_id: int, notification_type: str, hours: int = 12) -> bool:
     stmt = select(Notification.last_notification_time).where(
         Notification.tg_id == tg_id, Notification.notification_type == notification_type
@@ -67,6 +96,23 @@ async def get_last_notification_time(session: AsyncSession, tg_id: int, notifica
     return None
 
 
+async def get_last_notification_times(
+    session: AsyncSession, pairs: list[tuple[int, str]]
+) -> dict[tuple[int, str], datetime]:
+    """Время последних уведомлений по парам (tg_id, notification_type) одним запросом на пачку."""
+    rows = list(dict.fromkeys(pairs))
+    last_times = {}
+    for i in range(0, len(rows), BULK_CHUNK_SIZE):
+        result = await session.execute(
+            select(Notification.tg_id, Notification.notification_type, Notification.last_notification_time).where(
+                tuple_(Notification.tg_id, Notification.notification_type).in_(rows[i : i + BULK_CHUNK_SIZE])
+            )
+        )
+        for tg_id, notification_type, last_time in result.all():
+            last_times[(tg_id, notification_type)] = last_time
+    return last_times
+
+
 async def check_hot_lead_discount(session: AsyncSession, tg_id: int) -> dict:
     try:
         result = await session.execute(
@@ -6,6 +6,7 @@ from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import Payment
+from database.referrals import REFERRAL_BONUS_EXCLUDED_SYSTEMS, record_referral_payment
 from logger import logger
 
 
@@ -43,6 +44,8 @@ async def add_payment(
         )
         result = await session.execute(stmt)
         internal_id = result.scalar_one()
+        if status == "success" and payment_system not in REFERRAL_BONUS_EXCLUDED_SYSTEMS:
+            await record_referral_payment(session, tg_id, amount)
         logger.info(
             f"Добавлен платёж id={internal_id}: tg_id={tg_id}, amount={amount}, system={payment_system}, status={status}"
         )
@@ -124,6 +127,7 @@ async def update_payment_status(
             logger.info(f"Не удалось сменить статус: платёж id={internal_id} не найден")
             return False
 
+        old_status = payment.status
         payment.status = new_status
         if payment_id is not None:
             payment.payment_id = payment_id
@@ -132,6 +136,13 @@ async def update_payment_status(
             base.update(metadata_patch)
             payment.metadata_ = base
 
+        if (
+            new_status == "success"
+            and old_status != "success"
+            and payment.payment_system not in REFERRAL_BONUS_EXCLUDED_SYSTEMS
+        ):
+            await record_referral_payment(session, payment.tg_id, payment.amount)
+
         await session.commit()
         logger.info(f"Статус платежа id={internal_id} изменён на {new_status}")
         return True
@@ -1,13 +1,26 @@
-from sqlalchemy import and_, desc, func, insert, select, text, update
+import asyncio
+import bisect
+import time
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import Select, and_, delete, desc, func, insert, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import CHECK_REFERRAL_REWARD_ISSUED, REFERRAL_BONUS_PERCENTAGES
 from core.bootstrap import BUTTONS_CONFIG
-from database.models import Referral
+from database.db import BULK_CHUNK_SIZE
+from database.invalidation import on_tables_committed
+from database.models import Payment, Referral, ReferralStat
 from logger import logger
 
 
+REFERRAL_STATS_TTL_SEC = 6 * 3600
+REFERRAL_BONUS_EXCLUDED_SYSTEMS = ("coupon", "admin", "referral")
+
+
 async def add_referral(session: AsyncSession, referred_tg_id: int, referrer_tg_id: int):
     try:
         if referred_tg_id == referrer_tg_id:
@@ -16,6 +29,7 @@ async def add_referral(session: AsyncSession, referred_tg_id: int, referrer_tg_i
 
         stmt = insert(Referral).values(referred_tg_id=referred_tg_id, referrer_tg_id=referrer_tg_id)
         await session.execute(stmt)
+        await _update_referral_stats(session, referred_tg_id, total=1)
         await session.commit()
         logger.info(f"✅ Добавлена реферальная связь: {referred_tg_id} → {referrer_tg_id}")
     except SQLAlchemyError as e:
@@ -44,7 +58,7 @@ async def get_active_referrals(session: AsyncSession, referrer_tg_id: int) -> in
         .where(
             and_(
                 Referral.referrer_tg_id == referrer_tg_id,
-                Referral.reward_issued is True,
+                Referral.reward_issued.is_(True),
             )
         )
     )
@@ -53,16 +67,33 @@ async def get_active_referrals(session: AsyncSession, referrer_tg_id: int) -> in
 
 
 async def mark_referral_reward_issued(session: AsyncSession, referred_tg_id: int):
-    await session.execute(update(Referral).where(Referral.referred_tg_id == referred_tg_id).values(reward_issued=True))
+    result = await session.execute(
+        update(Referral)
+        .where(Referral.referred_tg_id == referred_tg_id, Referral.reward_issued.is_not(True))
+        .values(reward_issued=True)
+        .returning(Referral.referrer_tg_id)
+    )
+    if result.first() is not None:
+        await _update_referral_stats(session, referred_tg_id, active=1)
+        if CHECK_REFERRAL_REWARD_ISSUED:
+            # Связь стала выданной: реферерам выше теперь засчитываются первые платежи всего
+            # выданного поддерева реферала, а не только его собственный — пересчитываем их целиком
+            await _refresh_issued_ancestors(session, referred_tg_id)
     await session.commit()
 
 
+def _referral_program_enabled() -> bool:
+    return bool(BUTTONS_CONFIG.get("REFERRAL_BUTTON_ENABLED", True))
+
+
 async def get_total_referral_bonus(session: AsyncSession, referrer_tg_id: int, max_levels: int) -> float:
-    referral_enabled = bool(BUTTONS_CONFIG.get("REFERRAL_BUTTON_ENABLED", True))
-    if not referral_enabled:
+    if not _referral_program_enabled():
         logger.debug("Реферальная программа отключена, бонусы не начисляются")
         return 0.0
+    return await _calculate_referral_bonus(session, referrer_tg_id, max_levels)
+
 
+async def _calculate_referral_bonus(session: AsyncSession, referrer_tg_id: int, max_levels: int) -> float:
     if CHECK_REFERRAL_REWARD_ISSUED:
         bonus_cte = """
             WITH RECURSIVE
@@ -89,6 +120,7 @@ async def get_total_referral_bonus(session: AsyncSession, referrer_tg_id: int, m
                 FROM payments
                 WHERE status = 'success' 
                   AND payment_system NOT IN ('coupon', 'admin', 'referral')
+                  AND tg_id IN (SELECT referred_tg_id FROM referral_levels)
                 ORDER BY tg_id, created_at
             )
         """
@@ -205,22 +237,206 @@ async def get_referrals_by_level(session: AsyncSession, referrer_tg_id: int, max
     }
 
 
+async def _compute_referral_stats(session: AsyncSession, referrer_tg_id: int) -> dict:
+    max_levels = len(REFERRAL_BONUS_PERCENTAGES)
+    return {
+        "total_referrals": await get_total_referrals(session, referrer_tg_id),
+        "active_referrals": await get_active_referrals(session, referrer_tg_id),
+        "referrals_by_level": await get_referrals_by_level(session, referrer_tg_id, max_levels),
+        "total_referral_bonus": await _calculate_referral_bonus(session, referrer_tg_id, max_levels),
+    }
+
+
+async def refresh_referral_stats(session: AsyncSession, referrer_ids: list[int]) -> dict[int, dict]:
+    """Пересчитывает и сохраняет агрегаты referral_stats для указанных рефереров. Без коммита."""
+    computed = {}
+    now = datetime.utcnow()
+    for referrer_tg_id in dict.fromkeys(referrer_ids):
+        stats = await _compute_referral_stats(session, referrer_tg_id)
+        stmt = pg_insert(ReferralStat).values(
+            referrer_tg_id=referrer_tg_id,
+            total_referrals=stats["total_referrals"],
+            active_referrals=stats["active_referrals"],
+            referrals_by_level={str(level): value for level, value in stats["referrals_by_level"].items()},
+            total_referral_bonus=stats["total_referral_bonus"],
+            updated_at=now,
+        )
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ReferralStat.referrer_tg_id],
+                set_={
+                    "total_referrals": stmt.excluded.total_referrals,
+                    "active_referrals": stmt.excluded.active_referrals,
+                    "referrals_by_level": stmt.excluded.referrals_by_level,
+                    "total_referral_bonus": stmt.excluded.total_referral_bonus,
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            )
+        )
+        computed[referrer_tg_id] = stats
+    return computed
+
+
+async def get_referral_ancestors(
+    session: AsyncSession, referred_tg_id: int, max_levels: int, issued_only: bool = False
+) -> dict[int, int]:
+    """
+    Рефереры пользователя до max_levels уровней — чьи агрегаты зависят от него: {referrer_tg_id: уровень}.
+    issued_only — только по цепочке связей с выданной наградой (как в подсчёте бонуса с CHECK_REFERRAL_REWARD_ISSUED).
+    """
+    query = """
+        WITH RECURSIVE ancestors AS (
+            SELECT referrer_tg_id, 1 AS level
+            FROM referrals
+            WHERE referred_tg_id = :tg_id AND (NOT :issued_only OR reward_issued = TRUE)
+            UNION
+            SELECT r.referrer_tg_id, a.level + 1
+            FROM referrals r
+            JOIN ancestors a ON r.referred_tg_id = a.referrer_tg_id
+            WHERE a.level < :max_levels AND (NOT :issued_only OR r.reward_issued = TRUE)
+        )
+        SELECT referrer_tg_id, MIN(level) AS level FROM ancestors GROUP BY referrer_tg_id
+    """
+    result = await session.execute(
+        text(query),  # nosemgrep: python.sqlalchemy.security.audit.avoid-sqlalchemy-text.avoid-sqlalchemy-text
+        {"tg_id": referred_tg_id, "max_levels": max_levels, "issued_only": issued_only},
+    )
+    return {row.referrer_tg_id: row.level for row in result}
+
+
+def _level_bonus(level: int, amount: float) -> float:
+    percent = REFERRAL_BONUS_PERCENTAGES.get(level, 0)
+    return percent * amount if isinstance(percent, float) else percent
+
+
+async def _apply_referral_stats_delta(
+    session: AsyncSession, ancestors: dict[int, int], total: int, active: int, amount: float | None
+) -> None:
+    """
+    Сдвигает сохранённые агрегаты рефереров на изменение одного реферала. Строк, которых ещё нет,
+    не создаёт: они посчитаются целиком при первом чтении. updated_at не трогается, поэтому
+    раз в REFERRAL_STATS_TTL_SEC строка всё равно сверяется полным пересчётом.
+    """
+    result = await session.execute(
+        select(ReferralStat).where(ReferralStat.referrer_tg_id.in_(list(ancestors))).with_for_update()
+    )
+    for stat in result.scalars():
+        level = ancestors[stat.referrer_tg_id]
+        if total or active:
+            by_level = dict(stat.referrals_by_level or {})
+            entry = dict(by_level.get(str(level)) or {"total": 0, "active": 0})
+            entry["total"] += total
+            entry["active"] += active
+            by_level[str(level)] = entry
+            stat.referrals_by_level = by_level
+            if level == 1:
+                stat.total_referrals += total
+                stat.active_referrals += active
+        if amount is not None:
+            stat.total_referral_bonus = round(stat.total_referral_bonus + _level_bonus(level, amount), 2)
+
+
+async def _update_referral_stats(
+    session: AsyncSession,
+    tg_id: int,
+    total: int = 0,
+    active: int = 0,
+    amount: float | None = None,
+    issued_only: bool = False,
+) -> None:
+    """
+    Применяет к referral_stats рефереров пользователя изменение, вызванное им самим. Выполняется
+    в savepoint и без коммита: ошибка не откатывает основную операцию, запись сверится при чтении.
+    """
+    try:
+        async with session.begin_nested():
+            ancestors = await get_referral_ancestors(session, tg_id, len(REFERRAL_BONUS_PERCENTAGES), issued_only)
+            if ancestors:
+                await _apply_referral_stats_delta(session, ancestors, total, active, amount)
+    except SQLAlchemyError as e:
+        logger.error(f"[ReferralStats] Не удалось обновить агрегаты рефереров пользователя {tg_id}: {e}")
+
+
+async def _refresh_issued_ancestors(session: AsyncSession, tg_id: int) -> None:
+    """Полный пересчёт агрегатов рефереров по цепочке выданных наград. В savepoint и без коммита."""
+    try:
+        async with session.begin_nested():
+            ancestors = await get_referral_ancestors(session, tg_id, len(REFERRAL_BONUS_PERCENTAGES), issued_only=True)
+            if ancestors:
+                await refresh_referral_stats(session, list(ancestors))
+    except SQLAlchemyError as e:
+        logger.error(f"[ReferralStats] Не удалось пересчитать агрегаты рефереров пользователя {tg_id}: {e}")
+
+
+def _qualifying_payments() -> Select:
+    return select(Payment).where(
+        Payment.status == "success", Payment.payment_system.notin_(REFERRAL_BONUS_EXCLUDED_SYSTEMS)
+    )
+
+
+async def record_referral_payment(session: AsyncSession, tg_id: int, amount: float) -> None:
+    """
+    Учитывает успешный платёж пользователя (уже записанный в сессии) в бонусах его рефереров.
+    С CHECK_REFERRAL_REWARD_ISSUED бонус даёт только первый платёж, иначе — каждый.
+    """
+    if CHECK_REFERRAL_REWARD_ISSUED:
+        try:
+            result = await session.execute(
+                _qualifying_payments().with_only_columns(func.count()).where(Payment.tg_id == tg_id)
+            )
+        except SQLAlchemyError as e:
+            logger.error(f"[ReferralStats] Не удалось проверить платежи пользователя {tg_id}: {e}")
+            return
+        if result.scalar_one() > 1:
+            return
+    await _update_referral_stats(session, tg_id, amount=amount, issued_only=CHECK_REFERRAL_REWARD_ISSUED)
+
+
+async def rebuild_referral_stats(session: AsyncSession) -> int:
+    """Полный пересчёт referral_stats (после изменения REFERRAL_BONUS_PERCENTAGES или первичное заполнение)."""
+    result = await session.execute(select(Referral.referrer_tg_id).distinct())
+    referrer_ids = list(result.scalars().all())
+
+    await session.execute(delete(ReferralStat))
+    for i in range(0, len(referrer_ids), BULK_CHUNK_SIZE):
+        await refresh_referral_stats(session, referrer_ids[i : i + BULK_CHUNK_SIZE])
+        await session.commit()
+    await session.commit()
+
+    logger.info(f"[ReferralStats] Пересчитана статистика для {len(referrer_ids)} рефереров")
+    return len(referrer_ids)
+
+
 async def get_referral_stats(session: AsyncSession, referrer_tg_id: int):
     try:
         logger.info(f"[ReferralStats] Получение статистики для пользователя {referrer_tg_id}")
 
-        total_referrals = await get_total_referrals(session, referrer_tg_id)
-        active_referrals = await get_active_referrals(session, referrer_tg_id)
-        max_levels = len(REFERRAL_BONUS_PERCENTAGES)
-        referrals_by_level = await get_referrals_by_level(session, referrer_tg_id, max_levels)
-        total_referral_bonus = await get_total_referral_bonus(session, referrer_tg_id, max_levels)
-
-        return {
-            "total_referrals": total_referrals,
-            "active_referrals": active_referrals,
-            "referrals_by_level": referrals_by_level,
-            "total_referral_bonus": total_referral_bonus,
-        }
+        result = await session.execute(
+            select(
+                ReferralStat.total_referrals,
+                ReferralStat.active_referrals,
+                ReferralStat.referrals_by_level,
+                ReferralStat.total_referral_bonus,
+                ReferralStat.updated_at,
+            ).where(ReferralStat.referrer_tg_id == referrer_tg_id)
+        )
+        row = result.first()
+
+        if row is None or datetime.utcnow() - row.updated_at > timedelta(seconds=REFERRAL_STATS_TTL_SEC):
+            stats = (await refresh_referral_stats(session, [referrer_tg_id]))[referrer_tg_id]
+        else:
+            stats = {
+                "total_referrals": row.total_referrals,
+                "active_referrals": row.active_referrals,
+                "referrals_by_level": dict(
+                    sorted((int(level), value) for level, value in (row.referrals_by_level or {}).items())
+                ),
+                "total_referral_bonus": row.total_referral_bonus,
+            }
+
+        if not _referral_program_enabled():
+            stats["total_referral_bonus"] = 0.0
+        return stats
 
     except Exception as e:
         logger.error(f"[ReferralStats] Ошибка при получении статистики для пользователя {referrer_tg_id}: {e}")
@@ -233,25 +449,74 @@ async def get_user_referral_count(session: AsyncSession, tg_id: int) -> int:
     return result.scalar_one() or 0
 
 
+class ReferralLeaderboard:
+    """
+    Неизменяемый снимок рейтинга рефереров: отсортированные счётчики приглашённых
+    для поиска места бинарным поиском и готовый топ.
+    """
+
+    __slots__ = ("version", "loaded_at", "top", "_counts")
+
+    def __init__(self, version: int, rows: list[tuple[int, int]]) -> None:
+        ranked = sorted(rows, key=lambda row: (-row[1], row[0]))
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.top = tuple(
+            {"referrer_tg_id": tg_id, "referral_count": count}
+            for tg_id, count in ranked[:REFERRAL_LEADERBOARD_TOP_SIZE]
+        )
+        self._counts = [count for _, count in reversed(ranked)]
+
+    def position(self, referral_count: int) -> int:
+        """Место пользователя с referral_count приглашёнными: 1 + число рефереров, у которых их больше."""
+        return len(self._counts) - bisect.bisect_right(self._counts, referral_count) + 1
+
+
+REFERRAL_LEADERBOARD_TOP_SIZE = 100
+REFERRAL_LEADERBOARD_TTL_SEC = 600
+REFERRAL_LEADERBOARD_MIN_REBUILD_SEC = 30
+
+_leaderboard: ReferralLeaderboard | None = None
+_leaderboard_version = 0
+_leaderboard_lock = asyncio.Lock()
+
+
+@on_tables_committed("referrals")
+def invalidate_referral_leaderboard() -> None:
+    """Помечает рейтинг устаревшим; перестроится при следующем запросе, но не чаще раза в MIN_REBUILD."""
+    global _leaderboard_version
+    _leaderboard_version += 1
+
+
+def _leaderboard_fresh(leaderboard: ReferralLeaderboard | None) -> bool:
+    if leaderboard is None:
+        return False
+    age = time.monotonic() - leaderboard.loaded_at
+    if leaderboard.version != _leaderboard_version:
+        return age < REFERRAL_LEADERBOARD_MIN_REBUILD_SEC
+    return age < REFERRAL_LEADERBOARD_TTL_SEC
+
+
+async def get_referral_leaderboard(session: AsyncSession) -> ReferralLeaderboard:
+    global _leaderboard
+
+    if _leaderboard_fresh(_leaderboard):
+        return _leaderboard
+
+    async with _leaderboard_lock:
+        if _leaderboard_fresh(_leaderboard):
+            return _leaderboard
+        version = _leaderboard_version
+        result = await session.execute(select(Referral.referrer_tg_id, func.count()).group_by(Referral.referrer_tg_id))
+        _leaderboard = ReferralLeaderboard(version, [tuple(row) for row in result.all()])
+        return _leaderboard
+
+
 async def get_referral_position(session: AsyncSession, referral_count: int) -> int:
-    subq = (
-        select(Referral.referrer_tg_id)
-        .group_by(Referral.referrer_tg_id)
-        .having(func.count() > referral_count)
-        .subquery()
-    )
-    query = select(func.count()).select_from(subq)
-    result = await session.execute(query)
-    count = result.scalar() or 0
-    return count + 1
+    leaderboard = await get_referral_leaderboard(session)
+    return leaderboard.position(referral_count)
 
 
 async def get_top_referrals(session: AsyncSession, limit: int = 5):
-    query = (
-        select(Referral.referrer_tg_id, func.count().label("referral_count"))
-        .group_by(Referral.referrer_tg_id)
-        .order_by(desc("referral_count"))
-        .limit(limit)
-    )
-    result = await session.execute(query)
-    return [{"referrer_tg_id": row.referrer_tg_id, "referral_count": row.referral_count} for row in result.all()]
+    leaderboard = await get_referral_leaderboard(session)
+    return [dict(row) for row in leaderboard.top[:limit]]
@@ -1,7 +1,13 @@
+import asyncio
+import time
+
+from types import MappingProxyType
+
 from sqlalchemy import delete, func, insert, select, update
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from database.invalidation import on_tables_committed, session_changed_tables
 from database.models import Key, Server, ServerSpecialgroup, ServerSubgroup, Tariff
 from logger import logger
 
@@ -43,61 +49,260 @@ async def delete_server(session: AsyncSession, server_name: str):
         raise
 
 
-async def get_servers(session: AsyncSession, include_enabled: bool = False) -> dict:
-    from handlers.utils import ALLOWED_GROUP_CODES
+class ServerRouting:
+    """
+    Предвычисленные привязки серверов к тарифам, подгруппам (server_subgroups) и спецгруппам
+    (server_specialgroups) для выбора серверов при выдаче ключа. Не обращается к БД, поэтому
+    правила маршрутизации можно проверять отдельно от сессии.
+    """
+
+    __slots__ = ("allowed", "binding_counts", "bound", "special")
+
+    def __init__(self, servers: list[dict]) -> None:
+        allowed: dict[str, set] = {}
+        binding_counts: dict[str, int] = {}
+        bound = set()
+        special: dict[str, set] = {}
+
+        for data in servers:
+            titles = [str(tariff_id) for tariff_id in data["tariff_ids"]] + list(data["tariff_subgroups"])
+            for title in titles:
+                binding_counts[title] = binding_counts.get(title, 0) + 1
+                if data["enabled"]:
+                    allowed.setdefault(title, set()).add(data["server_name"])
+            if titles and data["enabled"]:
+                bound.add(data["server_name"])
+            for group_code in data["special_groups"]:
+                special.setdefault(group_code, set()).add(data["server_name"])
+
+        self.allowed = MappingProxyType({k: frozenset(v) for k, v in allowed.items()})
+        self.binding_counts = MappingProxyType(binding_counts)
+        self.bound = frozenset(bound)
+        self.special = MappingProxyType({k: frozenset(v) for k, v in special.items()})
+
+    def _pick(self, cluster: list, title: str) -> list:
+        allowed = self.allowed.get(title)
+        if not allowed:
+            return []
+        return [s for s in cluster if s.get("server_name") in allowed]
 
-    try:
-        stmt = select(Server)
-        result = await session.execute(stmt)
-        servers = result.scalars().all()
-
-        ids = [s.id for s in servers]
-        subs_map = {}
-        tariffs_map = {}
-        if ids:
-            r = await session.execute(
-                select(ServerSubgroup.server_id, ServerSubgroup.subgroup_title).where(ServerSubgroup.server_id.in_(ids))
-            )
-            for sid, sg in r.all():
-                if sg and sg.isdigit():
-                    tariffs_map.setdefault(sid, []).append(int(sg))
-                else:
-                    subs_map.setdefault(sid, []).append(sg)
-
-        groups_map = {}
-        if ids:
-            r2 = await session.execute(
-                select(ServerSpecialgroup.server_id, ServerSpecialgroup.group_code).where(
-                    ServerSpecialgroup.server_id.in_(ids)
-                )
-            )
-            for sid, gc in r2.all():
-                groups_map.setdefault(sid, []).append(gc)
+    def _has_bound(self, cluster: list) -> bool:
+        return any(s.get("server_name") in self.bound for s in cluster)
+
+    def by_tariff(self, cluster: list, tariff_id: int, cluster_id: str) -> list:
+        """
+        Серверы кластера, привязанные к тарифу. Если к тарифу не привязан ни один сервер
+        или в кластере нет привязок вовсе — весь кластер; если привязки есть, но не к этому тарифу — [].
+        """
+        if not any(s.get("server_name") for s in cluster):
+            return []
+
+        tariff_id_str = str(tariff_id)
+        allowed = self._pick(cluster, tariff_id_str)
+        if allowed:
+            return allowed
+
+        if not self.binding_counts.get(tariff_id_str):
+            logger.info(f"Для тарифа {tariff_id} нет привязок серверов. Используем весь кластер {cluster_id}.")
+            return cluster
+
+        if self._has_bound(cluster):
+            logger.warning(f"Нет серверов под тариф {tariff_id} в кластере {cluster_id}.")
+            return []
+
+        logger.info(f"В кластере {cluster_id} нет привязок тарифов. Используем весь кластер.")
+        return cluster
 
-        allowed = set(ALLOWED_GROUP_CODES)
+    def by_subgroup(self, cluster: list, target_subgroup: str, cluster_id: str, tariff_id: int | None = None) -> list:
+        """
+        Серверы кластера под подгруппу: сначала по привязке к tariff_id, затем к самой подгруппе.
+        Запасные варианты те же, что в by_tariff.
+        """
+        if not any(s.get("server_name") for s in cluster):
+            return []
+
+        if tariff_id:
+            allowed = self._pick(cluster, str(tariff_id))
+            if allowed:
+                logger.debug(f"Найдены серверы по tariff_id={tariff_id}: {[s['server_name'] for s in allowed]}")
+                return allowed
+
+        allowed = self._pick(cluster, target_subgroup)
+        if allowed:
+            return allowed
+
+        check_values = {target_subgroup}
+        if tariff_id:
+            check_values.add(str(tariff_id))
+
+        if not any(self.binding_counts.get(value) for value in check_values):
+            logger.info(f"Для подгруппы/тарифа нет привязок. Используем весь кластер {cluster_id}.")
+            return cluster
+
+        if self._has_bound(cluster):
+            logger.warning(f"Нет серверов под подгруппу {target_subgroup} в кластере {cluster_id}.")
+            return []
+
+        logger.info(f"В кластере {cluster_id} нет привязок. Используем весь кластер.")
+        return cluster
 
+    def by_special_group(self, servers: list, group_code: str | None) -> list:
+        """
+        Серверы со спецгруппой тарифа (trial, discounts и т.п.). Если спецгруппа не задана
+        или среди servers нет привязанных к ней — servers без изменений.
+        """
+        bound = self.special.get((group_code or "").lower())
+        if not bound:
+            return servers
+        return [s for s in servers if s.get("server_name") in bound] or servers
+
+
+class ServersTopology:
+    """
+    Неизменяемый снимок серверов и их привязок с готовыми индексами.
+    Записи серверов — read-only словари в формате get_servers.
+    """
+
+    __slots__ = ("version", "loaded_at", "clusters", "by_server_name", "by_panel_type", "by_tariff_id", "routing")
+
+    def __init__(self, version: int, servers: list[dict]) -> None:
+        clusters: dict[str, list] = {}
+        by_panel_type: dict[str, list] = {}
+        by_tariff_id: dict[int, list] = {}
+        by_server_name: dict[str, MappingProxyType] = {}
+
+        for data in servers:
+            entry = MappingProxyType(data)
+            clusters.setdefault(data["cluster_name"], []).append(entry)
+            by_server_name[data["server_name"]] = entry
+            by_panel_type.setdefault(data["panel_type"], []).append(entry)
+            for tariff_id in data["tariff_ids"]:
+                by_tariff_id.setdefault(tariff_id, []).append(entry)
+
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.clusters = MappingProxyType({k: tuple(v) for k, v in clusters.items()})
+        self.by_server_name = MappingProxyType(by_server_name)
+        self.by_panel_type = MappingProxyType({k: tuple(v) for k, v in by_panel_type.items()})
+        self.by_tariff_id = MappingProxyType({k: tuple(v) for k, v in by_tariff_id.items()})
+        self.routing = ServerRouting(servers)
+
+    def grouped(self, include_enabled: bool = False) -> dict[str, list[dict]]:
+        """Копия в формате get_servers: {кластер: [сервер, ...]}."""
         grouped = {}
-        for s in servers:
-            if not include_enabled and not s.enabled:
-                continue
-            cluster = s.cluster_name
-            special = sorted({g for g in groups_map.get(s.id, []) if g in allowed})
-            grouped.setdefault(cluster, []).append({
-                "server_name": s.server_name,
-                "api_url": s.api_url,
-                "subscription_url": s.subscription_url,
-                "inbound_id": s.inbound_id,
-                "panel_type": s.panel_type,
-                "enabled": s.enabled,
-                "max_keys": s.max_keys,
-                "tariff_group": s.tariff_group,
-                "tariff_subgroups": subs_map.get(s.id, []),
-                "tariff_ids": tariffs_map.get(s.id, []),
-                "special_groups": special,
-                "cluster_name": cluster,
-                "server_id": s.id,
-            })
+        for cluster, servers in self.clusters.items():
+            items = [
+                dict(
+                    s,
+                    tariff_subgroups=list(s["tariff_subgroups"]),
+                    tariff_ids=list(s["tariff_ids"]),
+                    special_groups=list(s["special_groups"]),
+                )
+                for s in servers
+                if include_enabled or s["enabled"]
+            ]
+            if items:
+                grouped[cluster] = items
         return grouped
+
+
+SERVERS_TOPOLOGY_TTL_SEC = 300
+TOPOLOGY_TABLES = ("servers", "server_subgroups", "server_specialgroups")
+
+_topology: ServersTopology | None = None
+_topology_version = 0
+_topology_lock = asyncio.Lock()
+
+
+@on_tables_committed(*TOPOLOGY_TABLES)
+def invalidate_servers_topology() -> None:
+    """Сбрасывает снимок топологии; следующий запрос перечитает его из БД."""
+    global _topology, _topology_version
+    _topology_version += 1
+    _topology = None
+
+
+async def _load_servers(session: AsyncSession) -> list[dict]:
+    from handlers.utils import ALLOWED_GROUP_CODES
+
+    result = await session.execute(select(Server).order_by(Server.id))
+    servers = result.scalars().all()
+
+    ids = [s.id for s in servers]
+    subs_map = {}
+    tariffs_map = {}
+    if ids:
+        r = await session.execute(
+            select(ServerSubgroup.server_id, ServerSubgroup.subgroup_title).where(ServerSubgroup.server_id.in_(ids))
+        )
+        for sid, sg in r.all():
+            if sg and sg.isdigit():
+                tariffs_map.setdefault(sid, []).append(int(sg))
+            else:
+                subs_map.setdefault(sid, []).append(sg)
+
+    groups_map = {}
+    if ids:
+        r2 = await session.execute(
+            select(ServerSpecialgroup.server_id, ServerSpecialgroup.group_code).where(
+                ServerSpecialgroup.server_id.in_(ids)
+            )
+        )
+        for sid, gc in r2.all():
+            groups_map.setdefault(sid, []).append(gc)
+
+    allowed = set(ALLOWED_GROUP_CODES)
+
+    return [
+        {
+            "server_name": s.server_name,
+            "api_url": s.api_url,
+            "subscription_url": s.subscription_url,
+            "inbound_id": s.inbound_id,
+            "panel_type": s.panel_type,
+            "enabled": s.enabled,
+            "max_keys": s.max_keys,
+            "tariff_group": s.tariff_group,
+            "tariff_subgroups": tuple(subs_map.get(s.id, [])),
+            "tariff_ids": tuple(tariffs_map.get(s.id, [])),
+            "special_groups": tuple(sorted({g for g in groups_map.get(s.id, []) if g in allowed})),
+            "cluster_name": s.cluster_name,
+            "server_id": s.id,
+        }
+        for s in servers
+    ]
+
+
+async def get_servers_topology(session: AsyncSession) -> ServersTopology:
+    """
+    Возвращает закешированный снимок топологии. Перестраивается после коммита изменений
+    servers/server_subgroups/server_specialgroups и раз в SERVERS_TOPOLOGY_TTL_SEC
+    (изменения из других процессов).
+    """
+    global _topology
+
+    if session_changed_tables(session) & set(TOPOLOGY_TABLES):
+        return ServersTopology(-1, await _load_servers(session))
+
+    topology = _topology
+    if topology and time.monotonic() - topology.loaded_at < SERVERS_TOPOLOGY_TTL_SEC:
+        return topology
+
+    async with _topology_lock:
+        topology = _topology
+        if topology and time.monotonic() - topology.loaded_at < SERVERS_TOPOLOGY_TTL_SEC:
+            return topology
+        version = _topology_version
+        topology = ServersTopology(version, await _load_servers(session))
+        if version == _topology_version:
+            _topology = topology
+        return topology
+
+
+async def get_servers(session: AsyncSession, include_enabled: bool = False) -> dict:
+    try:
+        topology = await get_servers_topology(session)
+        return topology.grouped(include_enabled=include_enabled)
     except SQLAlchemyError as e:
         logger.error(f"Ошибка при получении серверов: {e}")
         await session.rollback()
@@ -288,119 +493,19 @@ async def filter_cluster_by_subgroup(
     cluster_id: str,
     tariff_id: int | None = None,
 ) -> list:
-    names = [s.get("server_name") for s in cluster if s.get("server_name")]
-    if not names:
-        return []
-
-    if tariff_id:
-        tariff_id_str = str(tariff_id)
-        q_by_tariff = await session.execute(
-            select(Server.server_name)
-            .join(ServerSubgroup, ServerSubgroup.server_id == Server.id)
-            .where(
-                Server.server_name.in_(names),
-                Server.enabled.is_(True),
-                ServerSubgroup.subgroup_title == tariff_id_str,
-            )
-        )
-        allowed_by_tariff = {n for (n,) in q_by_tariff.all()}
-        if allowed_by_tariff:
-            logger.debug(f"Найдены серверы по tariff_id={tariff_id}: {allowed_by_tariff}")
-            return [s for s in cluster if s.get("server_name") in allowed_by_tariff]
-
-    q_allowed = await session.execute(
-        select(Server.server_name)
-        .join(ServerSubgroup, ServerSubgroup.server_id == Server.id)
-        .where(
-            Server.server_name.in_(names),
-            Server.enabled.is_(True),
-            ServerSubgroup.subgroup_title == target_subgroup,
-        )
-    )
-    allowed = {n for (n,) in q_allowed.all()}
-    if allowed:
-        return [s for s in cluster if s.get("server_name") in allowed]
-
-    check_values = [target_subgroup]
-    if tariff_id:
-        check_values.append(str(tariff_id))
-
-    total_bindings = await session.scalar(
-        select(func.count()).select_from(ServerSubgroup).where(ServerSubgroup.subgroup_title.in_(check_values))
-    )
-    if not total_bindings:
-        logger.info(f"Для подгруппы/тарифа нет привязок. Используем весь кластер {cluster_id}.")
-        return cluster
-
-    q_any = await session.execute(
-        select(Server.server_name)
-        .join(ServerSubgroup, ServerSubgroup.server_id == Server.id)
-        .where(
-            Server.server_name.in_(names),
-            Server.enabled.is_(True),
-        )
-    )
-    any_bound = {n for (n,) in q_any.all()}
-    if any_bound:
-        logger.warning(f"Нет серверов под подгруппу {target_subgroup} в кластере {cluster_id}.")
-        return []
-
-    logger.info(f"В кластере {cluster_id} нет привязок. Используем весь кластер.")
-    return cluster
+    topology = await get_servers_topology(session)
+    return topology.routing.by_subgroup(cluster, target_subgroup, cluster_id, tariff_id=tariff_id)
 
 
 async def filter_cluster_by_tariff(session: AsyncSession, cluster: list, tariff_id: int, cluster_id: str) -> list:
-    names = [s.get("server_name") for s in cluster if s.get("server_name")]
-    if not names:
-        return []
-
-    tariff_id_str = str(tariff_id)
-
-    q_allowed = await session.execute(
-        select(Server.server_name)
-        .join(ServerSubgroup, ServerSubgroup.server_id == Server.id)
-        .where(
-            Server.server_name.in_(names),
-            Server.enabled.is_(True),
-            ServerSubgroup.subgroup_title == tariff_id_str,
-        )
-    )
-    allowed = {n for (n,) in q_allowed.all()}
-    if allowed:
-        return [s for s in cluster if s.get("server_name") in allowed]
-
-    total_for_tariff = await session.scalar(
-        select(func.count()).select_from(ServerSubgroup).where(ServerSubgroup.subgroup_title == tariff_id_str)
-    )
-    if not total_for_tariff:
-        logger.info(f"Для тарифа {tariff_id} нет привязок серверов. Используем весь кластер {cluster_id}.")
-        return cluster
-
-    q_any = await session.execute(
-        select(Server.server_name)
-        .join(ServerSubgroup, ServerSubgroup.server_id == Server.id)
-        .where(
-            Server.server_name.in_(names),
-            Server.enabled.is_(True),
-        )
-    )
-    any_bound = {n for (n,) in q_any.all()}
-    if any_bound:
-        logger.warning(f"Нет серверов под тариф {tariff_id} в кластере {cluster_id}.")
-        return []
-
-    logger.info(f"В кластере {cluster_id} нет привязок тарифов. Используем весь кластер.")
-    return cluster
+    topology = await get_servers_topology(session)
+    return topology.routing.by_tariff(cluster, tariff_id, cluster_id)
 
 
 async def has_legacy_subgroup_bindings(session: AsyncSession, server_ids: list[int]) -> bool:
     if not server_ids:
         return False
 
-    result = await session.execute(
-        select(ServerSubgroup.subgroup_title).where(ServerSubgroup.server_id.in_(server_ids))
-    )
-    for (title,) in result.all():
-        if title and not title.isdigit():
-            return True
-    return False
+    ids = set(server_ids)
+    topology = await get_servers_topology(session)
+    return any(any(s["tariff_subgroups"]) for s in topology.by_server_name.values() if s["server_id"] in ids)
@@ -1,13 +1,19 @@
+import asyncio
+import copy
 import hashlib
+import time
 
 from collections import defaultdict
 from datetime import datetime
+from types import MappingProxyType
 
 from sqlalchemy import delete, func, insert, select, update
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import Server, Tariff
+from database.invalidation import on_tables_committed, session_changed_tables
+from database.models import Tariff
+from database.servers import ServersTopology, get_servers_topology
 from logger import logger
 
 
@@ -20,16 +26,90 @@ def create_subgroup_hash(subgroup_title: str, group_code: str) -> str:
     return hash_object.hexdigest()[:8]
 
 
+class TariffCatalog:
+    """
+    Неизменяемый снимок таблицы tariffs с готовыми индексами. Записи — read-only словари
+    колонок тарифа; наружу отдаются копии (tariff_copy), порядок — как ORDER BY sort_order, id.
+    """
+
+    __slots__ = ("version", "loaded_at", "ordered", "by_id", "by_group", "active_by_group", "by_subgroup")
+
+    def __init__(self, version: int, tariffs: list[dict]) -> None:
+        ordered = [
+            MappingProxyType(t)
+            for t in sorted(tariffs, key=lambda t: (t["sort_order"] is None, t["sort_order"] or 0, t["id"]))
+        ]
+        by_group: dict[str, list] = {}
+        by_subgroup: dict[tuple[str, str], list] = {}
+        for entry in ordered:
+            by_group.setdefault(entry["group_code"], []).append(entry)
+            if entry["subgroup_title"]:
+                by_subgroup.setdefault((entry["group_code"], entry["subgroup_title"]), []).append(entry)
+
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.ordered = tuple(ordered)
+        self.by_id = MappingProxyType({entry["id"]: entry for entry in ordered})
+        self.by_group = MappingProxyType({k: tuple(v) for k, v in by_group.items()})
+        self.active_by_group = MappingProxyType({k: tuple(e for e in v if e["is_active"]) for k, v in by_group.items()})
+        self.by_subgroup = MappingProxyType({k: tuple(v) for k, v in by_subgroup.items()})
+
+
+def tariff_copy(entry) -> dict:
+    """Изменяемая копия записи каталога (JSON-поля копируются глубоко)."""
+    return {k: copy.deepcopy(v) if isinstance(v, list | dict) else v for k, v in entry.items()}
+
+
+TARIFF_CATALOG_TTL_SEC = 300
+TARIFF_TABLES = ("tariffs",)
+
+_catalog: TariffCatalog | None = None
+_catalog_version = 0
+_catalog_lock = asyncio.Lock()
+
+
+@on_tables_committed(*TARIFF_TABLES)
+def invalidate_tariff_catalog() -> None:
+    """Сбрасывает каталог тарифов; следующий запрос перечитает его из БД."""
+    global _catalog, _catalog_version
+    _catalog_version += 1
+    _catalog = None
+
+
+async def _load_tariffs(session: AsyncSession) -> list[dict]:
+    result = await session.execute(select(*Tariff.__table__.columns))
+    return [dict(row) for row in result.mappings().all()]
+
+
+async def get_tariff_catalog(session: AsyncSession) -> TariffCatalog:
+    """
+    Возвращает закешированный каталог тарифов. Перестраивается после коммита изменений
+    tariffs (создание, правка, удаление, сортировка) и раз в TARIFF_CATALOG_TTL_SEC.
+    """
+    global _catalog
+
+    if session_changed_tables(session) & set(TARIFF_TABLES):
+        return TariffCatalog(-1, await _load_tariffs(session))
+
+    catalog = _catalog
+    if catalog and time.monotonic() - catalog.loaded_at < TARIFF_CATALOG_TTL_SEC:
+        return catalog
+
+    async with _catalog_lock:
+        catalog = _catalog
+        if catalog and time.monotonic() - catalog.loaded_at < TARIFF_CATALOG_TTL_SEC:
+            return catalog
+        version = _catalog_version
+        catalog = TariffCatalog(version, await _load_tariffs(session))
+        if version == _catalog_version:
+            _catalog = catalog
+        return catalog
+
+
 async def find_subgroup_by_hash(session: AsyncSession, subgroup_hash: str, group_code: str) -> str | None:
-    result = await session.execute(
-        select(Tariff.subgroup_title)
-        .where(Tariff.group_code == group_code, Tariff.subgroup_title.isnot(None))
-        .distinct()
-    )
-    subgroups = [row[0] for row in result.fetchall()]
-
-    for subgroup_title in subgroups:
-        if create_subgroup_hash(subgroup_title, group_code) == subgroup_hash:
+    catalog = await get_tariff_catalog(session)
+    for code, subgroup_title in catalog.by_subgroup:
+        if code == group_code and create_subgroup_hash(subgroup_title, group_code) == subgroup_hash:
             return subgroup_title
 
     return None
@@ -39,16 +119,16 @@ async def get_tariffs(
     session: AsyncSession, tariff_id: int = None, group_code: str = None, with_subgroup_weights: bool = False
 ):
     try:
+        catalog = await get_tariff_catalog(session)
         if tariff_id:
-            result = await session.execute(select(Tariff).where(Tariff.id == tariff_id))
+            entry = catalog.by_id.get(tariff_id)
+            entries = (entry,) if entry else ()
         elif group_code:
-            result = await session.execute(
-                select(Tariff).where(Tariff.group_code == group_code).order_by(Tariff.sort_order, Tariff.id)
-            )
+            entries = catalog.by_group.get(group_code, ())
         else:
-            result = await session.execute(select(Tariff).order_by(Tariff.sort_order, Tariff.id))
+            entries = catalog.ordered
 
-        tariffs = [dict(r.__dict__) for r in result.scalars().all()]
+        tariffs = [tariff_copy(entry) for entry in entries]
 
         if with_subgroup_weights and group_code:
             tariffs_without_order = [t for t in tariffs if t.get("sort_order") is None]
@@ -79,43 +159,58 @@ async def get_tariffs(
 
 async def get_tariff_by_id(session: AsyncSession, tariff_id: int):
     try:
-        result = await session.execute(select(Tariff).where(Tariff.id == tariff_id))
-        tariff = result.scalar_one_or_none()
-        return dict(tariff.__dict__) if tariff else None
+        catalog = await get_tariff_catalog(session)
+        entry = catalog.by_id.get(tariff_id)
+        return tariff_copy(entry) if entry else None
     except SQLAlchemyError as e:
         logger.error(f"[TARIFF] Ошибка при получении тарифа по ID {tariff_id}: {e}")
         await session.rollback()
         return None
 
 
+def _tariff_group_for(topology: ServersTopology, name: str) -> str | None:
+    """tariff_group кластера (первого его сервера) или, если кластера нет, сервера с таким именем."""
+    servers = topology.clusters.get(name)
+    if servers:
+        return servers[0]["tariff_group"]
+    server = topology.by_server_name.get(name)
+    return server["tariff_group"] if server else None
+
+
 async def get_tariffs_for_cluster(session: AsyncSession, cluster_name: str):
     try:
-        server_row = await session.execute(
-            select(Server.tariff_group).where(Server.cluster_name == cluster_name).limit(1)
-        )
-        row = server_row.first()
-
-        if not row:
-            server_row = await session.execute(
-                select(Server.tariff_group).where(Server.server_name == cluster_name).limit(1)
-            )
-            row = server_row.first()
-
-        if not row or not row[0]:
+        topology = await get_servers_topology(session)
+        group_code = _tariff_group_for(topology, cluster_name)
+        if not group_code:
             return []
 
-        group_code = row[0]
-        result = await session.execute(
-            select(Tariff)
-            .where(Tariff.group_code == group_code, Tariff.is_active.is_(True))
-            .order_by(Tariff.sort_order, Tariff.id)
-        )
-        return [dict(r.__dict__) for r in result.scalars().all()]
+        catalog = await get_tariff_catalog(session)
+        return [tariff_copy(entry) for entry in catalog.active_by_group.get(group_code, ())]
     except SQLAlchemyError as e:
         logger.error(f"[TARIFF] Ошибка при получении тарифов для кластера {cluster_name}: {e}")
         return []
 
 
+async def get_tariffs_for_clusters(session: AsyncSession, cluster_names: list[str]) -> dict[str, list[dict]]:
+    """Пачечный вариант get_tariffs_for_cluster: {имя кластера или сервера: активные тарифы его группы}."""
+    names = set(cluster_names)
+    if not names:
+        return {}
+
+    try:
+        topology = await get_servers_topology(session)
+        catalog = await get_tariff_catalog(session)
+        result = {}
+        for name in names:
+            group_code = _tariff_group_for(topology, name)
+            entries = catalog.active_by_group.get(group_code, ()) if group_code else ()
+            result[name] = [tariff_copy(entry) for entry in entries]
+        return result
+    except SQLAlchemyError as e:
+        logger.error(f"[TARIFF] Ошибка при получении тарифов для кластеров: {e}")
+        return {}
+
+
 async def create_tariff(session: AsyncSession, data: dict):
     try:
         data["created_at"] = datetime.utcnow()
@@ -173,9 +268,9 @@ async def delete_tariff(session: AsyncSession, tariff_id: int):
 
 async def check_tariff_exists(session: AsyncSession, tariff_id: int):
     try:
-        result = await session.execute(select(Tariff).where(Tariff.id == tariff_id, Tariff.is_active.is_(True)))
-        tariff = result.scalar_one_or_none()
-        if tariff:
+        catalog = await get_tariff_catalog(session)
+        entry = catalog.by_id.get(tariff_id)
+        if entry and entry["is_active"]:
             return True
         logger.warning(f"[TARIFF] Тариф {tariff_id} не найден в БД")
         return False
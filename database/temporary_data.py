@@ -5,7 +5,8 @@ from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database.models import TemporaryData
+from database.db import BULK_CHUNK_SIZE
+from database.models import FsmState, TemporaryData
 from logger import logger
 
 
@@ -41,3 +42,44 @@ async def clear_temporary_data(session: AsyncSession, tg_id: int):
     await session.execute(delete(TemporaryData).where(TemporaryData.tg_id == tg_id))
     await session.commit()
     logger.info(f"🗑 Временные данные очищены для {tg_id}")
+
+
+async def get_fsm_record(session: AsyncSession, key: str) -> tuple[str | None, dict] | None:
+    """Состояние и данные FSM по ключу хранилища или None, если записи нет."""
+    result = await session.execute(select(FsmState.state, FsmState.data).where(FsmState.key == key))
+    row = result.first()
+    if row is None:
+        return None
+    return row.state, dict(row.data or {})
+
+
+async def save_fsm_records(session: AsyncSession, records: dict[str, tuple[str | None, dict]]) -> None:
+    """
+    Пачечная запись состояний FSM: пустые (без состояния и данных) удаляются,
+    остальные — upsert. Без коммита.
+    """
+    now = datetime.utcnow()
+    empty = [key for key, (state, data) in records.items() if state is None and not data]
+    rows = [
+        {"key": key, "state": state, "data": data, "updated_at": now}
+        for key, (state, data) in records.items()
+        if state is not None or data
+    ]
+
+    for i in range(0, len(empty), BULK_CHUNK_SIZE):
+        await session.execute(delete(FsmState).where(FsmState.key.in_(empty[i : i + BULK_CHUNK_SIZE])))
+
+    for i in range(0, len(rows), BULK_CHUNK_SIZE):
+        stmt = insert(FsmState).values(rows[i : i + BULK_CHUNK_SIZE])
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[FsmState.key],
+                set_={"state": stmt.excluded.state, "data": stmt.excluded.data, "updated_at": stmt.excluded.updated_at},
+            )
+        )
+
+
+async def delete_expired_fsm_records(session: AsyncSession, older_than: datetime) -> int:
+    """Удаляет состояния FSM, не обновлявшиеся с older_than. Без коммита."""
+    result = await session.execute(delete(FsmState).where(FsmState.updated_at < older_than))
+    return result.rowcount or 0
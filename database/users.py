@@ -1,10 +1,11 @@
 from datetime import datetime
 
-from sqlalchemy import delete, exists, func, or_, select, update
+from sqlalchemy import BigInteger, Float, column, delete, exists, func, or_, select, update, values
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from database.db import BULK_CHUNK_SIZE
 from database.keys import delete_key
 from database.models import (
     BlockedUser,
@@ -87,6 +88,21 @@ async def update_balance(session: AsyncSession, tg_id: int, amount: float) -> No
         await session.rollback()
 
 
+async def bulk_update_balances(session: AsyncSession, changes: dict[int, float]) -> None:
+    """Применяет изменения балансов пачками через UPDATE ... FROM (VALUES ...). Без коммита."""
+    rows = [(tg_id, float(change)) for tg_id, change in changes.items() if change]
+    for i in range(0, len(rows), BULK_CHUNK_SIZE):
+        batch = values(column("tg_id", BigInteger), column("change", Float), name="balance_changes").data(
+            rows[i : i + BULK_CHUNK_SIZE]
+        )
+        await session.execute(
+            update(User)
+            .where(User.tg_id == batch.c.tg_id)
+            .values(balance=func.coalesce(User.balance, 0) + batch.c.change)
+            .execution_options(synchronize_session=False)
+        )
+
+
 async def check_user_exists(session: AsyncSession, tg_id: int) -> bool:
     stmt = select(exists().where(User.tg_id == tg_id))
     result = await session.execute(stmt)
@@ -99,6 +115,18 @@ async def get_balance(session: AsyncSession, tg_id: int) -> float:
     return round(float(balance or 0.0), 1)
 
 
+async def get_balances(session: AsyncSession, tg_ids: list[int]) -> dict[int, float]:
+    """Балансы пачки пользователей: {tg_id: баланс}."""
+    ids = list(set(tg_ids))
+    balances = {}
+    for i in range(0, len(ids), BULK_CHUNK_SIZE):
+        result = await session.execute(
+            select(User.tg_id, func.coalesce(User.balance, 0.0)).where(User.tg_id.in_(ids[i : i + BULK_CHUNK_SIZE]))
+        )
+        balances.update({tg_id: round(float(balance), 1) for tg_id, balance in result.all()})
+    return balances
+
+
 async def set_user_balance(session: AsyncSession, tg_id: int, balance: float) -> None:
     try:
         await session.execute(update(User).where(User.tg_id == tg_id).values(balance=balance))
@@ -1,28 +1,20 @@
-import time
-
 from aiogram.filters import BaseFilter
 from aiogram.types import CallbackQuery, Message
-from sqlalchemy import select
 
-from config import ADMIN_ID
+from database.admins import admin_roles_stale, ensure_admin_roles, is_admin_cached, is_superadmin_cached
 from database.db import async_session_maker
-from database.models import Admin
-
-
-_ADMIN_CACHE: dict[int, tuple[float, bool, bool]] = {}
-_ADMIN_CACHE_TTL = 60
-
-
-def _get_cached_admin(user_id: int) -> tuple[bool, bool] | None:
-    now = time.time()
-    entry = _ADMIN_CACHE.get(user_id)
-    if entry and entry[0] > now:
-        return entry[1], entry[2]
-    return None
+from logger import logger
 
 
-def _set_cached_admin(user_id: int, is_admin: bool, is_superadmin: bool) -> None:
-    _ADMIN_CACHE[user_id] = (time.time() + _ADMIN_CACHE_TTL, is_admin, is_superadmin)
+async def _refresh_admin_roles() -> None:
+    """Сверка снимка админов с БД; при ошибке фильтр работает по последнему снимку."""
+    if not admin_roles_stale():
+        return
+    try:
+        async with async_session_maker() as session:
+            await ensure_admin_roles(session)
+    except Exception as e:
+        logger.warning(f"[Admins] Не удалось сверить список админов с БД: {e}")
 
 
 class IsAdminFilter(BaseFilter):
@@ -30,21 +22,8 @@ class IsAdminFilter(BaseFilter):
         if not event.from_user:
             return False
 
-        user_id = event.from_user.id
-        cached = _get_cached_admin(user_id)
-        if cached is not None:
-            return cached[0]
-
-        try:
-            async with async_session_maker() as session:
-                admin = (await session.execute(select(Admin).where(Admin.tg_id == user_id))).scalar_one_or_none()
-                admin_ids = (ADMIN_ID,) if isinstance(ADMIN_ID, int) else ADMIN_ID
-                is_admin = admin is not None or user_id in admin_ids
-                is_super = admin.role != "moderator" if admin else (user_id in admin_ids)
-                _set_cached_admin(user_id, is_admin, is_super)
-                return is_admin
-        except (Exception,):
-            return False
+        await _refresh_admin_roles()
+        return is_admin_cached(event.from_user.id)
 
 
 class IsSuperAdminFilter(BaseFilter):
@@ -52,19 +31,5 @@ class IsSuperAdminFilter(BaseFilter):
         if not event.from_user:
             return False
 
-        user_id = event.from_user.id
-        cached = _get_cached_admin(user_id)
-        if cached is not None:
-            return cached[1]
-
-        try:
-            async with async_session_maker() as session:
-                admin = (await session.execute(select(Admin).where(Admin.tg_id == user_id))).scalar_one_or_none()
-                if not admin:
-                    _set_cached_admin(user_id, False, False)
-                    return False
-                is_super = admin.role != "moderator"
-                _set_cached_admin(user_id, True, is_super)
-                return is_super
-        except (Exception,):
-            return False
+        await _refresh_admin_roles()
+        return is_admin_cached(event.from_user.id) and is_superadmin_cached(event.from_user.id)
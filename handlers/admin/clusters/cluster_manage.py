@@ -171,9 +171,9 @@ async def handle_days_input(message: Message, state: FSMContext, session: AsyncS
                 await state.clear()
                 return
 
-            from panels.remnawave import RemnawaveAPI
+            from panels.remnawave_pool import get_remnawave_api
 
-            remna = RemnawaveAPI(api_url)
+            remna = get_remnawave_api(api_url)
 
             try:
                 result_bulk = await remna.bulk_extend_expiration_date(uuids, days)
@@ -5,19 +5,16 @@ from typing import Any
 
 from aiogram import F, types
 from aiogram.types import CallbackQuery
-from py3xui import AsyncApi
 from sqlalchemy import delete, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import (
-    ADMIN_PASSWORD,
-    ADMIN_USERNAME,
     REMNAWAVE_LOGIN,
     REMNAWAVE_PASSWORD,
     USE_COUNTRY_SELECTION,
 )
 from core.bootstrap import MODES_CONFIG
-from database import get_servers
+from database import get_servers, get_servers_topology
 from database.models import Key, Server, Tariff
 from filters.admin import IsAdminFilter
 from handlers.keys.operations import (
@@ -28,7 +25,8 @@ from handlers.keys.operations import (
 from handlers.keys.operations.aggregated_links import make_aggregated_link
 from handlers.utils import ALLOWED_GROUP_CODES
 from logger import logger
-from panels.remnawave import RemnawaveAPI
+from panels._3xui import get_xui_instance
+from panels.remnawave_pool import get_remnawave_api
 from utils.backup import create_backup_and_send_to_admins
 
 from ..panel.keyboard import build_admin_back_kb
@@ -67,21 +65,11 @@ async def handle_cluster_availability(
 
         try:
             if panel_type == "3x-ui":
-                xui = AsyncApi(
-                    server["api_url"],
-                    username=ADMIN_USERNAME,
-                    password=ADMIN_PASSWORD,
-                    logger=None,
-                )
-                await xui.login()
+                xui = await get_xui_instance(server["api_url"])
                 inbound_id = int(server["inbound_id"])
                 online_clients = await xui.client.online()
-                online_inbound_users = 0
-
-                for client_email in online_clients:
-                    client = await xui.client.get_by_email(client_email)
-                    if client and client.inbound_id == inbound_id:
-                        online_inbound_users += 1
+                clients = await asyncio.gather(*(xui.client.get_by_email(email) for email in online_clients))
+                online_inbound_users = sum(1 for client in clients if client and client.inbound_id == inbound_id)
 
                 total_online_users += online_inbound_users
                 result_text += f"🌍 <b>{prefix} {server_name}</b> - {online_inbound_users} онлайн\n"
@@ -91,7 +79,7 @@ async def handle_cluster_availability(
                 if not server_inbound_id:
                     raise Exception("Не указан inbound_id сервера")
 
-                remna = RemnawaveAPI(server["api_url"])
+                remna = get_remnawave_api(server["api_url"])
                 nodes_data = await remna.get_all_nodes_with_online(
                     username=REMNAWAVE_LOGIN,
                     password=REMNAWAVE_PASSWORD,
@@ -149,12 +137,7 @@ async def handle_clusters_backup(
         if server.get("panel_type") == "remnawave":
             continue
 
-        xui = AsyncApi(
-            server["api_url"],
-            username=ADMIN_USERNAME,
-            password=ADMIN_PASSWORD,
-            logger=logger,
-        )
+        xui = await get_xui_instance(server["api_url"])
         await create_backup_and_send_to_admins(xui)
 
     text = (
@@ -305,7 +288,7 @@ async def handle_sync_server(
                         datetime.utcfromtimestamp(key["expiry_time"] / 1000).replace(tzinfo=timezone.utc).isoformat()
                     )
 
-                    remna = RemnawaveAPI(key["api_url"])
+                    remna = get_remnawave_api(key["api_url"])
                     if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
                         logger.error(f"Не удалось авторизоваться в Remnawave для сервера {server_name}")
                         continue
@@ -433,8 +416,8 @@ async def handle_sync_cluster(
     cluster_name = callback_data.data
 
     try:
-        servers = await get_servers(session)
-        cluster_servers = servers.get(cluster_name, [])
+        topology = await get_servers_topology(session)
+        cluster_servers = topology.grouped().get(cluster_name, [])
 
         use_country_selection = bool(MODES_CONFIG.get("COUNTRY_SELECTION_ENABLED", USE_COUNTRY_SELECTION))
 
@@ -556,10 +539,10 @@ async def handle_sync_cluster(
                             if not user_server:
                                 return {"key": key, "success": False, "error": "Server not found"}
 
-                            remna = RemnawaveAPI(user_server["api_url"])
+                            remna = get_remnawave_api(user_server["api_url"])
                             inbound_ids = [user_server["inbound_id"]] if user_server.get("inbound_id") else []
                         else:
-                            remna = RemnawaveAPI(cluster_servers[0]["api_url"])
+                            remna = get_remnawave_api(cluster_servers[0]["api_url"])
 
                             filtered_servers = cluster_servers
                             if subgroup_title or (tariff and tariff.get("id")):
@@ -573,14 +556,10 @@ async def handle_sync_cluster(
                                 if not filtered_servers:
                                     filtered_servers = cluster_servers
 
-                            if tariff and tariff.get("group_code"):
-                                group_code = tariff.get("group_code").lower()
-                                if group_code in ALLOWED_GROUP_CODES:
-                                    special_filtered = [
-                                        s for s in filtered_servers if group_code in (s.get("special_groups") or [])
-                                    ]
-                                    if special_filtered:
-                                        filtered_servers = special_filtered
+                            if tariff:
+                                filtered_servers = topology.routing.by_special_group(
+                                    filtered_servers, tariff.get("group_code")
+                                )
 
                             inbound_ids = [s["inbound_id"] for s in filtered_servers if s.get("inbound_id")]
 
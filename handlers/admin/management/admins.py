@@ -9,6 +9,7 @@ from aiogram.types import CallbackQuery, Message
 from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from database.admins import drop_cached_admin, set_cached_admin_role
 from database.models import Admin
 from filters.admin import IsAdminFilter
 
@@ -56,6 +57,7 @@ async def save_new_admin(message: Message, session: AsyncSession, state: FSMCont
     else:
         session.add(Admin(tg_id=tg_id, role="moderator", description="Добавлен вручную"))
         await session.commit()
+        set_cached_admin_role(tg_id, "moderator")
         await message.answer(f"✅ Админ <code>{tg_id}</code> добавлен.", reply_markup=build_admin_back_kb_to_admins())
 
     await state.clear()
@@ -136,6 +138,7 @@ async def set_admin_role(callback: CallbackQuery, callback_data: AdminPanelCallb
 
     admin.role = role
     await session.commit()
+    set_cached_admin_role(tg_id, role)
 
     await callback.message.edit_text(
         f"✅ Роль админа <code>{tg_id}</code> изменена на <b>{role}</b>.", reply_markup=build_single_admin_menu(tg_id)
@@ -148,6 +151,7 @@ async def delete_admin(callback: CallbackQuery, callback_data: AdminPanelCallbac
 
     await session.execute(delete(Admin).where(Admin.tg_id == tg_id))
     await session.commit()
+    drop_cached_admin(tg_id)
 
     await callback.message.edit_text(
         f"🗑 Админ <code>{tg_id}</code> удалён.", reply_markup=build_admin_back_kb_to_admins()
@@ -9,8 +9,10 @@ from aiogram import Bot, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import CallbackQuery, Message
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import DB_NAME, DB_PASSWORD, DB_USER, PG_HOST, PG_PORT
+from database.referrals import rebuild_referral_stats
 from filters.admin import IsAdminFilter
 from logger import logger
 
@@ -164,6 +166,18 @@ async def handle_export_db(callback: CallbackQuery):
     )
 
 
+@router.callback_query(AdminPanelCallback.filter(F.action == "rebuild_referral_stats"), IsAdminFilter())
+async def handle_rebuild_referral_stats(callback: CallbackQuery, session: AsyncSession):
+    await callback.message.edit_text("⏳ Пересчитываем статистику рефералов...")
+    try:
+        referrers = await rebuild_referral_stats(session)
+        text = f"✅ Статистика рефералов пересчитана для {referrers} пользователей."
+    except Exception as e:
+        logger.error(f"[ReferralStats] Ошибка пересчёта статистики: {e}")
+        text = f"❌ Ошибка при пересчёте статистики рефералов: {e}"
+    await callback.message.edit_text(text, reply_markup=build_back_to_db_menu())
+
+
 @router.callback_query(AdminPanelCallback.filter(F.action == "back_to_db_menu"), IsAdminFilter())
 async def back_to_database_menu(callback: CallbackQuery):
     await callback.message.edit_text("📦 Управление базой данных:", reply_markup=build_database_kb())
@@ -15,7 +15,7 @@ from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD
 from database.models import Key, Server, User
 from filters.admin import IsAdminFilter
 from logger import logger
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_pool import get_remnawave_api
 
 from . import router
 from .keyboard import AdminPanelCallback, build_back_to_db_menu
@@ -69,7 +69,7 @@ async def show_remnawave_clients(callback: CallbackQuery, session: AsyncSession)
 
     server = servers[0]
 
-    api = RemnawaveAPI(base_url=server.api_url)
+    api = get_remnawave_api(base_url=server.api_url)
 
     users = await api.get_all_users_time(
         username=REMNAWAVE_LOGIN,
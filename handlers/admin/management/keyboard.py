@@ -68,6 +68,10 @@ def build_database_kb() -> InlineKeyboardMarkup:
         text="📤 Получить данные БД из панели",
         callback_data=AdminPanelCallback(action="export_db").pack(),
     )
+    builder.button(
+        text="📊 Пересчитать статистику рефералов",
+        callback_data=AdminPanelCallback(action="rebuild_referral_stats").pack(),
+    )
     builder.row(build_admin_back_btn())
     builder.adjust(1)
     return builder.as_markup()
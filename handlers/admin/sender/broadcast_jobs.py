@@ -0,0 +1,290 @@
+import asyncio
+import time
+
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.broadcasts import (
+    BROADCAST_ACTIVE_STATUSES,
+    claim_broadcast_job,
+    create_broadcast_job,
+    finish_broadcast_job,
+    get_broadcast_job,
+    requeue_running_broadcast_jobs,
+    save_broadcast_checkpoint,
+    set_broadcast_job_status,
+)
+from database.db import async_session_maker
+from logger import logger
+from utils.sharding import IS_SHARD_WORKER
+
+from .keyboard import build_broadcast_job_kb
+from .sender_service import BroadcastService
+from .sender_utils import count_recipients, get_recipients_page
+
+
+BROADCAST_PAGE_SIZE = 500
+BROADCAST_POLL_INTERVAL_SEC = 5.0
+BROADCAST_DB_RETRIES = 5
+BROADCAST_DB_RETRY_DELAY_SEC = 2.0
+
+BROADCAST_STATUS_LABELS = {
+    "pending": "⏳ В очереди",
+    "running": "📤 Отправляется",
+    "paused": "⏸ На паузе",
+    "completed": "✅ Завершена",
+    "cancelled": "🚫 Отменена",
+    "failed": "❌ Ошибка",
+}
+
+
+def format_duration(seconds: float) -> str:
+    minutes = int(seconds // 60)
+    secs = int(seconds % 60)
+    return f"{minutes} мин {secs} сек" if minutes > 0 else f"{secs} сек"
+
+
+def format_broadcast_job(job: dict) -> str:
+    processed = job["sent"] + job["failed"]
+    percent = min(100, processed * 100 // job["total"]) if job["total"] else 100
+    speed = job["sent"] / job["elapsed_sec"] if job["elapsed_sec"] else 0.0
+    text = (
+        f"📤 <b>Рассылка #{job['id']}</b> — {BROADCAST_STATUS_LABELS.get(job['status'], job['status'])}\n\n"
+        f"👥 <b>Количество получателей:</b> {job['total']}\n"
+        f"📈 <b>Прогресс:</b> {processed} ({percent}%)\n"
+        f"✅ <b>Доставлено:</b> {job['sent']}\n"
+        f"❌ <b>Не доставлено:</b> {job['failed']}\n"
+        f"🚫 <b>Заблокировавших бота:</b> {job['blocked']}\n\n"
+        f"⏱️ <b>Время отправки:</b> {format_duration(job['elapsed_sec'])}\n"
+        f"⚡ <b>Средняя скорость:</b> {speed:.1f} сообщений/сек"
+    )
+    if job.get("error"):
+        text += f"\n\n❗ {job['error']}"
+    return text
+
+
+async def enqueue_broadcast(
+    session: AsyncSession,
+    send_to: str,
+    cluster_name: str | None,
+    text: str,
+    photo: str | None = None,
+    keyboard: InlineKeyboardMarkup | None = None,
+    workers: int = 5,
+    created_by: int | None = None,
+    chat_id: int | None = None,
+    message_id: int | None = None,
+) -> dict | None:
+    """Ставит рассылку в очередь исполнителя. Возвращает задание или None, если получателей нет."""
+    total = await count_recipients(session, send_to, cluster_name)
+    if not total:
+        return None
+
+    job = await create_broadcast_job(
+        session,
+        send_to=send_to,
+        cluster_name=cluster_name,
+        text=text,
+        photo=photo,
+        keyboard=keyboard.model_dump() if keyboard else None,
+        workers=workers,
+        total=total,
+        created_by=created_by,
+        chat_id=chat_id,
+        message_id=message_id,
+    )
+    broadcast_runner.wake()
+    return job
+
+
+async def pause_broadcast(session: AsyncSession, job_id: int) -> bool:
+    return await set_broadcast_job_status(session, job_id, "paused", ("pending", "running"))
+
+
+async def resume_broadcast(session: AsyncSession, job_id: int) -> bool:
+    resumed = await set_broadcast_job_status(session, job_id, "pending", ("paused", "failed"))
+    if resumed:
+        broadcast_runner.wake()
+    return resumed
+
+
+async def cancel_broadcast(session: AsyncSession, job_id: int) -> bool:
+    return await set_broadcast_job_status(session, job_id, "cancelled", BROADCAST_ACTIVE_STATUSES)
+
+
+class BroadcastJobRunner:
+    """
+    Фоновый исполнитель рассылок из broadcast_jobs. Берёт задания по одному, читает получателей
+    страницами по tg_id и после каждой страницы сохраняет курсор и счётчики. Пауза и отмена — это
+    смена статуса в БД (из любого процесса), исполнитель замечает её на ближайшей контрольной точке.
+    После перезапуска прерванные рассылки продолжаются с сохранённого курсора.
+    """
+
+    def __init__(
+        self, page_size: int = BROADCAST_PAGE_SIZE, poll_interval: float = BROADCAST_POLL_INTERVAL_SEC
+    ) -> None:
+        self.page_size = page_size
+        self.poll_interval = poll_interval
+        self.bot: Bot | None = None
+        self._task: asyncio.Task | None = None
+        self._wake = asyncio.Event()
+
+    async def start(self, bot: Bot) -> None:
+        # В многопроцессном режиме рассылки исполняет только фронт-процесс
+        if IS_SHARD_WORKER or self._task is not None:
+            return
+        self.bot = bot
+        async with async_session_maker() as session:
+            requeued = await requeue_running_broadcast_jobs(session)
+        if requeued:
+            logger.info(f"[Broadcast] Возобновлено прерванных рассылок: {requeued}")
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                async with async_session_maker() as session:
+                    job = await claim_broadcast_job(session)
+            except Exception as e:
+                logger.error(f"[Broadcast] Ошибка получения задания рассылки: {e}")
+                job = None
+
+            if job is not None:
+                await self._run_job(job)
+                continue
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except TimeoutError:
+                pass
+
+    async def _run_job(self, job: dict) -> None:
+        logger.info(f"[Broadcast] Рассылка #{job['id']} запущена с курсора {job['cursor']}")
+        try:
+            keyboard = InlineKeyboardMarkup.model_validate(job["keyboard"]) if job["keyboard"] else None
+            await self._show_progress(job)
+
+            while True:
+                page = await self._with_retries(job, "чтение страницы получателей", self._fetch_page)
+                if not page:
+                    await self._finish(job, "completed")
+                    return
+
+                messages = [
+                    {"tg_id": tg_id, "text": job["text"], "photo": job["photo"], "keyboard": keyboard} for tg_id in page
+                ]
+                started = time.monotonic()
+                async with async_session_maker() as session:
+                    service = BroadcastService(bot=self.bot, session=session)
+                    stats = await service.broadcast(messages, workers=job["workers"])
+
+                job["cursor"] = page[-1]
+                job["sent"] += stats["success_count"]
+                job["failed"] += stats["failed_count"]
+                job["blocked"] += stats["blocked_users"]
+                job["elapsed_sec"] += time.monotonic() - started
+
+                status = await self._with_retries(job, "сохранение контрольной точки", self._save_checkpoint)
+                job["status"] = status
+                await self._show_progress(job)
+
+                if status != "running":
+                    logger.info(f"[Broadcast] Рассылка #{job['id']} остановлена: {status}")
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[Broadcast] Рассылка #{job['id']} прервана ошибкой: {e}")
+            await self._finish(job, "failed", error=str(e))
+
+    async def _with_retries(self, job: dict, what: str, func: Callable[[dict], Awaitable[Any]]) -> Any:
+        """
+        Повторяет обращение к БД с экспоненциальной паузой, чтобы кратковременный сбой не валил
+        многочасовую рассылку. Отправку сообщений не повторяем: это привело бы к дублям.
+        """
+        delay = BROADCAST_DB_RETRY_DELAY_SEC
+        for attempt in range(1, BROADCAST_DB_RETRIES + 1):
+            try:
+                return await func(job)
+            except Exception as e:
+                if attempt == BROADCAST_DB_RETRIES:
+                    raise
+                logger.warning(
+                    f"[Broadcast] Рассылка #{job['id']}: ошибка ({what}), попытка {attempt}/{BROADCAST_DB_RETRIES}, "
+                    f"повтор через {delay:.0f} сек: {e}"
+                )
+                await asyncio.sleep(delay)
+                delay *= 2
+
+    async def _fetch_page(self, job: dict) -> list[int]:
+        async with async_session_maker() as session:
+            return await get_recipients_page(
+                session, job["send_to"], job["cluster_name"], job["cursor"], self.page_size
+            )
+
+    async def _save_checkpoint(self, job: dict) -> str | None:
+        async with async_session_maker() as session:
+            return await save_broadcast_checkpoint(
+                session,
+                job["id"],
+                job["cursor"],
+                job["sent"],
+                job["failed"],
+                job["blocked"],
+                job["elapsed_sec"],
+            )
+
+    async def _finish(self, job: dict, status: str, error: str | None = None) -> None:
+        try:
+            async with async_session_maker() as session:
+                await finish_broadcast_job(session, job["id"], status, error=error)
+                job = await get_broadcast_job(session, job["id"]) or job
+        except Exception as e:
+            logger.error(f"[Broadcast] Не удалось завершить рассылку #{job['id']}: {e}")
+
+        logger.info(f"[Broadcast] Рассылка #{job['id']}: {job['status']}, доставлено {job['sent']}/{job['total']}")
+        await self._show_progress(job)
+        if job["chat_id"] and job["status"] in ("completed", "failed"):
+            try:
+                await self.bot.send_message(
+                    chat_id=job["chat_id"],
+                    text=format_broadcast_job(job),
+                    reply_markup=build_broadcast_job_kb(job),
+                )
+            except Exception as e:
+                logger.warning(f"[Broadcast] Не удалось отправить итог рассылки #{job['id']}: {e}")
+
+    async def _show_progress(self, job: dict) -> None:
+        if not job["chat_id"] or not job["message_id"]:
+            return
+        try:
+            await self.bot.edit_message_text(
+                chat_id=job["chat_id"],
+                message_id=job["message_id"],
+                text=format_broadcast_job(job),
+                reply_markup=build_broadcast_job_kb(job),
+            )
+        except TelegramBadRequest as e:
+            if "message is not modified" not in str(e):
+                logger.debug(f"[Broadcast] Не удалось обновить прогресс рассылки #{job['id']}: {e}")
+        except Exception as e:
+            logger.debug(f"[Broadcast] Не удалось обновить прогресс рассылки #{job['id']}: {e}")
+
+
+broadcast_runner = BroadcastJobRunner()
@@ -10,6 +10,11 @@ class AdminSenderCallback(CallbackData, prefix="admin_sender"):
     data: str | None = None
 
 
+class AdminBroadcastJobCallback(CallbackData, prefix="admin_bjob"):
+    action: str
+    job_id: int = 0
+
+
 def build_sender_kb() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
 
@@ -53,6 +58,12 @@ def build_sender_kb() -> InlineKeyboardMarkup:
             callback_data=AdminSenderCallback(type="cluster-select").pack(),
         )
     )
+    builder.row(
+        InlineKeyboardButton(
+            text="🗂 Запущенные рассылки",
+            callback_data=AdminBroadcastJobCallback(action="list").pack(),
+        )
+    )
     builder.row(build_admin_back_btn())
 
     return builder.as_markup()
@@ -72,3 +83,58 @@ def build_clusters_kb(clusters: list) -> InlineKeyboardMarkup:
     builder.row(build_admin_back_btn())
 
     return builder.as_markup()
+
+
+def build_broadcast_job_kb(job: dict) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+    job_id = job["id"]
+
+    if job["status"] in ("pending", "running"):
+        builder.row(
+            InlineKeyboardButton(
+                text="⏸ Пауза",
+                callback_data=AdminBroadcastJobCallback(action="pause", job_id=job_id).pack(),
+            ),
+            InlineKeyboardButton(
+                text="🔄 Обновить",
+                callback_data=AdminBroadcastJobCallback(action="view", job_id=job_id).pack(),
+            ),
+        )
+    elif job["status"] in ("paused", "failed"):
+        builder.row(
+            InlineKeyboardButton(
+                text="▶️ Продолжить",
+                callback_data=AdminBroadcastJobCallback(action="resume", job_id=job_id).pack(),
+            )
+        )
+
+    if job["status"] in ("pending", "running", "paused"):
+        builder.row(
+            InlineKeyboardButton(
+                text="⛔ Отменить рассылку",
+                callback_data=AdminBroadcastJobCallback(action="cancel", job_id=job_id).pack(),
+            )
+        )
+
+    builder.row(
+        InlineKeyboardButton(
+            text="🗂 Все рассылки",
+            callback_data=AdminBroadcastJobCallback(action="list").pack(),
+        )
+    )
+    return builder.as_markup()
+
+
+def build_broadcast_jobs_kb(jobs: list[dict], status_labels: dict[str, str]) -> InlineKeyboardMarkup:
+    builder = InlineKeyboardBuilder()
+
+    for job in jobs:
+        builder.row(
+            InlineKeyboardButton(
+                text=f"#{job['id']} {status_labels.get(job['status'], job['status'])} — {job['sent']}/{job['total']}",
+                callback_data=AdminBroadcastJobCallback(action="view", job_id=job["id"]).pack(),
+            )
+        )
+
+    builder.row(build_admin_back_btn("sender"))
+    return builder.as_markup()
@@ -5,18 +5,36 @@ from aiogram.types import CallbackQuery, InlineKeyboardButton, InlineKeyboardMar
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from database.broadcasts import get_broadcast_job, get_broadcast_jobs
 from database.models import Server
 from filters.admin import IsAdminFilter
 from logger import logger
 
 from ..panel.keyboard import AdminPanelCallback, build_admin_back_kb
-from .keyboard import AdminSenderCallback, build_clusters_kb, build_sender_kb
-from .sender_service import BroadcastService
+from .broadcast_jobs import (
+    BROADCAST_STATUS_LABELS,
+    broadcast_runner,
+    cancel_broadcast,
+    enqueue_broadcast,
+    format_broadcast_job,
+    pause_broadcast,
+    resume_broadcast,
+)
+from .keyboard import (
+    AdminBroadcastJobCallback,
+    AdminSenderCallback,
+    build_broadcast_job_kb,
+    build_broadcast_jobs_kb,
+    build_clusters_kb,
+    build_sender_kb,
+)
 from .sender_states import AdminSender
-from .sender_utils import get_recipients, parse_message_buttons
+from .sender_utils import count_recipients, parse_message_buttons
 
 
 router = Router()
+router.startup.register(broadcast_runner.start)
+router.shutdown.register(broadcast_runner.stop)
 
 
 @router.callback_query(
@@ -97,7 +115,7 @@ async def handle_message_input(message: Message, state: FSMContext, session: Asy
     data = await state.get_data()
     send_to = data.get("type", "all")
     cluster_name = data.get("cluster_name")
-    _, user_count = await get_recipients(session, send_to, cluster_name)
+    user_count = await count_recipients(session, send_to, cluster_name)
 
     if keyboard:
         try:
@@ -160,47 +178,31 @@ async def handle_broadcast_confirm(callback_query: CallbackQuery, state: FSMCont
             await state.clear()
             return
 
-    tg_ids, total_users = await get_recipients(session, send_to, cluster_name)
+    job = await enqueue_broadcast(
+        session,
+        send_to=send_to,
+        cluster_name=cluster_name,
+        text=text_message,
+        photo=photo,
+        keyboard=keyboard,
+        created_by=callback_query.from_user.id,
+        chat_id=callback_query.message.chat.id,
+        message_id=callback_query.message.message_id,
+    )
+    await state.clear()
 
-    if not tg_ids:
+    if not job:
         await callback_query.message.edit_text(
             "⚠️ Не найдено получателей для рассылки.",
             reply_markup=build_admin_back_kb("sender"),
         )
-        await state.clear()
         return
 
-    await callback_query.message.edit_text(f"📤 <b>Рассылка начата!</b>\n👥 Количество получателей: {total_users}")
-
-    messages = []
-    for tg_id in tg_ids:
-        message_data = {"tg_id": tg_id, "text": text_message, "photo": photo, "keyboard": keyboard}
-        messages.append(message_data)
-
-    broadcast_service = BroadcastService(bot=callback_query.bot, session=session, messages_per_second=35)
-
-    stats = await broadcast_service.broadcast(messages, workers=5)
-
-    duration_minutes = int(stats["total_duration"] // 60)
-    duration_seconds = int(stats["total_duration"] % 60)
-    duration_str = (
-        f"{duration_minutes} мин {duration_seconds} сек" if duration_minutes > 0 else f"{duration_seconds} сек"
+    await callback_query.message.edit_text(
+        text=format_broadcast_job(job),
+        reply_markup=build_broadcast_job_kb(job),
     )
 
-    await callback_query.message.answer(
-        text=(
-            f"📤 <b>Рассылка завершена!</b>\n\n"
-            f"👥 <b>Количество получателей:</b> {total_users}\n"
-            f"✅ <b>Доставлено:</b> {stats['success_count']}\n"
-            f"❌ <b>Не доставлено:</b> {stats['failed_count']}\n"
-            f"🚫 <b>Заблокировавших бота:</b> {stats['blocked_users']}\n\n"
-            f"⏱️ <b>Время выполнения:</b> {duration_str}\n"
-            f"⚡ <b>Средняя скорость:</b> {stats['avg_speed']:.1f} сообщений/сек"
-        ),
-        reply_markup=build_admin_back_kb("sender"),
-    )
-    await state.clear()
-
 
 @router.callback_query(F.data == "cancel_broadcast", IsAdminFilter())
 async def handle_broadcast_cancel(callback_query: CallbackQuery, state: FSMContext):
@@ -209,3 +211,37 @@ async def handle_broadcast_cancel(callback_query: CallbackQuery, state: FSMConte
         reply_markup=build_admin_back_kb("sender"),
     )
     await state.clear()
+
+
+@router.callback_query(AdminBroadcastJobCallback.filter(), IsAdminFilter())
+async def handle_broadcast_job(
+    callback_query: CallbackQuery, callback_data: AdminBroadcastJobCallback, session: AsyncSession
+):
+    if callback_data.action == "list":
+        jobs = await get_broadcast_jobs(session)
+        text = "🗂 <b>Последние рассылки</b>" if jobs else "🗂 Рассылок пока не было."
+        await callback_query.message.edit_text(
+            text=text,
+            reply_markup=build_broadcast_jobs_kb(jobs, BROADCAST_STATUS_LABELS),
+        )
+        return
+
+    job_id = callback_data.job_id
+    actions = {"pause": pause_broadcast, "resume": resume_broadcast, "cancel": cancel_broadcast}
+    action = actions.get(callback_data.action)
+    if action and not await action(session, job_id):
+        await callback_query.answer("Рассылка уже в другом состоянии.", show_alert=True)
+
+    job = await get_broadcast_job(session, job_id)
+    if not job:
+        await callback_query.message.edit_text("❌ Рассылка не найдена.", reply_markup=build_admin_back_kb("sender"))
+        return
+
+    try:
+        await callback_query.message.edit_text(
+            text=format_broadcast_job(job),
+            reply_markup=build_broadcast_job_kb(job),
+        )
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
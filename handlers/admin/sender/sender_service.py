@@ -1,7 +1,7 @@
 import asyncio
+import os
 import time
 
-from collections import deque
 from typing import Any
 
 from aiogram import Bot
@@ -9,6 +9,8 @@ from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, Teleg
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from logger import logger
+from utils.media_cache import send_with_cached_media
+from utils.send_scheduler import SendPriority, send_priority, send_scheduler
 
 
 class BroadcastMessage:
@@ -21,41 +23,11 @@ class BroadcastMessage:
         self.attempts = 0
 
 
-class RateLimiter:
-    def __init__(self, max_rate: int = 35, window: float = 1.0) -> None:
-        self.max_rate = max_rate
-        self.window = window
-        self.send_times = deque()
-        self.lock = asyncio.Lock()
-
-    def _clean_old_timestamps(self, current_time: float):
-        cutoff_time = current_time - self.window
-        while self.send_times and self.send_times[0] <= cutoff_time:
-            self.send_times.popleft()
-
-    async def acquire(self):
-        async with self.lock:
-            while True:
-                now = time.time()
-
-                self._clean_old_timestamps(now)
-
-                if len(self.send_times) < self.max_rate:
-                    self.send_times.append(now)
-                    return
-
-                oldest_timestamp = self.send_times[0]
-                time_to_wait = (oldest_timestamp + self.window) - now
-
-                if time_to_wait > 0:
-                    await asyncio.sleep(time_to_wait + 0.001)
-
-
 class BroadcastService:
-    def __init__(self, bot: Bot, session: AsyncSession, messages_per_second: int = 35) -> None:
+    def __init__(self, bot: Bot, session: AsyncSession, priority: SendPriority = SendPriority.MARKETING) -> None:
         self.bot = bot
         self.session = session
-        self.rate_limiter = RateLimiter(max_rate=messages_per_second)
+        self.priority = priority
         self.blocked_users = set()
         self.queue = asyncio.Queue()
         self.delayed_queue = asyncio.Queue()
@@ -66,9 +38,15 @@ class BroadcastService:
 
     async def _send_single_message(self, msg: BroadcastMessage) -> bool:
         try:
-            await self.rate_limiter.acquire()
-
-            if msg.photo:
+            if msg.photo and os.path.isfile(msg.photo):
+                await send_with_cached_media(
+                    self.bot,
+                    msg.photo,
+                    lambda photo: self.bot.send_photo(
+                        chat_id=msg.tg_id, photo=photo, caption=msg.text, parse_mode="HTML", reply_markup=msg.keyboard
+                    ),
+                )
+            elif msg.photo:
                 await self.bot.send_photo(
                     chat_id=msg.tg_id, photo=msg.photo, caption=msg.text, parse_mode="HTML", reply_markup=msg.keyboard
                 )
@@ -187,9 +165,10 @@ class BroadcastService:
 
         logger.info(f"📤 Начата рассылка на {len(messages)} пользователей с {workers} воркерами")
 
-        worker_tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
-
-        delayed_task = asyncio.create_task(self._process_delayed_messages())
+        # Скорость задаёт общий send_scheduler, воркеры лишь передают ему приоритет
+        with send_priority(self.priority):
+            worker_tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
+            delayed_task = asyncio.create_task(self._process_delayed_messages())
 
         await self.queue.join()
 
@@ -224,7 +203,8 @@ class BroadcastService:
 
         logger.info(
             f"✅ Рассылка завершена: {success_count}/{len(messages)} успешно, "
-            f"скорость: {avg_speed:.1f} сообщений/сек, время: {total_duration:.1f} сек"
+            f"скорость: {avg_speed:.1f} сообщений/сек, время: {total_duration:.1f} сек, "
+            f"общий поток бота: {send_scheduler.sustained_rate():.1f} сообщений/сек"
         )
 
         return stats
@@ -4,7 +4,7 @@ import re
 from datetime import datetime
 
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from sqlalchemy import distinct, exists, func, not_, select
+from sqlalchemy import Select, distinct, exists, func, not_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.constants import PAYMENT_SYSTEMS_EXCLUDED
@@ -12,7 +12,8 @@ from database.models import BlockedUser, Key, ManualBan, Payment, Server, Tariff
 from logger import logger
 
 
-async def get_recipients(session: AsyncSession, send_to: str, cluster_name: str | None = None) -> tuple[list[int], int]:
+def build_recipients_query(send_to: str, cluster_name: str | None = None) -> Select:
+    """Запрос tg_id получателей рассылки для группы send_to (одна колонка, без дублей)."""
     now_ms = int(datetime.utcnow().timestamp() * 1000)
     banned_tg_ids = select(BlockedUser.tg_id).union_all(
         select(ManualBan.tg_id).where((ManualBan.until.is_(None)) | (ManualBan.until > datetime.utcnow()))
@@ -80,11 +81,30 @@ async def get_recipients(session: AsyncSession, send_to: str, cluster_name: str
     else:
         query = select(distinct(User.tg_id)).where(~User.tg_id.in_(banned_tg_ids))
 
-    result = await session.execute(query)
+    return query
+
+
+async def get_recipients(session: AsyncSession, send_to: str, cluster_name: str | None = None) -> tuple[list[int], int]:
+    result = await session.execute(build_recipients_query(send_to, cluster_name))
     tg_ids = [row[0] for row in result.all()]
     return tg_ids, len(tg_ids)
 
 
+async def count_recipients(session: AsyncSession, send_to: str, cluster_name: str | None = None) -> int:
+    recipients = build_recipients_query(send_to, cluster_name).subquery()
+    return await session.scalar(select(func.count()).select_from(recipients)) or 0
+
+
+async def get_recipients_page(
+    session: AsyncSession, send_to: str, cluster_name: str | None, after_tg_id: int, limit: int
+) -> list[int]:
+    """Следующая страница получателей с tg_id больше after_tg_id, по возрастанию tg_id."""
+    recipients = build_recipients_query(send_to, cluster_name).subquery()
+    tg_id = recipients.c[0]
+    result = await session.execute(select(tg_id).where(tg_id > after_tg_id).order_by(tg_id).limit(limit))
+    return [row[0] for row in result.all()]
+
+
 def strip_html_tags(text: str) -> str:
     text = re.sub(r'<tg-emoji emoji-id="[^"]*">([^<]*)</tg-emoji>', r"\1", text)
     text = re.sub(r"<[^>]+>", "", text)
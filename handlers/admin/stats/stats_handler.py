@@ -34,6 +34,7 @@ from filters.admin import IsAdminFilter
 from hooks.hooks import run_hooks
 from logger import logger
 from utils.csv_export import (
+    answer_export,
     export_hot_leads_csv,
     export_keys_csv,
     export_payments_csv,
@@ -264,7 +265,7 @@ async def handle_export_users_csv(callback_query: CallbackQuery, session: AsyncS
     kb = build_admin_back_kb("stats")
     try:
         export = await export_users_csv(session)
-        await callback_query.message.answer_document(document=export, caption="📅 Экспорт пользователей в CSV")
+        await answer_export(callback_query.message, export, caption="📅 Экспорт пользователей в CSV")
     except Exception as e:
         logger.error(f"Ошибка при экспорте пользователей: {e}")
         await callback_query.message.edit_text(text=f"❗ Ошибка: {e}", reply_markup=kb)
@@ -275,7 +276,7 @@ async def handle_export_payments_csv(callback_query: CallbackQuery, session: Asy
     kb = build_admin_back_kb("stats")
     try:
         export = await export_payments_csv(session)
-        await callback_query.message.answer_document(document=export, caption="📅 Экспорт платежей в CSV")
+        await answer_export(callback_query.message, export, caption="📅 Экспорт платежей в CSV")
     except Exception as e:
         logger.error(f"Ошибка при экспорте платежей: {e}")
         await callback_query.message.edit_text(text=f"❗ Ошибка: {e}", reply_markup=kb)
@@ -286,7 +287,7 @@ async def handle_export_hot_leads_csv(callback_query: CallbackQuery, session: As
     kb = build_admin_back_kb("stats")
     try:
         export = await export_hot_leads_csv(session)
-        await callback_query.message.answer_document(document=export, caption="📅 Экспорт горящих лидов")
+        await answer_export(callback_query.message, export, caption="📅 Экспорт горящих лидов")
     except Exception as e:
         logger.error(f"Ошибка при экспорте горящих лидов: {e}")
         await callback_query.message.edit_text(text=f"❗ Ошибка: {e}", reply_markup=kb)
@@ -297,7 +298,7 @@ async def handle_export_keys_csv(callback_query: CallbackQuery, session: AsyncSe
     kb = build_admin_back_kb("stats")
     try:
         export = await export_keys_csv(session)
-        await callback_query.message.answer_document(document=export, caption="📅 Экспорт подписок в CSV")
+        await answer_export(callback_query.message, export, caption="📅 Экспорт подписок в CSV")
     except Exception as e:
         logger.error(f"Ошибка при экспорте подписок: {e}")
         await callback_query.message.edit_text(text=f"❗ Ошибка: {e}", reply_markup=kb)
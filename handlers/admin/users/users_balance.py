@@ -7,7 +7,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_balance, set_user_balance, update_balance
-from utils.csv_export import export_user_all_payments_csv
+from utils.csv_export import answer_export, export_user_all_payments_csv
 from database.models import Payment
 from database.payments import add_payment
 from filters.admin import IsAdminFilter
@@ -104,7 +104,7 @@ async def handle_balance_export(
 ):
     tg_id = callback_data.tg_id
     csv_file = await export_user_all_payments_csv(tg_id=tg_id, session=session)
-    await callback_query.message.answer_document(csv_file)
+    await answer_export(callback_query.message, csv_file)
     await callback_query.answer()
 
 
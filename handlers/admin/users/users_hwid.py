@@ -5,7 +5,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD
 from database import get_client_id_by_email, get_servers
 from filters.admin import IsAdminFilter
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_pool import get_remnawave_api
 
 from .keyboard import AdminUserEditorCallback, build_editor_kb, build_hwid_menu_kb
 
@@ -47,7 +47,7 @@ async def handle_hwid_menu(
         )
         return
 
-    api = RemnawaveAPI(remna_server["api_url"])
+    api = get_remnawave_api(remna_server["api_url"])
     if not await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
         await callback_query.message.edit_text("❌ Ошибка авторизации в Remnawave.")
         return
@@ -148,7 +148,7 @@ async def handle_hwid_reset(
         )
         return
 
-    api = RemnawaveAPI(remna_server["api_url"])
+    api = get_remnawave_api(remna_server["api_url"])
     if not await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
         await callback_query.message.edit_text("❌ Ошибка авторизации в Remnawave.")
         return
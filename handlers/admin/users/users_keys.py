@@ -42,7 +42,7 @@ from handlers.utils import generate_random_email, handle_error
 from hooks.hook_buttons import insert_hook_buttons
 from hooks.processors import process_admin_key_edit_menu
 from logger import logger
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_pool import get_remnawave_api
 
 from ..panel.keyboard import AdminPanelCallback, build_admin_back_btn, build_admin_back_kb
 from .keyboard import (
@@ -657,7 +657,7 @@ async def handle_recreate_key_confirm(
             )
             return
 
-        api = RemnawaveAPI(api_url)
+        api = get_remnawave_api(api_url)
         try:
             if not REMNAWAVE_TOKEN_LOGIN_ENABLED:
                 await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD)
@@ -21,7 +21,7 @@ from database import (
 from database.models import Key, ManualBan, Payment, Referral, User
 from filters.admin import IsAdminFilter
 from handlers.utils import sanitize_key_name
-from utils.csv_export import export_referrals_csv
+from utils.csv_export import answer_export, export_referrals_csv
 
 from ..panel.keyboard import (
     AdminPanelCallback,
@@ -324,8 +324,9 @@ async def handle_users_export_referrals(
         await callback_query.message.answer("У пользователя нет рефералов.")
         return
 
-    await callback_query.message.answer_document(
-        document=csv_file,
+    await answer_export(
+        callback_query.message,
+        csv_file,
         caption=f"Список рефералов для пользователя {referrer_tg_id}.",
     )
 
@@ -1,10 +1,5 @@
-import os
 import urllib.parse
 
-from io import BytesIO
-
-import qrcode
-
 from aiogram import F, Router, types
 from aiogram.types import CallbackQuery, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
@@ -43,6 +38,7 @@ from handlers.utils import edit_or_send_message
 from hooks.hook_buttons import insert_hook_buttons
 from hooks.processors import process_connect_device_menu
 from logger import logger
+from utils.qr import send_qr_code
 
 
 router = Router()
@@ -226,33 +222,17 @@ async def show_qr_code(callback_query: types.CallbackQuery, session: AsyncSessio
             await callback_query.message.answer("❌ У этой подписки отсутствует ссылка для подключения.")
             return
 
-        qr = qrcode.QRCode(version=1, box_size=10, border=4)
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        buffer.seek(0)
-
-        qr_path = f"/tmp/qrcode_{record.email}.png"
-        with open(qr_path, "wb") as f:
-            f.write(buffer.read())
-
         builder = InlineKeyboardBuilder()
         builder.row(InlineKeyboardButton(text=BACK, callback_data=f"view_key|{record.email}"))
         builder.row(InlineKeyboardButton(text=MAIN_MENU, callback_data="profile"))
 
-        await edit_or_send_message(
+        await send_qr_code(
             target_message=callback_query.message,
-            text="🔲 <b>Ваш QR-код для подключения</b>",
+            data=qr_data,
+            caption="🔲 <b>Ваш QR-код для подключения</b>",
             reply_markup=builder.as_markup(),
-            media_path=qr_path,
-            disable_cache=True,
         )
 
-        os.remove(qr_path)
-
     except Exception as e:
         logger.error(f"Ошибка при генерации QR: {e}", exc_info=True)
         await callback_query.message.answer("❌ Произошла ошибка при создании QR-кода.")
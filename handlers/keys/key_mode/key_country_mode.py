@@ -10,15 +10,12 @@ from aiogram import F, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, InlineKeyboardButton, Message, WebAppInfo
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from py3xui import AsyncApi
-from sqlalchemy import func, select, update
+from sqlalchemy import select, update
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot import bot
 from config import (
-    ADMIN_PASSWORD,
-    ADMIN_USERNAME,
     REMNAWAVE_LOGIN,
     REMNAWAVE_PASSWORD,
     REMNAWAVE_WEBAPP,
@@ -32,12 +29,15 @@ from database import (
     check_user_exists,
     filter_cluster_by_subgroup,
     get_key_details,
+    get_server_key_count,
+    get_server_key_counts,
+    get_servers_topology,
     get_tariff_by_id,
     get_trial,
     update_balance,
     update_trial,
 )
-from database.models import Key, Server, ServerSpecialgroup
+from database.models import Key, Server
 from handlers.buttons import (
     BACK,
     CONNECT_DEVICE,
@@ -55,7 +55,6 @@ from handlers.tariffs.tariff_display import (
 )
 from handlers.texts import SELECT_COUNTRY_MSG
 from handlers.utils import (
-    ALLOWED_GROUP_CODES,
     edit_or_send_message,
     generate_random_email,
     get_least_loaded_cluster,
@@ -70,7 +69,9 @@ from hooks.processors import (
 )
 from logger import logger
 from panels._3xui import delete_client, get_xui_instance
-from panels.remnawave import RemnawaveAPI, get_vless_link_for_remnawave_by_username
+from panels.remnawave import get_vless_link_for_remnawave_by_username
+from panels.remnawave_pool import get_remnawave_api
+from panels.xui_pool import ping_xui
 
 
 router = Router()
@@ -147,15 +148,8 @@ async def key_country_mode(
         if tariff:
             subgroup_title = tariff.get("subgroup_title")
 
-    q = select(
-        Server.id,
-        Server.server_name,
-        Server.api_url,
-        Server.panel_type,
-        Server.enabled,
-        Server.max_keys,
-    ).where(Server.cluster_name == least_loaded_cluster)
-    servers = [dict(m) for m in (await session.execute(q)).mappings().all()]
+    topology = await get_servers_topology(session)
+    servers = [dict(s) for s in topology.clusters.get(least_loaded_cluster, ())]
 
     if not servers:
         text = "❌ Нет доступных серверов в выбранном кластере."
@@ -165,20 +159,6 @@ async def key_country_mode(
             await bot.send_message(chat_id=tg_id, text=text)
         return
 
-    server_ids = [s["id"] for s in servers]
-    groups_map: dict[int, list[str]] = {}
-    if server_ids:
-        r = await session.execute(
-            select(ServerSpecialgroup.server_id, ServerSpecialgroup.group_code).where(
-                ServerSpecialgroup.server_id.in_(server_ids)
-            )
-        )
-        for sid, gc in r.all():
-            groups_map.setdefault(sid, []).append(gc)
-
-    for server in servers:
-        server["special_groups"] = [g for g in groups_map.get(server["id"], []) if g in ALLOWED_GROUP_CODES]
-
     if subgroup_title:
         servers = await filter_cluster_by_subgroup(
             session, servers, subgroup_title, least_loaded_cluster, tariff_id=plan
@@ -191,18 +171,11 @@ async def key_country_mode(
                 await bot.send_message(chat_id=tg_id, text=text)
             return
 
-    special = None
     if tariff:
-        gc = (tariff.get("group_code") or "").lower()
-        if gc in ALLOWED_GROUP_CODES:
-            special = gc
-
-    if special:
-        bound_servers = [s for s in servers if special in (s.get("special_groups") or [])]
-        if bound_servers:
-            servers = bound_servers
+        servers = topology.routing.by_special_group(servers, tariff.get("group_code"))
 
     available_servers: list[str] = []
+    await get_server_key_counts(session)
     tasks = [asyncio.create_task(check_server_availability(dict(server), session)) for server in servers]
     results = await asyncio.gather(*tasks, return_exceptions=True)
 
@@ -283,38 +256,14 @@ async def change_location_callback(callback_query: CallbackQuery, session: Any):
             if tariff_dict:
                 subgroup_title = tariff_dict.get("subgroup_title")
 
-        q = (
-            select(
-                Server.id,
-                Server.server_name,
-                Server.api_url,
-                Server.panel_type,
-                Server.enabled,
-                Server.max_keys,
-            )
-            .where(Server.cluster_name == cluster_name)
-            .where(Server.server_name != current_server)
-        )
-        servers = [dict(m) for m in (await session.execute(q)).mappings().all()]
+        topology = await get_servers_topology(session)
+        servers = [dict(s) for s in topology.clusters.get(cluster_name, ()) if s["server_name"] != current_server]
         if not servers:
             await callback_query.answer("❌ Доступных серверов в кластере не найдено", show_alert=True)
             return
 
-        server_ids = [s["id"] for s in servers]
-        groups_map: dict[int, list[str]] = {}
-        if server_ids:
-            r = await session.execute(
-                select(ServerSpecialgroup.server_id, ServerSpecialgroup.group_code).where(
-                    ServerSpecialgroup.server_id.in_(server_ids)
-                )
-            )
-            for sid, gc in r.all():
-                groups_map.setdefault(sid, []).append(gc)
-
-        for server in servers:
-            server["special_groups"] = [g for g in groups_map.get(server["id"], []) if g in ALLOWED_GROUP_CODES]
-
         available_servers: list[str] = []
+        await get_server_key_counts(session)
         tasks = [
             asyncio.create_task(
                 check_server_availability(
@@ -357,16 +306,9 @@ async def change_location_callback(callback_query: CallbackQuery, session: Any):
                 return
 
         if available_servers and tariff_dict:
-            special = None
-            gc = (tariff_dict.get("group_code") or "").lower()
-            if gc and gc in ALLOWED_GROUP_CODES:
-                special = gc
-
-            if special:
-                available_servers_dict = [s for s in servers if s["server_name"] in available_servers]
-                bound_servers = [s for s in available_servers_dict if special in (s.get("special_groups") or [])]
-                if bound_servers:
-                    available_servers = [s["server_name"] for s in bound_servers]
+            available_servers_dict = [s for s in servers if s["server_name"] in available_servers]
+            bound_servers = topology.routing.by_special_group(available_servers_dict, tariff_dict.get("group_code"))
+            available_servers = [s["server_name"] for s in bound_servers]
 
         if not available_servers:
             builder = InlineKeyboardBuilder()
@@ -581,7 +523,7 @@ async def finalize_key_creation(
                                 update(Key).where(Key.tg_id == tg_id, Key.email == email).values(key=None)
                             )
                         elif old_server_info.panel_type.lower() == "remnawave":
-                            remna_del = RemnawaveAPI(old_server_info.api_url)
+                            remna_del = get_remnawave_api(old_server_info.api_url)
                             if await remna_del.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
                                 await remna_del.delete_user(client_id)
                                 await session.execute(
@@ -595,7 +537,7 @@ async def finalize_key_creation(
         panel_type = server_info.panel_type.lower()
 
         if panel_type == "remnawave" or is_full_remnawave:
-            remna = RemnawaveAPI(server_info.api_url)
+            remna = get_remnawave_api(server_info.api_url)
             if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
                 raise ValueError(f"❌ Не удалось авторизоваться в Remnawave ({server_info.server_name})")
 
@@ -834,8 +776,7 @@ async def check_server_availability(server_info: dict, session: AsyncSession) ->
 
     try:
         if max_keys is not None:
-            result = await session.execute(select(func.count()).select_from(Key).where(Key.server_id == server_name))
-            key_count = result.scalar()
+            key_count = await get_server_key_count(session, server_name)
 
             if key_count >= max_keys:
                 logger.info(f"[Ping] Сервер {server_name} достиг лимита ключей: {key_count}/{max_keys}.")
@@ -847,18 +788,12 @@ async def check_server_availability(server_info: dict, session: AsyncSession) ->
 
     try:
         if panel_type == "remnawave":
-            remna = RemnawaveAPI(server_info["api_url"])
-            await asyncio.wait_for(remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD), timeout=5.0)
+            remna = get_remnawave_api(server_info["api_url"])
+            await asyncio.wait_for(remna.ping(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD), timeout=5.0)
             logger.info(f"[Ping] Remnawave сервер {server_name} доступен.")
             return True
 
-        xui = AsyncApi(
-            server_info["api_url"],
-            username=ADMIN_USERNAME,
-            password=ADMIN_PASSWORD,
-            logger=logger,
-        )
-        await asyncio.wait_for(xui.login(), timeout=5.0)
+        await asyncio.wait_for(ping_xui(server_info["api_url"]), timeout=5.0)
         logger.info(f"[Ping] 3x-ui сервер {server_name} доступен.")
         return True
 
@@ -73,7 +73,7 @@ from hooks.processors import (
     process_view_key_menu,
 )
 from logger import logger
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_pool import get_remnawave_api
 
 
 router = Router()
@@ -374,11 +374,13 @@ async def build_key_view_payload(session: AsyncSession, key_name: str):
                     break
 
             if remna_server:
-                api = RemnawaveAPI(remna_server["api_url"])
+                api = get_remnawave_api(remna_server["api_url"])
                 if await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
-                    devices = await api.get_user_hwid_devices(client_id)
+                    devices, user_data = await asyncio.gather(
+                        api.get_user_hwid_devices(client_id),
+                        api.get_user_by_uuid(client_id),
+                    )
                     hwid_count = len(devices or [])
-                    user_data = await api.get_user_by_uuid(client_id)
                     if user_data:
                         user_traffic = user_data.get("userTraffic", {})
                         used_bytes = user_traffic.get("usedTrafficBytes", 0)
@@ -513,7 +515,7 @@ async def handle_reset_hwid(callback_query: CallbackQuery, session: AsyncSession
         await callback_query.answer("❌ Remnawave-сервер не найден.", show_alert=True)
         return
 
-    api = RemnawaveAPI(remna_server["api_url"])
+    api = get_remnawave_api(remna_server["api_url"])
     if not await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
         await callback_query.answer("❌ Авторизация в Remnawave не удалась.", show_alert=True)
         return
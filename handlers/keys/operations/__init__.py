@@ -2,7 +2,7 @@ from .creation import create_client_on_server, create_key_on_cluster
 from .deletion import delete_key_from_cluster
 from .renewal import renew_key_in_cluster
 from .toggles import toggle_client_on_cluster
-from .traffic import get_user_traffic, reset_traffic_in_cluster
+from .traffic import collect_traffic_snapshot, get_user_traffic, reset_traffic_in_cluster
 from .update import update_key_on_cluster, update_subscription
 
 
@@ -14,6 +14,7 @@ __all__ = [
     "update_subscription",
     "delete_key_from_cluster",
     "get_user_traffic",
+    "collect_traffic_snapshot",
     "reset_traffic_in_cluster",
     "toggle_client_on_cluster",
 ]
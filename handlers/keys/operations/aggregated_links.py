@@ -7,7 +7,7 @@ from core.bootstrap import MODES_CONFIG
 from database import filter_cluster_by_subgroup, get_key_details, get_tariff_by_id
 from logger import logger
 from panels._3xui import get_vless_link_for_client, get_xui_instance
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_pool import get_remnawave_api
 from servers import extract_host
 
 from .utils import is_plan_vless, score_vless_url, split_by_panel
@@ -27,7 +27,7 @@ async def _try_build_remna_vless(servers: list, email: str) -> tuple[str | None,
     happ_cryptolink_enabled = bool(MODES_CONFIG.get("HAPP_CRYPTOLINK_ENABLED", HAPP_CRYPTOLINK))
 
     si = servers[0]
-    remna = RemnawaveAPI(si["api_url"])
+    remna = get_remnawave_api(si["api_url"])
     ok = await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD)
     if not ok:
         logger.warning("[Remnawave] login failed")
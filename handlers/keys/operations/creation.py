@@ -16,7 +16,8 @@ from logger import (
     PANEL_XUI,
 )
 from panels._3xui import ClientConfig, add_client, get_xui_instance
-from panels.remnawave import RemnawaveAPI, get_vless_link_for_remnawave_by_username
+from panels.remnawave import get_vless_link_for_remnawave_by_username
+from panels.remnawave_pool import get_remnawave_api
 
 from .aggregated_links import make_aggregated_link
 
@@ -153,7 +154,7 @@ async def create_key_on_cluster(
         remnawave_link_value = None
 
         if remnawave_servers:
-            remna = RemnawaveAPI(remnawave_servers[0]["api_url"])
+            remna = get_remnawave_api(remnawave_servers[0]["api_url"])
             logged_in = await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD)
             if not logged_in:
                 logger.error(f"{PANEL_REMNA} Не удалось войти в Remnawave API")
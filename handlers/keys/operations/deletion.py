@@ -10,7 +10,7 @@ from logger import (
     PANEL_XUI,
 )
 from panels._3xui import delete_client, get_xui_instance
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_pool import get_remnawave_api
 
 from .utils import unique_by_api_url
 
@@ -74,7 +74,7 @@ async def delete_on_remnawave(servers: list, client_id: str) -> bool:
     servers = unique_by_api_url(servers)
     for s in servers:
         name = s.get("server_name", "remna")
-        api = RemnawaveAPI(s.get("api_url"))
+        api = get_remnawave_api(s.get("api_url"))
         if not REMNAWAVE_TOKEN_LOGIN_ENABLED:
             ok = await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD)
             if not ok:
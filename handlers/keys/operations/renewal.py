@@ -1,5 +1,8 @@
 import asyncio
+import contextvars
+import time
 
+from collections.abc import Callable
 from datetime import datetime
 
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -24,12 +27,24 @@ from logger import (
     PANEL_XUI,
 )
 from panels._3xui import extend_client_key, get_xui_instance
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_pool import get_remnawave_api
 
 from .aggregated_links import make_aggregated_link
 from ...tariffs.subgroup_migration import migrate_between_subgroups
 
 
+# Приёмник задержек вызовов продления на панелях (api_url, секунды); выставляет исполнитель автопродления
+panel_latency_sink: contextvars.ContextVar[Callable[[str, float], None] | None] = contextvars.ContextVar(
+    "renewal_panel_latency_sink", default=None
+)
+
+
+def _report_panel_latency(api_url: str, started: float) -> None:
+    sink = panel_latency_sink.get()
+    if sink is not None:
+        sink(api_url, time.perf_counter() - started)
+
+
 async def resolve_cluster(session: AsyncSession, cluster_id: str):
     """Возвращает список серверов для кластера или конкретного сервера."""
     servers = await get_servers(session)
@@ -70,7 +85,7 @@ async def renew_on_remnawave(
             :1
         ]
 
-    remna = RemnawaveAPI(remnawave_nodes[0]["api_url"])
+    remna = get_remnawave_api(remnawave_nodes[0]["api_url"])
     if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
         logger.error(f"{PANEL_REMNA} Не удалось войти в Remnawave API")
         return False
@@ -98,7 +113,11 @@ async def renew_on_remnawave(
         "external_squad_uuid": external_squad_uuid,
     }
 
-    updated = await remna.update_user(**update_kwargs)
+    started = time.perf_counter()
+    try:
+        updated = await remna.update_user(**update_kwargs)
+    finally:
+        _report_panel_latency(remnawave_nodes[0]["api_url"], started)
     if updated:
         if reset_traffic:
             try:
@@ -148,6 +167,7 @@ async def renew_on_3xui(
             except Exception as e:
                 logger.warning(f"{PANEL_XUI} [{name}] API недоступен: {e}")
                 return name, False, f"api_unavailable: {e}"
+            started = time.perf_counter()
             try:
                 updated = await extend_client_key(
                     xui=xui,
@@ -163,6 +183,8 @@ async def renew_on_3xui(
             except Exception as e:
                 logger.warning(f"{PANEL_XUI} [{name}] ошибка продления: {e}")
                 updated = False
+            finally:
+                _report_panel_latency(si["api_url"], started)
             if updated:
                 return name, True, None
             logger.debug(f"{PANEL_XUI} [{name}] не удалось обновить {uniq}. Автосоздание отключено.")
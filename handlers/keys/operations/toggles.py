@@ -8,7 +8,7 @@ from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD, SUPERNODE
 from database import get_servers
 from logger import logger
 from panels._3xui import get_xui_instance, toggle_client
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_pool import get_remnawave_api
 
 
 async def toggle_client_on_cluster(
@@ -55,7 +55,7 @@ async def toggle_client_on_cluster(
                 tasks.append(toggle_client(xui, int(inbound_id), unique_email, client_id, enable))
 
             elif panel_type == "remnawave":
-                remna = RemnawaveAPI(server_info["api_url"])
+                remna = get_remnawave_api(server_info["api_url"])
                 if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
                     logger.error(f"[Remnawave] Авторизация не удалась на сервере {server_name}")
                     results[server_name] = False
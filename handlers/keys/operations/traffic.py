@@ -10,7 +10,7 @@ from database import get_servers
 from database.models import Key, Server
 from logger import logger
 from panels._3xui import get_client_traffic, get_xui_instance
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_pool import get_remnawave_api
 
 
 async def get_user_traffic(session: AsyncSession, tg_id: int, email: str) -> dict[str, Any]:
@@ -99,7 +99,7 @@ async def get_user_traffic(session: AsyncSession, tg_id: int, email: str) -> dic
 
     if remnawave_client_id and remnawave_api_url:
         try:
-            remna = RemnawaveAPI(remnawave_api_url)
+            remna = get_remnawave_api(remnawave_api_url)
             if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
                 user_traffic_data["Remnawave (общий)"] = "Не удалось авторизоваться"
             else:
@@ -117,6 +117,64 @@ async def get_user_traffic(session: AsyncSession, tg_id: int, email: str) -> dic
     return {"status": "success", "traffic": user_traffic_data}
 
 
+async def collect_traffic_snapshot(session: AsyncSession, cluster_ids: set[str]) -> dict[str, int]:
+    """
+    Снимок использованного трафика {client_id: байты} для кластеров/серверов cluster_ids:
+    один запрос на каждый inbound 3x-ui и одна выгрузка пользователей на каждую панель Remnawave.
+    Трафик по 3x-ui суммируется по серверам; клиентов недоступных панелей в снимке нет.
+    """
+    servers = await get_servers(session)
+    xui_inbounds = set()
+    remnawave_panels = set()
+
+    for cluster_id in cluster_ids:
+        cluster = servers.get(cluster_id) or [
+            s for cl in servers.values() for s in cl if s.get("server_name") == cluster_id
+        ]
+        for server_info in cluster:
+            panel_type = server_info.get("panel_type", "3x-ui").lower()
+            if panel_type == "remnawave":
+                remnawave_panels.add(server_info["api_url"])
+            elif panel_type == "3x-ui" and server_info.get("inbound_id"):
+                xui_inbounds.add((server_info["api_url"], int(server_info["inbound_id"])))
+
+    async def fetch_inbound(api_url: str, inbound_id: int) -> list[tuple[str | None, int]]:
+        xui = await get_xui_instance(api_url)
+        inbound = await xui.inbound.get_by_id(inbound_id)
+        ids_by_email = {c.email.lower(): str(c.id) for c in inbound.settings.clients if c.id and c.email}
+        return [(ids_by_email.get(stat.email.lower()), stat.up + stat.down) for stat in inbound.client_stats or []]
+
+    async def fetch_remnawave(api_url: str) -> list[tuple[str | None, int]]:
+        remna = get_remnawave_api(api_url)
+        users = await remna.get_all_users_time(username=REMNAWAVE_LOGIN, password=REMNAWAVE_PASSWORD)
+        usage = []
+        for user in users or []:
+            used_bytes = (user.get("userTraffic") or {}).get("usedTrafficBytes", user.get("usedTrafficBytes"))
+            if used_bytes is not None:
+                usage.append((user.get("uuid"), int(used_bytes)))
+        return usage
+
+    sources = [f"3x-ui {api_url} inbound {inbound_id}" for api_url, inbound_id in xui_inbounds]
+    sources += [f"Remnawave {api_url}" for api_url in remnawave_panels]
+    results = await asyncio.gather(
+        *(fetch_inbound(api_url, inbound_id) for api_url, inbound_id in xui_inbounds),
+        *(fetch_remnawave(api_url) for api_url in remnawave_panels),
+        return_exceptions=True,
+    )
+
+    snapshot: dict[str, int] = {}
+    for source, result in zip(sources, results, strict=True):
+        if isinstance(result, Exception):
+            logger.warning(f"[Traffic] Не удалось получить статистику {source}: {result}")
+            continue
+        for client_id, used_bytes in result:
+            if client_id:
+                snapshot[client_id] = snapshot.get(client_id, 0) + used_bytes
+
+    logger.info(f"[Traffic] Снимок трафика: {len(snapshot)} клиентов, запросов к панелям: {len(sources)}")
+    return snapshot
+
+
 async def reset_traffic_in_cluster(cluster_id: str, email: str, session: AsyncSession) -> None:
     try:
         servers = await get_servers(session)
@@ -154,7 +212,7 @@ async def reset_traffic_in_cluster(cluster_id: str, email: str, session: AsyncSe
 
                 client_id = row[0]
 
-                remna = RemnawaveAPI(api_url)
+                remna = get_remnawave_api(api_url)
                 if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
                     logger.warning(f"[Reset Traffic] Не удалось авторизоваться в Remnawave ({server_name})")
                     continue
@@ -17,7 +17,7 @@ from logger import (
     PANEL_XUI,
 )
 from panels._3xui import ClientConfig, add_client, get_xui_instance
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_pool import get_remnawave_api
 
 from .aggregated_links import make_aggregated_link
 from .deletion import delete_key_from_cluster
@@ -92,7 +92,7 @@ async def update_key_on_cluster(
 
         if remnawave_servers:
             inbound_ids = [s["inbound_id"] for s in remnawave_servers if s.get("inbound_id")]
-            remna = RemnawaveAPI(remnawave_servers[0]["api_url"])
+            remna = get_remnawave_api(remnawave_servers[0]["api_url"])
             if await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
                 await remna.delete_user(client_id)
 
@@ -1,11 +1,11 @@
 import asyncio
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from typing import Any, Optional
 
 import pytz
 from aiogram import Bot, Router
-from sqlalchemy import select, text, update
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from config import (
@@ -25,24 +25,26 @@ from config import (
 from core.bootstrap import MODES_CONFIG, NOTIFICATIONS_CONFIG
 from database import (
     add_notification,
-    check_notification_time,
+    bulk_add_notifications,
+    bulk_delete_notifications,
+    bulk_update_balances,
+    bulk_update_key_expiry,
+    bulk_update_key_tariff,
+    bulk_update_keys,
     check_notifications_bulk,
     delete_key,
     delete_notification,
     get_all_keys,
-    get_balance,
-    get_last_notification_time,
+    get_balances,
+    get_last_notification_times,
+    stream_active_keys,
     update_balance,
     update_key_expiry,
     update_key_tariff,
 )
-from database.models import Key, Tariff, User
-from database.tariffs import (
-    check_tariff_exists,
-    get_tariff_by_id,
-    get_tariffs_for_cluster,
-)
-from handlers.keys.operations import delete_key_from_cluster, renew_key_in_cluster
+from database.models import Key, Tariff
+from database.tariffs import get_tariffs_for_clusters
+from handlers.keys.operations import delete_key_from_cluster
 from handlers.notifications.notify_kb import (
     build_change_tariff_kb,
     build_notification_expired_kb,
@@ -58,11 +60,12 @@ from handlers.texts import (
     get_renewal_message,
 )
 from handlers.utils import format_hours, format_minutes, get_russian_month
-from hooks.hooks import run_hooks
+from hooks.hooks import has_hooks, run_hooks
 from logger import logger
 
 from .hot_leads_notifications import notify_hot_leads
 from .notify_utils import prepare_key_expiry_data, send_messages_with_limit, send_notification
+from .renewal_executor import RenewalExecutor, RenewalJob
 from .special_notifications import notify_inactive_trial_users, notify_users_no_traffic
 
 
@@ -78,53 +81,98 @@ class NotificationContext:
     current_time: int
     preload_data: Optional[dict] = None
     bulk_updates: Optional[dict] = None
+    sessionmaker: Optional[async_sessionmaker] = None
+    balances: dict = field(default_factory=dict)
+    reserved: dict = field(default_factory=dict)
+    tariffs: dict = field(default_factory=dict)
+    cluster_tariffs: dict = field(default_factory=dict)
+    last_notifications: dict = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        if self.preload_data:
+            self.balances.update(self.preload_data.get("balances_cache", {}))
+            self.tariffs.update(self.preload_data.get("tariffs_cache", {}))
 
     def get_balance(self, tg_id: int) -> float:
-        if self.preload_data and tg_id in self.preload_data.get("balances_cache", {}):
-            return self.preload_data["balances_cache"][tg_id]
-        return 0.0
+        balance = self.balances.get(tg_id, 0.0) - self.reserved.get(tg_id, 0)
+        if self.bulk_updates is not None:
+            balance += self.bulk_updates["balance_changes"].get(tg_id, 0)
+        return balance
 
-    def get_tariff(self, tariff_id: int) -> Optional[dict]:
-        if self.preload_data and tariff_id in self.preload_data.get("tariffs_cache", {}):
-            return self.preload_data["tariffs_cache"][tariff_id]
-        return None
+    def reserve_balance(self, tg_id: int, amount: float) -> None:
+        self.reserved[tg_id] = self.reserved.get(tg_id, 0) + amount
 
+    def release_balance(self, tg_id: int, amount: float) -> None:
+        self.reserved[tg_id] = self.reserved.get(tg_id, 0) - amount
 
-async def preload_notification_data(session: AsyncSession) -> dict[str, Any]:
-    stmt = (
-        select(
-            Key,
-            Tariff,
-            User.balance.label("user_balance"),
-        )
-        .outerjoin(Tariff, Key.tariff_id == Tariff.id)
-        .outerjoin(User, Key.tg_id == User.tg_id)
-        .where(Key.is_frozen.is_(False))
-    )
-
-    result = await session.execute(stmt)
-    rows = result.all()
-
+    def get_tariff(self, tariff_id: int) -> Optional[dict]:
+        return self.tariffs.get(tariff_id)
+
+    def notification_due(self, tg_id: int, notification_id: str, hours: int) -> bool:
+        last_time = self.last_notifications.get((tg_id, notification_id))
+        if not last_time:
+            return True
+        return datetime.utcnow() - last_time > timedelta(hours=hours)
+
+    def last_notification_ms(self, tg_id: int, notification_id: str) -> Optional[int]:
+        last_time = self.last_notifications.get((tg_id, notification_id))
+        return int(last_time.timestamp() * 1000) if last_time else None
+
+    def mark_notified(self, tg_id: int, notification_id: str) -> None:
+        self.last_notifications[(tg_id, notification_id)] = datetime.utcnow()
+
+
+async def load_batch_state(ctx: NotificationContext, keys: list, notify_types: tuple[str, ...]) -> None:
+    """
+    Пачечная стадия перед обработкой ключей: время последних уведомлений, балансы,
+    тарифы ключей и списки тарифов кластеров загружаются несколькими запросами на всю пачку,
+    дальше решения по каждому ключу принимаются в памяти.
+    """
+    if not keys:
+        return
+
+    pairs = [(key.tg_id, f"{key.email or ''}_{notify_type}") for key in keys for notify_type in notify_types]
+    ctx.last_notifications.update(await get_last_notification_times(ctx.session, pairs))
+
+    missing_balances = {key.tg_id for key in keys} - ctx.balances.keys()
+    if missing_balances:
+        ctx.balances.update(await get_balances(ctx.session, list(missing_balances)))
+
+    missing_tariffs = {key.tariff_id for key in keys if key.tariff_id} - ctx.tariffs.keys()
+    if missing_tariffs:
+        result = await ctx.session.execute(select(Tariff).where(Tariff.id.in_(missing_tariffs)))
+        ctx.tariffs.update({tariff.id: dict(tariff.__dict__) for tariff in result.scalars().all()})
+
+    missing_clusters = {key.server_id for key in keys if key.server_id} - ctx.cluster_tariffs.keys()
+    if missing_clusters:
+        ctx.cluster_tariffs.update(await get_tariffs_for_clusters(ctx.session, list(missing_clusters)))
+
+
+async def preload_notification_data(session: AsyncSession, expiry_before: int | None = None) -> dict[str, Any]:
+    """
+    Загружает ключи, попадающие в окна уведомлений (истекающие не позже expiry_before,
+    включая уже истекшие), потоково пачками. Тарифы подгружаются одним запросом только
+    для встретившихся ключей, балансы берутся из той же выборки.
+    """
     keys_data = {}
-    tariffs_cache = {}
     balances_cache = {}
+    tariff_ids = set()
 
-    for row in rows:
-        key = row[0]
-        tariff = row[1]
-        balance = row[2] or 0.0
-
-        key_dict = {
-            "key": key,
-            "tariff": dict(tariff.__dict__) if tariff else None,
-            "balance": float(balance),
-        }
-        keys_data[key.client_id] = key_dict
+    async for rows in stream_active_keys(session, expiry_before=expiry_before):
+        for key, balance in rows:
+            balance = float(balance or 0.0)
+            keys_data[key.client_id] = {"key": key, "tariff": None, "balance": balance}
+            balances_cache[key.tg_id] = balance
+            if key.tariff_id:
+                tariff_ids.add(key.tariff_id)
 
-        if tariff and tariff.id not in tariffs_cache:
-            tariffs_cache[tariff.id] = dict(tariff.__dict__)
+    tariffs_cache = {}
+    if tariff_ids:
+        result = await session.execute(select(Tariff).where(Tariff.id.in_(tariff_ids)))
+        tariffs_cache = {tariff.id: dict(tariff.__dict__) for tariff in result.scalars().all()}
 
-        balances_cache[key.tg_id] = float(balance)
+    for data in keys_data.values():
+        data["tariff"] = tariffs_cache.get(data["key"].tariff_id)
 
     return {
         "keys_data": keys_data,
@@ -133,31 +181,40 @@ async def preload_notification_data(session: AsyncSession) -> dict[str, Any]:
     }
 
 
+async def load_all_active_keys(session: AsyncSession) -> list:
+    keys = []
+    async for rows in stream_active_keys(session):
+        keys.extend(key for key, _ in rows)
+    return keys
+
+
 async def execute_bulk_updates(session: AsyncSession, bulk_updates: dict[str, Any]) -> None:
     try:
         if bulk_updates["balance_changes"]:
-            for tg_id, balance_change in bulk_updates["balance_changes"].items():
-                await session.execute(
-                    text("UPDATE users SET balance = balance + :change WHERE tg_id = :tg_id"),
-                    {"change": balance_change, "tg_id": tg_id},
-                )
+            await bulk_update_balances(session, bulk_updates["balance_changes"])
             logger.info(f"Bulk: обновлено {len(bulk_updates['balance_changes'])} балансов")
 
         if bulk_updates["key_expiry_updates"]:
-            for client_id, new_expiry in bulk_updates["key_expiry_updates"]:
-                await session.execute(update(Key).where(Key.client_id == client_id).values(expiry_time=new_expiry))
+            await bulk_update_key_expiry(session, bulk_updates["key_expiry_updates"])
             logger.info(f"Bulk: обновлено {len(bulk_updates['key_expiry_updates'])} сроков действия ключей")
 
         if bulk_updates["key_tariff_updates"]:
-            for client_id, new_tariff_id in bulk_updates["key_tariff_updates"]:
-                await session.execute(update(Key).where(Key.client_id == client_id).values(tariff_id=new_tariff_id))
+            await bulk_update_key_tariff(session, bulk_updates["key_tariff_updates"])
             logger.info(f"Bulk: обновлено {len(bulk_updates['key_tariff_updates'])} тарифов ключей")
 
-        for tg_id, notification_type in bulk_updates["notifications_to_add"]:
-            await add_notification(session, tg_id, notification_type)
+        if bulk_updates.get("key_limit_resets"):
+            by_values = {}
+            for client_id, reset_values in bulk_updates["key_limit_resets"]:
+                by_values.setdefault(tuple(sorted(reset_values.items())), []).append(client_id)
+            for reset_values, client_ids in by_values.items():
+                await bulk_update_keys(session, client_ids, dict(reset_values))
+            logger.info(f"Bulk: сброшены лимиты {len(bulk_updates['key_limit_resets'])} ключей")
+
+        if bulk_updates["notifications_to_add"]:
+            await bulk_add_notifications(session, bulk_updates["notifications_to_add"])
 
-        for tg_id, notification_type in bulk_updates["notifications_to_delete"]:
-            await delete_notification(session, tg_id, notification_type)
+        if bulk_updates["notifications_to_delete"]:
+            await bulk_delete_notifications(session, bulk_updates["notifications_to_delete"])
 
         if bulk_updates["notifications_to_add"] or bulk_updates["notifications_to_delete"]:
             logger.info(
@@ -177,7 +234,7 @@ async def send_expiry_warning(ctx: NotificationContext, key, hours_left: int, ph
     tg_id = key.tg_id
     email = key.email or ""
 
-    expiry_data = await prepare_key_expiry_data(key, ctx.session, ctx.current_time)
+    expiry_data = await prepare_key_expiry_data(key, ctx.session, ctx.current_time, ctx.get_tariff(key.tariff_id))
 
     message_text = KEY_EXPIRY.format(
         email=email,
@@ -195,7 +252,7 @@ async def send_cannot_renew(ctx: NotificationContext, key, photo: str) -> bool:
     tg_id = key.tg_id
     email = key.email or ""
 
-    expiry_data = await prepare_key_expiry_data(key, ctx.session, ctx.current_time)
+    expiry_data = await prepare_key_expiry_data(key, ctx.session, ctx.current_time, ctx.get_tariff(key.tariff_id))
 
     message_text = KEY_CANNOT_RENEW_CURRENT.format(
         email=email,
@@ -252,6 +309,7 @@ async def send_renewed_notification(ctx: NotificationContext, key, tariff: dict,
         tariff_id=int(tariff["id"]),
         selected_device_limit=int(selected_device_limit) if selected_device_limit is not None else None,
         selected_traffic_gb=selected_traffic_gb,
+        tariff=tariff,
     )
     traffic_limit_gb = int(traffic_limit_bytes_effective / GB) if traffic_limit_bytes_effective else 0
 
@@ -280,37 +338,28 @@ async def send_renewed_notification(ctx: NotificationContext, key, tariff: dict,
     return result
 
 
-async def try_auto_renew(ctx: NotificationContext, key) -> tuple[bool, Optional[dict], Optional[int]]:
+async def plan_auto_renew(ctx: NotificationContext, key) -> Optional[RenewalJob]:
+    """Решает, можно ли продлить ключ с баланса, без обращений к панелям. Резервирует сумму списания."""
     tg_id = key.tg_id
     email = key.email or ""
     renew_notification_id = f"{email}_renew"
 
-    can_renew = await check_notification_time(ctx.session, tg_id, renew_notification_id, hours=24)
-    if not can_renew:
+    if not ctx.notification_due(tg_id, renew_notification_id, hours=24):
         logger.debug(f"⏳ Подписка {email} уже продлевалась в течение последних 24 часов.")
-        return False, None, None
+        return None
 
-    if ctx.preload_data and tg_id in ctx.preload_data.get("balances_cache", {}):
-        balance = ctx.preload_data["balances_cache"][tg_id]
-    else:
-        balance = await get_balance(ctx.session, tg_id)
+    balance = ctx.get_balance(tg_id)
 
     server_id = key.server_id
     tariff_id = key.tariff_id
 
-    tariffs = await get_tariffs_for_cluster(ctx.session, server_id)
-    if not tariffs:
+    if not ctx.cluster_tariffs.get(server_id):
         logger.warning(f"⛔ Нет доступных тарифов для продления подписки {email}")
-        return False, None, None
-
-    current_tariff = None
-    if tariff_id:
-        current_tariff = ctx.get_tariff(tariff_id)
-        if not current_tariff and await check_tariff_exists(ctx.session, tariff_id):
-            current_tariff = await get_tariff_by_id(ctx.session, tariff_id)
+        return None
 
+    current_tariff = ctx.get_tariff(tariff_id) if tariff_id else None
     if not current_tariff:
-        return False, None, None
+        return None
 
     forbidden_groups = ["discounts", "discounts_max", "gifts", "trial"]
     try:
@@ -322,7 +371,7 @@ async def try_auto_renew(ctx: NotificationContext, key) -> tuple[bool, Optional[
         logger.warning(f"[AUTO_RENEW] Ошибка при получении дополнительных групп: {error}")
 
     if current_tariff["group_code"] in forbidden_groups:
-        return False, None, None
+        return None
 
     renewal_cost = await resolve_price_to_charge(
         ctx.session,
@@ -332,12 +381,12 @@ async def try_auto_renew(ctx: NotificationContext, key) -> tuple[bool, Optional[
             "selected_traffic_limit": getattr(key, "selected_traffic_limit", None),
             "selected_price_rub": getattr(key, "selected_price_rub", None),
         },
+        tariff=current_tariff,
     )
 
     if renewal_cost is None or balance < renewal_cost:
-        return False, None, None
+        return None
 
-    client_id = key.client_id
     current_expiry = key.expiry_time
     duration_days = current_tariff["duration_days"]
 
@@ -350,6 +399,7 @@ async def try_auto_renew(ctx: NotificationContext, key) -> tuple[bool, Optional[
         tariff_id=int(current_tariff["id"]),
         selected_device_limit=int(selected_device_limit) if selected_device_limit is not None else None,
         selected_traffic_gb=selected_traffic_gb,
+        tariff=current_tariff,
     )
     traffic_limit_gb = int(traffic_limit_bytes_effective / GB) if traffic_limit_bytes_effective else 0
 
@@ -364,21 +414,25 @@ async def try_auto_renew(ctx: NotificationContext, key) -> tuple[bool, Optional[
         f"Баланс: {balance}, списываем: {renewal_cost}"
     )
 
-    key_subgroup = current_tariff.get("subgroup_title")
-
-    await renew_key_in_cluster(
-        cluster_id=server_id,
-        email=email,
-        client_id=client_id,
+    ctx.reserve_balance(tg_id, renewal_cost)
+    return RenewalJob(
+        key=key,
+        tariff=current_tariff,
+        cost=renewal_cost,
         new_expiry_time=int(new_expiry_time),
-        total_gb=traffic_limit_gb,
-        hwid_device_limit=device_limit_effective,
-        session=ctx.session,
-        target_subgroup=key_subgroup,
-        old_subgroup=key_subgroup,
-        plan=current_tariff["id"],
+        traffic_limit_gb=traffic_limit_gb,
+        device_limit=device_limit_effective,
     )
 
+
+async def apply_auto_renew(ctx: NotificationContext, job: RenewalJob) -> None:
+    """Записывает результат успешного продления: списание, срок, тариф, сброс лимитов."""
+    key = job.key
+    tg_id = key.tg_id
+    client_id = key.client_id
+    renew_notification_id = f"{key.email or ''}_renew"
+    current_tariff = job.tariff
+
     new_tariff_device_limit = current_tariff.get("device_limit")
     new_tariff_traffic_limit = current_tariff.get("traffic_limit")
     reset_values = {
@@ -388,24 +442,59 @@ async def try_auto_renew(ctx: NotificationContext, key) -> tuple[bool, Optional[
         "current_traffic_limit": new_tariff_traffic_limit,
         "selected_price_rub": int(current_tariff["price_rub"]) if current_tariff.get("price_rub") is not None else None,
     }
-    await ctx.session.execute(update(Key).where(Key.client_id == client_id).values(**reset_values))
+    ctx.release_balance(tg_id, job.cost)
+    ctx.mark_notified(tg_id, renew_notification_id)
 
     if ctx.bulk_updates is not None:
-        if tg_id in ctx.bulk_updates["balance_changes"]:
-            ctx.bulk_updates["balance_changes"][tg_id] -= renewal_cost
-        else:
-            ctx.bulk_updates["balance_changes"][tg_id] = -renewal_cost
-
-        ctx.bulk_updates["key_expiry_updates"].append((client_id, int(new_expiry_time)))
+        ctx.bulk_updates["balance_changes"][tg_id] = ctx.bulk_updates["balance_changes"].get(tg_id, 0) - job.cost
+        ctx.bulk_updates["key_expiry_updates"].append((client_id, job.new_expiry_time))
         ctx.bulk_updates["key_tariff_updates"].append((client_id, current_tariff["id"]))
+        ctx.bulk_updates["key_limit_resets"].append((client_id, reset_values))
         ctx.bulk_updates["notifications_to_add"].append((tg_id, renew_notification_id))
     else:
-        await update_balance(ctx.session, tg_id, -renewal_cost)
-        await update_key_expiry(ctx.session, client_id, int(new_expiry_time))
+        await ctx.session.execute(update(Key).where(Key.client_id == client_id).values(**reset_values))
+        await update_balance(ctx.session, tg_id, -job.cost)
+        ctx.balances[tg_id] = ctx.balances.get(tg_id, 0.0) - job.cost
+        await update_key_expiry(ctx.session, client_id, job.new_expiry_time)
         await update_key_tariff(ctx.session, client_id, current_tariff["id"])
         await add_notification(ctx.session, tg_id, renew_notification_id)
 
-    return True, current_tariff, int(new_expiry_time)
+
+async def run_auto_renewals(ctx: NotificationContext, keys: list) -> tuple[dict[str, RenewalJob], set[str]]:
+    """
+    Пачечное автопродление: сначала решения по всем ключам в памяти, затем параллельные
+    вызовы панелей через RenewalExecutor, затем запись результатов.
+    Возвращает задания по client_id и client_id ключей, на которых произошла ошибка.
+    """
+    jobs = {}
+    errors = set()
+    for key in keys:
+        try:
+            job = await plan_auto_renew(ctx, key)
+        except Exception as error:
+            logger.error(f"Ошибка авто-продления для пользователя {key.tg_id}: {error}")
+            errors.add(key.client_id)
+            continue
+        if job:
+            jobs[key.client_id] = job
+
+    executor = RenewalExecutor(ctx.session, ctx.sessionmaker)
+    await executor.run(list(jobs.values()))
+
+    for client_id, job in jobs.items():
+        if not job.ok:
+            ctx.release_balance(job.key.tg_id, job.cost)
+            if job.error:
+                errors.add(client_id)
+            continue
+        try:
+            await apply_auto_renew(ctx, job)
+        except Exception as error:
+            logger.error(f"Ошибка записи авто-продления для пользователя {job.key.tg_id}: {error}")
+            job.ok = False
+            errors.add(client_id)
+
+    return jobs, errors
 
 
 async def notify_expiring_keys(
@@ -435,37 +524,42 @@ async def notify_expiring_keys(
     emails = [key.email or "" for key in expiring_keys]
     allowed = await check_notifications_bulk(ctx.session, notify_type, max_hours, tg_ids=tg_ids, emails=emails)
     allowed_set = {(user["tg_id"], user["email"]) for user in allowed}
+    expiring_keys = [key for key in expiring_keys if (key.tg_id, key.email or "") in allowed_set]
+
+    await load_batch_state(ctx, expiring_keys, (notify_type, "renew") if notify_renew_enabled else (notify_type,))
+
+    due_keys = [
+        key for key in expiring_keys if ctx.notification_due(key.tg_id, f"{key.email or ''}_{notify_type}", max_hours)
+    ]
+
+    renewals, renew_errors = {}, set()
+    if notify_renew_enabled:
+        renewals, renew_errors = await run_auto_renewals(ctx, due_keys)
 
     messages = []
 
-    for key in expiring_keys:
+    for key in due_keys:
         tg_id = key.tg_id
         email = key.email or ""
-
-        if (tg_id, email) not in allowed_set:
-            continue
-
         notification_id = f"{email}_{notify_type}"
 
-        can_notify = await check_notification_time(ctx.session, tg_id, notification_id, hours=max_hours)
-        if not can_notify:
-            continue
-
         if notify_renew_enabled:
+            if key.client_id in renew_errors:
+                continue
             try:
-                renewed, tariff, new_expiry = await try_auto_renew(ctx, key)
-
-                if renewed and tariff and new_expiry:
-                    await send_renewed_notification(ctx, key, tariff, new_expiry)
-                    await add_notification(ctx.session, tg_id, notification_id)
+                job = renewals.get(key.client_id)
+                if job and job.ok:
+                    await send_renewed_notification(ctx, key, job.tariff, job.new_expiry_time)
                 else:
                     await send_cannot_renew(ctx, key, photo)
-                    await add_notification(ctx.session, tg_id, notification_id)
+                await add_notification(ctx.session, tg_id, notification_id)
 
             except Exception as error:
                 logger.error(f"Ошибка авто-продления/уведомления для пользователя {tg_id}: {error}")
         else:
-            expiry_data = await prepare_key_expiry_data(key, ctx.session, ctx.current_time)
+            expiry_data = await prepare_key_expiry_data(
+                key, ctx.session, ctx.current_time, ctx.get_tariff(key.tariff_id)
+            )
             notification_text = KEY_EXPIRY.format(
                 email=email,
                 hours_left_formatted=expiry_data["hours_left_formatted"],
@@ -514,6 +608,14 @@ async def handle_expired_keys(ctx: NotificationContext, keys: list):
     notify_delete_key_enabled = bool(NOTIFICATIONS_CONFIG.get("DELETE_KEY_ENABLED", NOTIFY_DELETE_KEY))
     delete_key_delay_minutes = int(NOTIFICATIONS_CONFIG.get("DELETE_KEY_DELAY_MINUTES", NOTIFY_DELETE_DELAY))
 
+    await load_batch_state(
+        ctx, expired_keys, ("key_expired", "renew") if notify_renew_expired_enabled else ("key_expired",)
+    )
+
+    renewals, renew_errors = {}, set()
+    if notify_renew_expired_enabled:
+        renewals, renew_errors = await run_auto_renewals(ctx, expired_keys)
+
     for key in expired_keys:
         tg_id = key.tg_id
         email = key.email or ""
@@ -521,22 +623,22 @@ async def handle_expired_keys(ctx: NotificationContext, keys: list):
         server_id = key.server_id
         notification_id = f"{email}_key_expired"
 
-        last_notification_time = await get_last_notification_time(ctx.session, tg_id, notification_id)
+        last_notification_time = ctx.last_notification_ms(tg_id, notification_id)
 
         if notify_renew_expired_enabled:
-            try:
-                renewed, tariff, new_expiry = await try_auto_renew(ctx, key)
+            if client_id in renew_errors:
+                continue
 
-                if renewed and tariff and new_expiry:
-                    await send_renewed_notification(ctx, key, tariff, new_expiry)
+            job = renewals.get(client_id)
+            if job and job.ok:
+                try:
+                    await send_renewed_notification(ctx, key, job.tariff, job.new_expiry_time)
                     if ctx.bulk_updates:
                         ctx.bulk_updates["notifications_to_delete"].append((tg_id, notification_id))
                     else:
                         await delete_notification(ctx.session, tg_id, notification_id)
-                    continue
-
-            except Exception as error:
-                logger.error(f"Ошибка авто-продления для пользователя {tg_id}: {error}")
+                except Exception as error:
+                    logger.error(f"Ошибка уведомления о продлении для пользователя {tg_id}: {error}")
                 continue
 
         if notify_delete_key_enabled:
@@ -585,13 +687,24 @@ async def periodic_notifications(bot: Bot, *, sessionmaker: async_sessionmaker):
                     current_time = int(datetime.now(moscow_tz).timestamp() * 1000)
                     start_time = datetime.now()
 
+                    notify_24_enabled = bool(NOTIFICATIONS_CONFIG.get("EXPIRY_24H_ENABLED", NOTIFY_24H_ENABLED))
+                    notify_24_hours = int(NOTIFICATIONS_CONFIG.get("EXPIRY_24H_BEFORE_HOURS", NOTIFY_24H_HOURS))
+                    notify_10_enabled = bool(NOTIFICATIONS_CONFIG.get("EXPIRY_10H_ENABLED", NOTIFY_10H_ENABLED))
+                    notify_10_hours = int(NOTIFICATIONS_CONFIG.get("EXPIRY_10H_BEFORE_HOURS", NOTIFY_10H_HOURS))
+
+                    window_hours = max(
+                        notify_24_hours if notify_24_enabled else 0,
+                        notify_10_hours if notify_10_enabled else 0,
+                    )
+                    expiry_before = int((datetime.now(moscow_tz) + timedelta(hours=window_hours)).timestamp() * 1000)
+
                     try:
-                        preload_data = await preload_notification_data(session)
+                        preload_data = await preload_notification_data(session, expiry_before=expiry_before)
                         keys_data = preload_data["keys_data"]
                         keys = [data["key"] for data in keys_data.values()]
                         preload_time = (datetime.now() - start_time).total_seconds()
                         logger.info(
-                            f"Предзагружено данных: {len(keys)} ключей, "
+                            f"Предзагружено данных: {len(keys)} ключей в окне {window_hours}ч, "
                             f"{len(preload_data['tariffs_cache'])} тарифов за {preload_time:.2f}s"
                         )
 
@@ -599,15 +712,19 @@ async def periodic_notifications(bot: Bot, *, sessionmaker: async_sessionmaker):
                             "balance_changes": {},
                             "key_expiry_updates": [],
                             "key_tariff_updates": [],
+                            "key_limit_resets": [],
                             "notifications_to_add": [],
                             "notifications_to_delete": [],
                         }
 
                     except Exception as error:
                         logger.error(f"Ошибка при предварительной загрузке данных: {error}")
+                        await session.rollback()
                         try:
                             keys = await get_all_keys(session=session)
-                            keys = [k for k in keys if not k.is_frozen]
+                            keys = [
+                                k for k in keys if not k.is_frozen and k.expiry_time and k.expiry_time <= expiry_before
+                            ]
                             preload_data = None
                             bulk_updates = None
                             preload_time = (datetime.now() - start_time).total_seconds()
@@ -624,6 +741,7 @@ async def periodic_notifications(bot: Bot, *, sessionmaker: async_sessionmaker):
                         current_time=current_time,
                         preload_data=preload_data,
                         bulk_updates=bulk_updates,
+                        sessionmaker=sessionmaker,
                     )
 
                     trial_time_disable = bool(MODES_CONFIG.get("TRIAL_TIME_DISABLED", TRIAL_TIME_DISABLE))
@@ -633,10 +751,6 @@ async def periodic_notifications(bot: Bot, *, sessionmaker: async_sessionmaker):
                         except Exception as error:
                             logger.error(f"Ошибка в notify_inactive_trial_users: {error}")
 
-                    notify_24_enabled = bool(NOTIFICATIONS_CONFIG.get("EXPIRY_24H_ENABLED", NOTIFY_24H_ENABLED))
-                    notify_24_hours = int(NOTIFICATIONS_CONFIG.get("EXPIRY_24H_BEFORE_HOURS", NOTIFY_24H_HOURS))
-                    notify_10_enabled = bool(NOTIFICATIONS_CONFIG.get("EXPIRY_10H_ENABLED", NOTIFY_10H_ENABLED))
-                    notify_10_hours = int(NOTIFICATIONS_CONFIG.get("EXPIRY_10H_BEFORE_HOURS", NOTIFY_10H_HOURS))
                     notify_renew_enabled = bool(NOTIFICATIONS_CONFIG.get("RENEW_ENABLED", NOTIFY_RENEW))
                     inactive_traffic_enabled = bool(
                         NOTIFICATIONS_CONFIG.get("INACTIVE_TRAFFIC_ENABLED", NOTIFY_INACTIVE_TRAFFIC)
@@ -678,12 +792,14 @@ async def periodic_notifications(bot: Bot, *, sessionmaker: async_sessionmaker):
 
                     if inactive_traffic_enabled:
                         try:
-                            await notify_users_no_traffic(bot, session, current_time, keys)
+                            await notify_users_no_traffic(bot, session, current_time)
                         except Exception as error:
                             logger.error(f"Ошибка в notify_users_no_traffic: {error}")
 
                     try:
-                        await run_hooks("periodic_notifications", bot=bot, session=session, keys=keys)
+                        if has_hooks("periodic_notifications"):
+                            all_keys = await load_all_active_keys(session)
+                            await run_hooks("periodic_notifications", bot=bot, session=session, keys=all_keys)
                     except Exception as error:
                         logger.error(f"Ошибка в хуках periodic_notifications: {error}")
 
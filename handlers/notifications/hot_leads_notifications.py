@@ -18,6 +18,7 @@ from handlers.texts import (
     HOT_LEAD_MESSAGE,
 )
 from logger import logger
+from utils.send_scheduler import SendPriority
 
 
 async def notify_hot_leads(bot: Bot, session: AsyncSession):
@@ -61,7 +62,9 @@ async def notify_hot_leads(bot: Bot, session: AsyncSession):
                     continue
 
                 keyboard = build_hot_lead_kb()
-                result = await send_notification(bot, tg_id, None, HOT_LEAD_MESSAGE, keyboard)
+                result = await send_notification(
+                    bot, tg_id, None, HOT_LEAD_MESSAGE, keyboard, priority=SendPriority.MARKETING
+                )
                 if result:
                     await add_notification(session, tg_id, "hot_lead_step_2")
                     logger.info(f"Шаг 2 — отправлено первое уведомление: {tg_id}")
@@ -93,6 +96,7 @@ async def notify_hot_leads(bot: Bot, session: AsyncSession):
                         None,
                         HOT_LEAD_LOST_OPPORTUNITY,
                         builder.as_markup(),
+                        priority=SendPriority.MARKETING,
                     )
                     if result:
                         await add_notification(session, tg_id, "hot_lead_step_2_expired")
@@ -118,7 +122,9 @@ async def notify_hot_leads(bot: Bot, session: AsyncSession):
                     continue
 
                 keyboard = build_hot_lead_kb(final=True)
-                result = await send_notification(bot, tg_id, None, HOT_LEAD_FINAL_MESSAGE, keyboard)
+                result = await send_notification(
+                    bot, tg_id, None, HOT_LEAD_FINAL_MESSAGE, keyboard, priority=SendPriority.MARKETING
+                )
                 if result:
                     await add_notification(session, tg_id, "hot_lead_step_3")
                     logger.info(f"⚡ Шаг 3 — отправлено финальное уведомление: {tg_id}")
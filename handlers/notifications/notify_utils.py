@@ -2,10 +2,8 @@ import asyncio
 import os
 import time
 
-from collections import deque
 from datetime import datetime
 
-import aiofiles
 import pytz
 
 from aiogram import Bot
@@ -14,44 +12,20 @@ from aiogram.exceptions import (
     TelegramForbiddenError,
     TelegramRetryAfter,
 )
-from aiogram.types import BufferedInputFile, InlineKeyboardMarkup
+from aiogram.types import InlineKeyboardMarkup
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import create_blocked_user
 from handlers.tariffs.tariff_display import get_key_tariff_display
 from handlers.utils import format_hours, format_minutes, get_russian_month
 from logger import logger
+from utils.media_cache import send_with_cached_media
+from utils.send_scheduler import SendPriority, send_priority
 
 
 moscow_tz = pytz.timezone("Europe/Moscow")
 
 
-class NotificationRateLimiter:
-    def __init__(self, max_rate: int = 35, window: float = 1.0) -> None:
-        self.max_rate = max_rate
-        self.window = window
-        self.send_times = deque()
-        self.lock = asyncio.Lock()
-
-    def _clean_old_timestamps(self, current_time: float):
-        cutoff_time = current_time - self.window
-        while self.send_times and self.send_times[0] <= cutoff_time:
-            self.send_times.popleft()
-
-    async def acquire(self):
-        async with self.lock:
-            while True:
-                now = time.time()
-                self._clean_old_timestamps(now)
-                if len(self.send_times) < self.max_rate:
-                    self.send_times.append(now)
-                    return
-                oldest_timestamp = self.send_times[0]
-                time_to_wait = (oldest_timestamp + self.window) - now
-                if time_to_wait > 0:
-                    await asyncio.sleep(time_to_wait + 0.001)
-
-
 class NotificationMessage:
     def __init__(self, tg_id: int, text: str, photo: str | None = None, keyboard=None) -> None:
         self.tg_id = tg_id
@@ -63,10 +37,10 @@ class NotificationMessage:
 
 
 class FastNotificationSender:
-    def __init__(self, bot: Bot, session: AsyncSession | None, messages_per_second: int = 35) -> None:
+    def __init__(self, bot: Bot, session: AsyncSession | None, priority: SendPriority = SendPriority.EXPIRY) -> None:
         self.bot = bot
         self.session = session
-        self.rate_limiter = NotificationRateLimiter(max_rate=messages_per_second)
+        self.priority = priority
         self.blocked_users = set()
         self.queue = asyncio.Queue()
         self.delayed_queue = asyncio.Queue()
@@ -76,16 +50,15 @@ class FastNotificationSender:
 
     async def _send_single_message(self, msg: NotificationMessage) -> bool:
         try:
-            await self.rate_limiter.acquire()
-
             if msg.photo:
                 photo_path = os.path.join("img", msg.photo)
                 if os.path.isfile(photo_path):
-                    async with aiofiles.open(photo_path, "rb") as f:
-                        image_data = await f.read()
-                    buffered_photo = BufferedInputFile(image_data, filename=msg.photo)
-                    await self.bot.send_photo(
-                        chat_id=msg.tg_id, photo=buffered_photo, caption=msg.text, reply_markup=msg.keyboard
+                    await send_with_cached_media(
+                        self.bot,
+                        photo_path,
+                        lambda photo: self.bot.send_photo(
+                            chat_id=msg.tg_id, photo=photo, caption=msg.text, reply_markup=msg.keyboard
+                        ),
                     )
                 else:
                     await self.bot.send_message(chat_id=msg.tg_id, text=msg.text, reply_markup=msg.keyboard)
@@ -181,8 +154,10 @@ class FastNotificationSender:
             )
             await self.queue.put(msg)
 
-        worker_tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
-        delayed_task = asyncio.create_task(self._process_delayed_messages())
+        # Скорость задаёт общий send_scheduler, воркеры лишь передают ему приоритет
+        with send_priority(self.priority):
+            worker_tasks = [asyncio.create_task(self._worker()) for _ in range(workers)]
+            delayed_task = asyncio.create_task(self._process_delayed_messages())
 
         await self.queue.join()
 
@@ -211,9 +186,9 @@ async def send_messages_with_limit(
     messages: list[dict],
     session: AsyncSession = None,
     source_file: str = None,
-    messages_per_second: int = 35,
+    priority: SendPriority = SendPriority.EXPIRY,
 ):
-    sender = FastNotificationSender(bot, session, messages_per_second)
+    sender = FastNotificationSender(bot, session, priority)
     return await sender.send_all(messages)
 
 
@@ -257,16 +232,18 @@ async def send_notification(
     image_filename: str | None,
     caption: str,
     keyboard: InlineKeyboardMarkup | None = None,
+    priority: SendPriority = SendPriority.EXPIRY,
 ) -> bool:
-    if image_filename is None:
-        return await _send_text_notification(bot, tg_id, caption, keyboard)
+    with send_priority(priority):
+        if image_filename is None:
+            return await _send_text_notification(bot, tg_id, caption, keyboard)
 
-    photo_path = os.path.join("img", image_filename)
-    if os.path.isfile(photo_path):
-        return await _send_photo_notification(bot, tg_id, photo_path, image_filename, caption, keyboard)
-    else:
-        logger.warning(f"Файл с изображением не найден: {photo_path}")
-        return await _send_text_notification(bot, tg_id, caption, keyboard)
+        photo_path = os.path.join("img", image_filename)
+        if os.path.isfile(photo_path):
+            return await _send_photo_notification(bot, tg_id, photo_path, image_filename, caption, keyboard)
+        else:
+            logger.warning(f"Файл с изображением не найден: {photo_path}")
+            return await _send_text_notification(bot, tg_id, caption, keyboard)
 
 
 @rate_limited_send
@@ -279,10 +256,11 @@ async def _send_photo_notification(
     keyboard: InlineKeyboardMarkup | None = None,
 ) -> bool:
     try:
-        async with aiofiles.open(photo_path, "rb") as image_file:
-            image_data = await image_file.read()
-        buffered_photo = BufferedInputFile(image_data, filename=image_filename)
-        await bot.send_photo(tg_id, buffered_photo, caption=caption, reply_markup=keyboard)
+        await send_with_cached_media(
+            bot,
+            photo_path,
+            lambda photo: bot.send_photo(tg_id, photo, caption=caption, reply_markup=keyboard),
+        )
         return True
     except (TelegramForbiddenError, TelegramBadRequest):
         return False
@@ -308,8 +286,8 @@ async def _send_text_notification(
         return False
 
 
-async def prepare_key_expiry_data(key, session: AsyncSession, current_time: int) -> dict:
-    """Готовит данные об истечении подписки для уведомлений."""
+async def prepare_key_expiry_data(key, session: AsyncSession, current_time: int, tariff: dict | None = None) -> dict:
+    """Готовит данные об истечении подписки для уведомлений. tariff — уже загруженная строка тарифа ключа."""
     if isinstance(key, dict):
         expiry_timestamp = key.get("expiry_time")
         email = key.get("email") or ""
@@ -361,6 +339,7 @@ async def prepare_key_expiry_data(key, session: AsyncSession, current_time: int)
         name, subgroup_title, traffic_limit_gb, device_limit, _ = await get_key_tariff_display(
             session=session,
             key_record=record,
+            tariff=tariff,
         )
         if name:
             tariff_name = name
@@ -0,0 +1,187 @@
+import asyncio
+import time
+
+from collections import defaultdict, deque
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.bootstrap import NOTIFICATIONS_CONFIG
+from database import get_servers
+from handlers.keys.operations import renew_key_in_cluster
+from handlers.keys.operations.renewal import panel_latency_sink
+from logger import logger
+
+
+RENEW_PANEL_CONCURRENCY = 4
+RENEW_MAX_CONCURRENCY = 16
+
+_last_metrics: dict[str, Any] = {}
+
+
+@dataclass
+class RenewalJob:
+    key: Any
+    tariff: dict
+    cost: float
+    new_expiry_time: int
+    traffic_limit_gb: int
+    device_limit: int
+    ok: bool = False
+    error: Exception | None = None
+    duration: float = 0.0
+
+
+def get_renewal_metrics() -> dict[str, Any]:
+    """Метрики последнего прогона автопродления: скорость продлений и задержка вызовов по панелям (api_url)."""
+    return dict(_last_metrics)
+
+
+def _fair_order(jobs: list[RenewalJob]) -> list[RenewalJob]:
+    """Чередует задания по кластерам, чтобы большой кластер не забирал всю очередь."""
+    by_cluster: dict[str, deque] = defaultdict(deque)
+    for job in jobs:
+        by_cluster[job.key.server_id].append(job)
+
+    ordered = []
+    queues = deque(by_cluster.values())
+    while queues:
+        queue = queues.popleft()
+        ordered.append(queue.popleft())
+        if queue:
+            queues.append(queue)
+    return ordered
+
+
+def _cluster_panels(servers: dict[str, list[dict]], cluster_id: str) -> list[str]:
+    cluster = servers.get(cluster_id)
+    if not cluster:
+        cluster = [s for cl in servers.values() for s in cl if s.get("server_name") == cluster_id]
+    return sorted({s["api_url"] for s in cluster if s.get("api_url")})
+
+
+class RenewalExecutor:
+    """
+    Выполняет решённые продления параллельно: на каждую панель (api_url) не больше
+    panel_limit одновременных продлений, всего не больше max_concurrency.
+    Каждое продление идёт в своей сессии, так как renew_key_in_cluster пишет в БД.
+    Без sessionmaker продления выполняются последовательно в общей сессии.
+    """
+
+    def __init__(
+        self,
+        session: AsyncSession,
+        sessionmaker: async_sessionmaker | None = None,
+        panel_limit: int | None = None,
+        max_concurrency: int | None = None,
+    ) -> None:
+        self.session = session
+        self.sessionmaker = sessionmaker
+        self.panel_limit = max(
+            1, panel_limit or int(NOTIFICATIONS_CONFIG.get("RENEW_PANEL_CONCURRENCY", RENEW_PANEL_CONCURRENCY))
+        )
+        if sessionmaker is None:
+            self.max_concurrency = 1
+        else:
+            self.max_concurrency = max(
+                1, max_concurrency or int(NOTIFICATIONS_CONFIG.get("RENEW_MAX_CONCURRENCY", RENEW_MAX_CONCURRENCY))
+            )
+        self._panel_semaphores: dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(self.panel_limit))
+        # Задержка самих вызовов продления на панели, по api_url
+        self._panel_latencies: dict[str, list[float]] = defaultdict(list)
+
+    async def run(self, jobs: list[RenewalJob]) -> list[RenewalJob]:
+        if not jobs:
+            return jobs
+
+        servers = await get_servers(self.session)
+        queue = deque(_fair_order(jobs))
+        started = time.perf_counter()
+        # Воркеры запускаются после установки и наследуют контекст с приёмником задержек
+        sink_token = panel_latency_sink.set(self._record_panel_latency)
+
+        async def worker():
+            while queue:
+                job = queue.popleft()
+                await self._execute(job, _cluster_panels(servers, job.key.server_id))
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(self.max_concurrency, len(jobs)))))
+        finally:
+            panel_latency_sink.reset(sink_token)
+        self._record_metrics(jobs, time.perf_counter() - started)
+        return jobs
+
+    async def _execute(self, job: RenewalJob, panels: list[str]) -> None:
+        async with AsyncExitStack() as stack:
+            for api_url in panels:
+                await stack.enter_async_context(self._panel_semaphores[api_url])
+
+            start = time.perf_counter()
+            try:
+                if self.sessionmaker is None:
+                    job.ok = await self._renew(job, self.session)
+                else:
+                    async with self.sessionmaker() as session:
+                        job.ok = await self._renew(job, session)
+            except Exception as error:
+                job.error = error
+                logger.error(f"[AUTO_RENEW] Ошибка продления {job.key.email} на панелях: {error}")
+            finally:
+                job.duration = time.perf_counter() - start
+
+    def _record_panel_latency(self, api_url: str, seconds: float) -> None:
+        self._panel_latencies[api_url].append(seconds)
+
+    @staticmethod
+    async def _renew(job: RenewalJob, session: AsyncSession) -> bool:
+        key = job.key
+        subgroup = job.tariff.get("subgroup_title")
+        return bool(
+            await renew_key_in_cluster(
+                cluster_id=key.server_id,
+                email=key.email or "",
+                client_id=key.client_id,
+                new_expiry_time=job.new_expiry_time,
+                total_gb=job.traffic_limit_gb,
+                hwid_device_limit=job.device_limit,
+                session=session,
+                target_subgroup=subgroup,
+                old_subgroup=subgroup,
+                plan=job.tariff["id"],
+            )
+        )
+
+    def _record_metrics(self, jobs: list[RenewalJob], elapsed: float) -> None:
+        renewed = sum(1 for job in jobs if job.ok)
+        panels = {}
+        for api_url, samples in self._panel_latencies.items():
+            samples = sorted(samples)
+            panels[api_url] = {
+                "calls": len(samples),
+                "avg_ms": round(sum(samples) / len(samples) * 1000, 1),
+                "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1),
+                "max_ms": round(samples[-1] * 1000, 1),
+            }
+
+        _last_metrics.clear()
+        _last_metrics.update({
+            "total": len(jobs),
+            "renewed": renewed,
+            "failed": len(jobs) - renewed,
+            "elapsed_sec": round(elapsed, 2),
+            "renewals_per_sec": round(renewed / elapsed, 2) if elapsed > 0 else 0.0,
+            "panels": panels,
+        })
+
+        logger.info(
+            f"[AUTO_RENEW] Продлено {renewed}/{len(jobs)} за {elapsed:.2f}s "
+            f"({_last_metrics['renewals_per_sec']}/с, параллельно {self.max_concurrency}, на панель {self.panel_limit})"
+        )
+        for api_url, stats in panels.items():
+            logger.info(
+                f"[AUTO_RENEW] Панель {api_url}: вызовов {stats['calls']}, "
+                f"avg {stats['avg_ms']} мс, p95 {stats['p95_ms']} мс, max {stats['max_ms']} мс"
+            )
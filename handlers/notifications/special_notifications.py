@@ -5,7 +5,7 @@ import pytz
 from aiogram import Bot, Router, types
 from aiogram.types import InlineKeyboardButton, WebAppInfo
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import update
+from sqlalchemy import or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import (
@@ -18,10 +18,11 @@ from config import (
 )
 from core.bootstrap import MODES_CONFIG, NOTIFICATIONS_CONFIG
 from database import add_notification, check_notifications_bulk
+from database.db import BULK_CHUNK_SIZE
 from database.models import Key, User
 from database.tariffs import get_tariffs
 from handlers.buttons import CONNECT_DEVICE, MAIN_MENU, SUPPORT, TRIAL_BONUS
-from handlers.keys.operations import get_user_traffic
+from handlers.keys.operations import collect_traffic_snapshot
 from handlers.notifications.notify_utils import send_messages_with_limit
 from handlers.texts import (
     TRIAL_INACTIVE_BONUS_MSG,
@@ -32,6 +33,7 @@ from handlers.utils import format_days, is_full_remnawave_cluster
 from hooks.hook_buttons import insert_hook_buttons
 from hooks.hooks import run_hooks
 from logger import logger
+from utils.send_scheduler import SendPriority
 
 
 router = Router()
@@ -110,7 +112,7 @@ async def notify_inactive_trial_users(bot: Bot, session: AsyncSession):
             messages,
             session=session,
             source_file="special_notifications",
-            messages_per_second=25,
+            priority=SendPriority.MARKETING,
         )
 
         sent_tg_ids = []
@@ -126,7 +128,30 @@ async def notify_inactive_trial_users(bot: Bot, session: AsyncSession):
     logger.info("Проверка пользователей с неактивным пробным периодом завершена.")
 
 
-async def notify_users_no_traffic(bot: Bot, session: AsyncSession, current_time: int, keys: list):
+async def get_no_traffic_candidates(
+    session: AsyncSession, trial_tariff_ids: set[int], current_time: int, inactive_traffic_hours: int
+) -> list[Key]:
+    """Триальные ключи без отметки notified, созданные раньше порога и ещё не истекшие."""
+    created_before = current_time - inactive_traffic_hours * 60 * 60 * 1000
+    stmt = (
+        select(Key)
+        .where(
+            Key.is_frozen.is_(False),
+            Key.tariff_id.in_(trial_tariff_ids),
+            Key.notified.isnot(True),
+            Key.created_at <= created_before,
+            or_(Key.expiry_time.is_(None), Key.expiry_time >= current_time),
+        )
+        .execution_options(yield_per=BULK_CHUNK_SIZE)
+    )
+    keys = []
+    result = await session.stream_scalars(stmt)
+    async for partition in result.partitions():
+        keys.extend(partition)
+    return keys
+
+
+async def notify_users_no_traffic(bot: Bot, session: AsyncSession, current_time: int, keys: list | None = None):
     logger.info("Проверка пользователей с нулевым трафиком...")
     current_dt = datetime.fromtimestamp(current_time / 1000, tz=moscow_tz)
 
@@ -141,51 +166,51 @@ async def notify_users_no_traffic(bot: Bot, session: AsyncSession, current_time:
     if not trial_tariff_ids:
         return
 
+    if keys is None:
+        keys = await get_no_traffic_candidates(session, trial_tariff_ids, current_time, inactive_traffic_hours)
+
     remnawave_webapp_enabled = bool(MODES_CONFIG.get("REMNAWAVE_WEBAPP_ENABLED", REMNAWAVE_WEBAPP))
     open_in_browser = bool(MODES_CONFIG.get("REMNAWAVE_WEBAPP_OPEN_IN_BROWSER", REMNAWAVE_WEBAPP_OPEN_IN_BROWSER))
 
-    messages = []
-    keys_to_mark_notified = []
-
+    candidates = []
     for key in keys:
-        tg_id = key.tg_id
-        email = key.email
-        created_at = key.created_at
-        client_id = key.client_id
-        expiry_time = key.expiry_time
-        notified = key.notified
-        tariff_id = key.tariff_id
-
-        if tariff_id not in trial_tariff_ids:
+        if key.tariff_id not in trial_tariff_ids:
             continue
 
-        if created_at is None or notified:
+        if key.created_at is None or key.notified:
             continue
 
-        created_at_dt = pytz.utc.localize(datetime.fromtimestamp(created_at / 1000)).astimezone(moscow_tz)
+        created_at_dt = pytz.utc.localize(datetime.fromtimestamp(key.created_at / 1000)).astimezone(moscow_tz)
         if current_dt < created_at_dt + timedelta(hours=inactive_traffic_hours):
             continue
 
-        if expiry_time:
-            expiry_dt = pytz.utc.localize(datetime.fromtimestamp(expiry_time / 1000)).astimezone(moscow_tz)
+        if key.expiry_time:
+            expiry_dt = pytz.utc.localize(datetime.fromtimestamp(key.expiry_time / 1000)).astimezone(moscow_tz)
             if current_dt > expiry_dt:
                 continue
 
-        keys_to_mark_notified.append(client_id)
+        candidates.append(key)
 
-        try:
-            traffic_data = await get_user_traffic(session, tg_id, email)
-        except Exception as error:
-            logger.error(f"Ошибка получения трафика для {email}: {error}")
-            continue
+    if not candidates:
+        return
 
-        if traffic_data.get("status") != "success":
-            logger.warning(f"Ошибка при получении трафика для {email}: {traffic_data.get('message')}")
-            continue
+    traffic_snapshot = await collect_traffic_snapshot(session, {key.server_id for key in candidates})
 
-        total_traffic = sum(
-            value if isinstance(value, int | float) else 0 for value in traffic_data.get("traffic", {}).values()
-        )
+    messages = []
+    keys_to_mark_notified = []
+    missing_traffic = 0
+
+    for key in candidates:
+        tg_id = key.tg_id
+        email = key.email
+        client_id = key.client_id
+
+        keys_to_mark_notified.append(client_id)
+
+        total_traffic = traffic_snapshot.get(client_id)
+        if total_traffic is None:
+            missing_traffic += 1
+            continue
 
         if total_traffic == 0:
             logger.info(f"У пользователя {tg_id} ({email}) 0 ГБ трафика. Отправляем уведомление.")
@@ -232,6 +257,9 @@ async def notify_users_no_traffic(bot: Bot, session: AsyncSession, current_time:
                 "client_id": client_id,
             })
 
+    if missing_traffic:
+        logger.warning(f"Трафик не найден на панелях для {missing_traffic} ключей, уведомления пропущены")
+
     if keys_to_mark_notified:
         try:
             await session.execute(update(Key).where(Key.client_id.in_(keys_to_mark_notified)).values(notified=True))
@@ -246,7 +274,7 @@ async def notify_users_no_traffic(bot: Bot, session: AsyncSession, current_time:
             messages,
             session=session,
             source_file="special_notifications",
-            messages_per_second=25,
+            priority=SendPriority.MARKETING,
         )
         sent_count = sum(result for result in results if result)
         logger.info(f"Отправлено {sent_count} уведомлений о нулевом трафике.")
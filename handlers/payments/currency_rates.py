@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import time
 from decimal import ROUND_HALF_UP, Decimal
 from typing import Optional, Tuple
 
@@ -10,12 +9,13 @@ import sqlalchemy as sa
 from config import FX_MARKUP as DEFAULT_FX_MARKUP
 from config import RUB_TO_USD as DEFAULT_RUB_TO_USD
 from core.bootstrap import MONEY_CONFIG
+from utils.cache import BoundedCache
 
 
 CBR_URL = "https://www.cbr-xml-daily.ru/daily_json.js"
 CACHE_TTL = 60 * 30
 
-cache: dict[str, tuple[float, Decimal]] = {}
+cache = BoundedCache("currency_rates", maxsize=256, ttl=CACHE_TTL)
 
 
 def _q(x: Decimal, prec: int = 8) -> Decimal:
@@ -51,13 +51,12 @@ async def get_rub_rate(quote: str, *, session: aiohttp.ClientSession | None = No
 
     if code == "USD" and rub_to_usd_value > 0:
         rate = _q(Decimal("1") / Decimal(str(rub_to_usd_value)))
-        cache[code] = (time.time(), rate)
+        cache[code] = rate
         return rate
 
-    now = time.time()
     cached = cache.get(code)
-    if cached and now - cached[0] < CACHE_TTL:
-        return cached[1]
+    if cached is not None:
+        return cached
 
     owns = False
     s = session
@@ -90,7 +89,7 @@ async def get_rub_rate(quote: str, *, session: aiohttp.ClientSession | None = No
         pct = fx_markup_value / Decimal("100")
         rate = _q(rate * (Decimal("1") + pct))
 
-    cache[code] = (now, rate)
+    cache[code] = rate
     return rate
 
 
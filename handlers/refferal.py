@@ -1,9 +1,5 @@
 import os
 
-from io import BytesIO
-
-import qrcode
-
 from aiogram import F, Router
 from aiogram.enums import ParseMode
 from aiogram.fsm.context import FSMContext
@@ -16,7 +12,6 @@ from aiogram.types import (
     Message,
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from sqlalchemy import desc, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot import bot
@@ -26,9 +21,11 @@ from database import (
     add_referral,
     add_user,
     get_referral_by_referred_id,
+    get_referral_position,
     get_referral_stats,
+    get_top_referrals,
+    get_user_referral_count,
 )
-from database.models import Referral
 from database.tariffs import get_tariffs
 from handlers.buttons import BACK, INVITE, MAIN_MENU, QR, TOP_FIVE
 from handlers.payments.currency_rates import format_for_user
@@ -41,6 +38,7 @@ from handlers.texts import (
     TOP_REFERRALS_TEXT,
 )
 from logger import logger
+from utils.qr import send_qr_code
 
 from .texts import get_referral_link
 from .utils import edit_or_send_message, format_days
@@ -162,32 +160,17 @@ async def show_referral_qr(callback_query: CallbackQuery):
         chat_id = callback_query.data.split("|")[1]
         referral_link = get_referral_link(chat_id)
 
-        qr = qrcode.QRCode(version=1, box_size=10, border=4)
-        qr.add_data(referral_link)
-        qr.make(fit=True)
-
-        image = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        image.save(buffer, format="PNG")
-        buffer.seek(0)
-
-        qr_path = f"/tmp/qrcode_referral_{chat_id}.png"
-        with open(qr_path, "wb") as file:
-            file.write(buffer.read())
-
         builder = InlineKeyboardBuilder()
         builder.row(InlineKeyboardButton(text=BACK, callback_data="invite"))
         builder.row(InlineKeyboardButton(text=MAIN_MENU, callback_data="profile"))
 
-        await edit_or_send_message(
+        await send_qr_code(
             target_message=callback_query.message,
-            text="📷 <b>Ваш QR-код для реферальной ссылки.</b>",
+            data=referral_link,
+            caption="📷 <b>Ваш QR-код для реферальной ссылки.</b>",
             reply_markup=builder.as_markup(),
-            media_path=qr_path,
         )
 
-        os.remove(qr_path)
-
     except Exception as error:
         logger.error(f"Ошибка при генерации QR-кода для реферальной ссылки: {error}", exc_info=True)
         await callback_query.message.answer("❌ Произошла ошибка при создании QR-кода.")
@@ -197,40 +180,22 @@ async def show_referral_qr(callback_query: CallbackQuery):
 async def top_referrals_handler(callback_query: CallbackQuery, session: AsyncSession):
     user_id = callback_query.from_user.id
 
-    result = await session.execute(select(func.count()).select_from(Referral).where(Referral.referrer_tg_id == user_id))
-    user_referral_count = result.scalar_one() or 0
+    user_referral_count = await get_user_referral_count(session, user_id)
 
     personal_block = "Твоё место в рейтинге:\n"
     if user_referral_count > 0:
-        subquery = (
-            select(func.count().label("cnt"))
-            .select_from(Referral)
-            .group_by(Referral.referrer_tg_id)
-            .having(func.count() > user_referral_count)
-            .subquery()
-        )
-        result = await session.execute(select(func.count()).select_from(subquery))
-        user_position = result.scalar_one() + 1
+        user_position = await get_referral_position(session, user_referral_count)
         personal_block += f"{user_position}. {user_id} - {user_referral_count} чел."
     else:
         personal_block += "Ты еще не приглашал пользователей в проект."
 
-    result = await session.execute(
-        select(
-            Referral.referrer_tg_id,
-            func.count(Referral.referred_tg_id).label("referral_count"),
-        )
-        .group_by(Referral.referrer_tg_id)
-        .order_by(desc("referral_count"))
-        .limit(5)
-    )
-    top_referrals = result.all()
+    top_referrals = await get_top_referrals(session, limit=5)
 
     is_admin = user_id in ADMIN_ID
     rows = ""
     for index, row in enumerate(top_referrals, 1):
-        referrer_id = str(row.referrer_tg_id)
-        count = row.referral_count
+        referrer_id = str(row["referrer_tg_id"])
+        count = row["referral_count"]
         display_id = referrer_id if is_admin else f"{referrer_id[:5]}*****"
         rows += f"{index}. {display_id} - {count} чел.\n"
 
@@ -5,16 +5,14 @@ from typing import Any
 from aiogram import F, Router
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, InlineKeyboardButton, Message
+from aiogram.types import CallbackQuery, ChatMemberUpdated, InlineKeyboardButton, Message
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot import bot
 from config import (
     CAPTCHA_ENABLE,
     CHANNEL_EXISTS,
-    CHANNEL_ID,
     CHANNEL_URL,
     DONATIONS_ENABLE,
     SHOW_START_MENU_ONCE,
@@ -118,10 +116,11 @@ async def start_entry(
 
 @router.callback_query(F.data == "check_subscription")
 async def check_subscription_callback(callback: CallbackQuery, state: FSMContext, session: Any, admin: bool):
+    from middlewares.subscription import fetch_subscription_status
+
     user_id = callback.from_user.id
     try:
-        member = await bot.get_chat_member(CHANNEL_ID, user_id)
-        if member.status not in ["member", "administrator", "creator"]:
+        if not await fetch_subscription_status(user_id):
             await prompt_subscription(callback)
             return
         await callback.answer(SUBSCRIPTION_CONFIRMED_MSG)
@@ -135,6 +134,16 @@ async def check_subscription_callback(callback: CallbackQuery, state: FSMContext
         await callback.answer(SUBSCRIPTION_CHECK_ERROR_MSG, show_alert=True)
 
 
+@router.chat_member()
+async def channel_member_updated(event: ChatMemberUpdated):
+    """Обновляет кеш подписки по событиям chat_member из канала."""
+    from middlewares.subscription import is_subscription_channel, remember_subscription_status
+
+    if not CHANNEL_EXISTS or not is_subscription_channel(event.chat):
+        return
+    remember_subscription_status(event.new_chat_member.user.id, event.new_chat_member.status)
+
+
 async def process_start_logic(
     message: Message,
     state: FSMContext,
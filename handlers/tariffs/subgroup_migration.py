@@ -13,7 +13,7 @@ from logger import (
     PANEL_XUI,
 )
 from panels._3xui import ClientConfig, add_client, extend_client_key, get_xui_instance
-from panels.remnawave import RemnawaveAPI
+from panels.remnawave_pool import get_remnawave_api
 
 from ..keys.operations.deletion import delete_on_3xui, delete_on_remnawave
 from ..keys.operations.utils import bytes_from_gb, norm_name, split_by_panel
@@ -43,7 +43,7 @@ async def ensure_on_remnawave(
 
     inbounds = [s.get("inbound_id") for s in servers if s.get("inbound_id")]
 
-    api = RemnawaveAPI(servers[0]["api_url"])
+    api = get_remnawave_api(servers[0]["api_url"])
     ok = await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD)
     if not ok:
         logger.error(f"{PANEL_REMNA} API недоступен при создании/обновлении")
@@ -18,9 +18,11 @@ async def get_effective_limits_for_key(
     tariff_id: int | None,
     selected_device_limit: int | None,
     selected_traffic_gb: int | None,
+    tariff: dict | None = None,
 ) -> tuple[int, int]:
-    """Возвращает лимиты устройств и трафика с учётом выбранных значений."""
-    tariff = await get_tariff_by_id(session, int(tariff_id)) if tariff_id else None
+    """Возвращает лимиты устройств и трафика с учётом выбранных значений. tariff — уже загруженная строка тарифа."""
+    if tariff is None and tariff_id:
+        tariff = await get_tariff_by_id(session, int(tariff_id))
 
     if tariff:
         base_devices = tariff.get("device_limit")
@@ -46,7 +48,9 @@ async def get_effective_limits_for_key(
     return device_limit, traffic_limit_bytes
 
 
-async def resolve_price_to_charge(session: AsyncSession, state_data: dict[str, Any]) -> int | None:
+async def resolve_price_to_charge(
+    session: AsyncSession, state_data: dict[str, Any], tariff: dict | None = None
+) -> int | None:
     """Считает цену к списанию по состоянию, с учётом конфигуратора и наценок."""
     price = state_data.get("selected_price_rub")
     if price is not None:
@@ -59,7 +63,8 @@ async def resolve_price_to_charge(session: AsyncSession, state_data: dict[str, A
     if not tariff_id:
         return None
 
-    tariff = await get_tariff_by_id(session, int(tariff_id))
+    if tariff is None or tariff.get("id") != int(tariff_id):
+        tariff = await get_tariff_by_id(session, int(tariff_id))
     if not tariff:
         return None
 
@@ -154,12 +159,16 @@ async def get_key_tariff_display(
     key_record: dict[str, Any],
     selected_device_limit_override: int | None = None,
     selected_traffic_gb_override: int | None = None,
+    tariff: dict | None = None,
 ) -> tuple[str, str, int, int, bool]:
     """Возвращает отображение тарифа и эффективные лимиты, приоритет — данные панели."""
     tariff_id = key_record.get("tariff_id")
     if not tariff_id:
         return "", "", 0, 0, False
 
+    if tariff is None or tariff.get("id") != int(tariff_id):
+        tariff = await get_tariff_by_id(session, int(tariff_id))
+
     selected_device_limit = selected_device_limit_override
     selected_traffic_gb = selected_traffic_gb_override
 
@@ -184,6 +193,7 @@ async def get_key_tariff_display(
         tariff_id=int(tariff_id),
         selected_device_limit=selected_device_limit,
         selected_traffic_gb=selected_traffic_gb,
+        tariff=tariff,
     )
 
     server_cluster_id = key_record.get("server_id")
@@ -201,9 +211,9 @@ async def get_key_tariff_display(
                 )
 
             if remna_server:
-                from panels.remnawave import RemnawaveAPI
+                from panels.remnawave_pool import get_remnawave_api
 
-                api = RemnawaveAPI(remna_server["api_url"])
+                api = get_remnawave_api(remna_server["api_url"])
                 try:
                     ok = await api.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD)
                 except Exception as e:
@@ -246,7 +256,6 @@ async def get_key_tariff_display(
 
     traffic_limit_gb = int(traffic_limit_bytes / GB) if traffic_limit_bytes else 0
 
-    tariff = await get_tariff_by_id(session, int(tariff_id))
     if tariff:
         tariff_name = tariff.get("name", "—")
         subgroup_title = tariff.get("subgroup_title") or ""
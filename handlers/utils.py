@@ -6,25 +6,23 @@ import string
 
 from datetime import datetime, timedelta
 
-import aiofiles
-
 from aiogram.types import (
-    BufferedInputFile,
     InlineKeyboardMarkup,
     InputMediaAnimation,
     InputMediaPhoto,
     InputMediaVideo,
     Message,
 )
-from sqlalchemy import func, select
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot import bot
 from config import ADMIN_ID
-from database import get_servers
+from database import get_server_key_count, get_server_key_counts, get_servers
 from database.models import Key, Notification, Server
 from hooks.processors import process_cluster_balancer
 from logger import logger
+from utils.media_cache import get_cached_file_id, read_upload, remember_file_id
 
 
 ALLOWED_GROUP_CODES = ["trial", "discounts", "discounts_max", "gifts"]
@@ -56,14 +54,12 @@ async def get_least_loaded_cluster(session: AsyncSession) -> str:
         for server in cluster_servers:
             server_to_cluster[server["server_name"]] = cluster_name
 
-    result = await session.execute(select(Key))
-    keys = result.scalars().all()
+    key_counts = await get_server_key_counts(session)
 
-    for key in keys:
-        server_id = key.server_id
+    for server_id, count in key_counts.items():
         cluster_id = server_to_cluster.get(server_id, server_id)
         if cluster_id in cluster_loads:
-            cluster_loads[cluster_id] += 1
+            cluster_loads[cluster_id] += count
 
     available_clusters = {}
     for cluster_name, cluster_servers in servers.items():
@@ -107,8 +103,7 @@ async def check_server_key_limit(server_info: dict, session: AsyncSession) -> bo
 
     identifier = cluster_name if cluster_name else server_name
 
-    result = await session.execute(select(func.count()).select_from(Key).where(Key.server_id == identifier))
-    total_keys = result.scalar() or 0
+    total_keys = await get_server_key_count(session, identifier)
 
     if total_keys >= max_keys:
         logger.warning(f"[Key Limit] Сервер {server_name} достиг лимита: {total_keys}/{max_keys}")
@@ -223,15 +218,6 @@ async def edit_or_send_message(
     force_text: bool = False,
     disable_cache: bool = False,
 ):
-    if not hasattr(edit_or_send_message, "cache"):
-        import asyncio
-
-        from collections import OrderedDict
-
-        edit_or_send_message.cache = OrderedDict()
-        edit_or_send_message.lock = asyncio.Lock()
-        edit_or_send_message.max = 256
-
     def find_media_file(original_path: str) -> str | None:
         if not original_path:
             return None
@@ -256,10 +242,7 @@ async def edit_or_send_message(
 
             cached_id = None
             if not disable_cache:
-                async with edit_or_send_message.lock:
-                    cached_id = edit_or_send_message.cache.get(actual_media_path)
-                    if cached_id:
-                        edit_or_send_message.cache.move_to_end(actual_media_path)
+                cached_id = await get_cached_file_id(target_message.bot or bot, actual_media_path)
 
             if cached_id:
                 try:
@@ -303,9 +286,7 @@ async def edit_or_send_message(
                     except Exception:
                         pass
 
-            async with aiofiles.open(actual_media_path, "rb") as f:
-                data = await f.read()
-            upload = BufferedInputFile(data, filename=os.path.basename(actual_media_path))
+            upload = await read_upload(actual_media_path)
 
             try:
                 if media_type == "photo":
@@ -343,20 +324,8 @@ async def edit_or_send_message(
                         disable_web_page_preview=disable_web_page_preview,
                     )
 
-            file_id = None
-            if hasattr(msg, "photo") and msg.photo:
-                file_id = msg.photo[-1].file_id
-            elif hasattr(msg, "video") and msg.video:
-                file_id = msg.video.file_id
-            elif hasattr(msg, "animation") and msg.animation:
-                file_id = msg.animation.file_id
-
-            if file_id and not disable_cache:
-                async with edit_or_send_message.lock:
-                    if actual_media_path not in edit_or_send_message.cache:
-                        edit_or_send_message.cache[actual_media_path] = file_id
-                        if len(edit_or_send_message.cache) > edit_or_send_message.max:
-                            edit_or_send_message.cache.popitem(last=False)
+            if not disable_cache:
+                await remember_file_id(target_message.bot or bot, actual_media_path, msg)
             return
 
     if not force_text and target_message.caption is not None:
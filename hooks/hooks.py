@@ -42,6 +42,10 @@ def unregister_module_hooks(module_name: str):
             _hooks.pop(k, None)
 
 
+def has_hooks(name: str) -> bool:
+    return bool(_hooks.get(name))
+
+
 async def run_hooks(name: str, require_enabled: bool = True, **kwargs) -> list[Any]:
     """Вызывает зарегистрированные хуки и собирает результаты."""
     results: list[Any] = []
@@ -159,9 +159,9 @@ async def process_get_cryptolink_after_renewal(
         from config import REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD
         from database import get_tariff_by_id
         from handlers.keys.operations.utils import is_plan_vless
-        from panels.remnawave import RemnawaveAPI
+        from panels.remnawave_pool import get_remnawave_api
 
-        remna = RemnawaveAPI(remnawave_nodes[0]["api_url"])
+        remna = get_remnawave_api(remnawave_nodes[0]["api_url"])
         if not await remna.login(REMNAWAVE_LOGIN, REMNAWAVE_PASSWORD):
             return None
 
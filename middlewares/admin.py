@@ -3,17 +3,14 @@ from typing import Any
 
 from aiogram import BaseMiddleware
 from aiogram.types import CallbackQuery, Message, TelegramObject
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from config import ADMIN_ID
-from database.models import Admin
+from database.admins import ensure_admin_roles, is_admin_cached
+from logger import logger
 
 
 class AdminMiddleware(BaseMiddleware):
-    """Проверяет, является ли пользователь администратором."""
-
-    _admin_ids: set[int] = set(ADMIN_ID) if isinstance(ADMIN_ID, list | tuple) else {ADMIN_ID}
+    """Проверяет, является ли пользователь администратором (по снимку таблицы admins в памяти)."""
 
     async def __call__(
         self,
@@ -47,13 +44,12 @@ class AdminMiddleware(BaseMiddleware):
             if not user_id:
                 return False
 
-            if user_id in self._admin_ids:
-                return True
-
-            if not session:
-                return False
+            if session:
+                try:
+                    await ensure_admin_roles(session)
+                except Exception as e:
+                    logger.warning(f"[AdminMiddleware] Не удалось обновить список админов: {e}")
 
-            result = await session.execute(select(Admin).where(Admin.tg_id == user_id))
-            return result.scalar_one_or_none() is not None
+            return is_admin_cached(user_id)
         except Exception:
             return False
@@ -9,13 +9,22 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import ADMIN_ID, SUPPORT_CHAT_URL
+from database.invalidation import on_tables_committed
 from database.models import ManualBan
 from logger import logger
+from utils.cache import BoundedCache
 
 
 TZ = timezone("Europe/Moscow")
 _BAN_CACHE_TTL = 30
-_ban_cache: dict[int, tuple[float, dict | None]] = {}
+_BAN_CACHE_SIZE = 100_000
+_NOT_CACHED = object()
+_ban_cache = BoundedCache("ban_checker", maxsize=_BAN_CACHE_SIZE, ttl=_BAN_CACHE_TTL)
+
+
+@on_tables_committed("manual_bans")
+def _invalidate_ban_cache() -> None:
+    _ban_cache.clear()
 
 
 class BanCheckerMiddleware(BaseMiddleware):
@@ -45,11 +54,8 @@ class BanCheckerMiddleware(BaseMiddleware):
         if tg_id is None:
             return await handler(event, data)
 
-        now_ts = datetime.utcnow().timestamp()
-        cached = _ban_cache.get(tg_id)
-        if cached and cached[0] > now_ts:
-            ban_info = cached[1]
-        else:
+        ban_info = _ban_cache.get(tg_id, _NOT_CACHED)
+        if ban_info is _NOT_CACHED:
             session = data.get("session")
             if not isinstance(session, AsyncSession):
                 logger.error("[BanChecker] session отсутствует в data")
@@ -71,7 +77,7 @@ class BanCheckerMiddleware(BaseMiddleware):
             else:
                 ban_info = None
 
-            _ban_cache[tg_id] = (now_ts + _BAN_CACHE_TTL, ban_info)
+            _ban_cache[tg_id] = ban_info
 
         if not ban_info:
             return await handler(event, data)
@@ -16,11 +16,53 @@ from database.db import (
 from logger import logger
 
 
+class DbSlotTimeoutError(BaseException):
+    """
+    Слот БД не освободился за CONCURRENT_UPDATES_WAIT_TIMEOUT_SEC. Наследуется от BaseException,
+    чтобы широкие except Exception в хендлерах не превращали его в обычную ошибку: апдейт
+    должен дойти до ConcurrencyLimiterMiddleware и получить ответ «высокая нагрузка».
+    """
+
+
+class DbSlot:
+    """
+    Слот семафора БД одного апдейта. Занимается при первом обращении к сессии
+    (см. SessionMiddleware), освобождается после обработки апдейта.
+    """
+
+    __slots__ = ("_semaphore", "_lock", "acquired")
+
+    def __init__(self, semaphore: asyncio.Semaphore) -> None:
+        self._semaphore = semaphore
+        # Сессию апдейта делят дочерние задачи хендлера: первое обращение к БД может прийти из нескольких сразу
+        self._lock = asyncio.Lock()
+        self.acquired = False
+
+    async def acquire(self) -> None:
+        if self.acquired:
+            return
+        async with self._lock:
+            if self.acquired:
+                return
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=CONCURRENT_UPDATES_WAIT_TIMEOUT_SEC)
+            except asyncio.TimeoutError:
+                raise DbSlotTimeoutError from None
+            self.acquired = True
+
+    def release(self) -> None:
+        if self.acquired:
+            self.acquired = False
+            self._semaphore.release()
+
+
 class ConcurrencyLimiterMiddleware(BaseMiddleware):
     """
     Регистрируется до SessionMiddleware. Шлюз (gate) ограничивает число апдейтов
     в конвейере; семафор — число одновременно обрабатываемых с БД. Лишние
     апдейты сразу получают «высокая нагрузка» и не создают тысячи ожидающих задач.
+    Слот семафора занимается лениво, при первом запросе к БД: апдейты, которые
+    не трогают БД (статичные меню, ответы из кешей), в очередь к БД не встают.
     """
 
     def __init__(self) -> None:
@@ -43,26 +85,21 @@ class ConcurrencyLimiterMiddleware(BaseMiddleware):
             logger.warning("[Concurrency] Reject: gate full (очередь переполнена)")
             await self._reject_overload(event, data)
             return None
+        db_slot = DbSlot(self._semaphore)
+        data["db_slot"] = db_slot
         try:
-            try:
-                await asyncio.wait_for(
-                    self._semaphore.acquire(),
-                    timeout=CONCURRENT_UPDATES_WAIT_TIMEOUT_SEC,
-                )
-            except asyncio.TimeoutError:
-                logger.warning("[Concurrency] Reject: semaphore timeout (все слоты БД заняты)")
-                await self._reject_overload(event, data)
+            age = time.monotonic() - data["request_time"]
+            if age > MAX_UPDATE_AGE_SEC:
+                logger.warning("[Concurrency] Reject: update too old (age %.1fs)", age)
+                await self._reject_stale(event, data)
                 return None
-            try:
-                age = time.monotonic() - data["request_time"]
-                if age > MAX_UPDATE_AGE_SEC:
-                    logger.warning("[Concurrency] Reject: update too old (age %.1fs)", age)
-                    await self._reject_stale(event, data)
-                    return None
-                return await handler(event, data)
-            finally:
-                self._semaphore.release()
+            return await handler(event, data)
+        except DbSlotTimeoutError:
+            logger.warning("[Concurrency] Reject: semaphore timeout (все слоты БД заняты)")
+            await self._reject_overload(event, data)
+            return None
         finally:
+            db_slot.release()
             self._gate.release()
 
     async def _answer_callback_early(self, event: CallbackQuery, data: dict[str, Any]) -> None:
@@ -83,50 +120,51 @@ class ConcurrencyLimiterMiddleware(BaseMiddleware):
             pass
 
     async def _reject_stale(self, event: TelegramObject, data: dict[str, Any]) -> None:
-        await self._send_reject_message(event, data)
+        await send_overload_reply(event, data)
 
     async def _reject_overload(self, event: TelegramObject, data: dict[str, Any]) -> None:
-        await self._send_reject_message(event, data)
+        await send_overload_reply(event, data)
+
+
+async def send_overload_reply(event: TelegramObject, data: dict[str, Any]) -> None:
+    """Отправляет пользователю сообщение «высокая нагрузка / нажмите ещё раз»."""
+    bot: Bot = data.get("bot")
+    if not bot:
+        return
+    text = "Сейчас высокая нагрузка. Попробуйте ещё раз через несколько секунд."
+    try:
+        if isinstance(event, Update):
+            chat_id, callback = _chat_and_callback_from_update(event)
+            if chat_id is None:
+                return
+            if callback and not data.get("callback_answered_early"):
+                await bot.answer_callback_query(
+                    callback.id,
+                    text="Время ожидания истекло. Нажмите ещё раз.",
+                    show_alert=False,
+                )
+            else:
+                await bot.send_message(chat_id, text)
+        elif isinstance(event, CallbackQuery):
+            if data.get("callback_answered_early"):
+                if event.message and event.message.chat:
+                    await bot.send_message(event.message.chat.id, text)
+            else:
+                await bot.answer_callback_query(
+                    event.id,
+                    text="Время ожидания истекло. Нажмите ещё раз.",
+                    show_alert=False,
+                )
+        elif isinstance(event, Message) and event.chat:
+            await bot.send_message(event.chat.id, text)
+    except Exception:
+        pass
 
-    async def _send_reject_message(self, event: TelegramObject, data: dict[str, Any]) -> None:
-        """Отправляет пользователю сообщение «высокая нагрузка / нажмите ещё раз»."""
-        bot: Bot = data.get("bot")
-        if not bot:
-            return
-        text = "Сейчас высокая нагрузка. Попробуйте ещё раз через несколько секунд."
-        try:
-            if isinstance(event, Update):
-                chat_id, callback = self._chat_and_callback_from_update(event)
-                if chat_id is None:
-                    return
-                if callback and not data.get("callback_answered_early"):
-                    await bot.answer_callback_query(
-                        callback.id,
-                        text="Время ожидания истекло. Нажмите ещё раз.",
-                        show_alert=False,
-                    )
-                else:
-                    await bot.send_message(chat_id, text)
-            elif isinstance(event, CallbackQuery):
-                if data.get("callback_answered_early"):
-                    if event.message and event.message.chat:
-                        await bot.send_message(event.message.chat.id, text)
-                else:
-                    await bot.answer_callback_query(
-                        event.id,
-                        text="Время ожидания истекло. Нажмите ещё раз.",
-                        show_alert=False,
-                    )
-            elif isinstance(event, Message) and event.chat:
-                await bot.send_message(event.chat.id, text)
-        except Exception:
-            pass
 
-    @staticmethod
-    def _chat_and_callback_from_update(update: Update) -> tuple[int | None, CallbackQuery | None]:
-        """Извлекает chat_id и callback (если есть) из Update для отправки сообщения."""
-        if update.message and update.message.chat:
-            return update.message.chat.id, None
-        if update.callback_query and update.callback_query.message and update.callback_query.message.chat:
-            return update.callback_query.message.chat.id, update.callback_query
-        return None, None
+def _chat_and_callback_from_update(update: Update) -> tuple[int | None, CallbackQuery | None]:
+    """Извлекает chat_id и callback (если есть) из Update для отправки сообщения."""
+    if update.message and update.message.chat:
+        return update.message.chat.id, None
+    if update.callback_query and update.callback_query.message and update.callback_query.message.chat:
+        return update.callback_query.message.chat.id, update.callback_query
+    return None, None
@@ -1,5 +1,3 @@
-import time
-
 from collections.abc import Awaitable, Callable
 from typing import Any
 
@@ -11,10 +9,12 @@ from config import ADMIN_ID, DISABLE_DIRECT_START
 from core.bootstrap import MODES_CONFIG
 from database import check_user_exists
 from logger import logger
+from utils.cache import BoundedCache
 
 
 _TTL = 20
-_cache_user_exists: dict[int, tuple[float, bool]] = {}
+_CACHE_SIZE = 100_000
+_cache_user_exists = BoundedCache("direct_start_user_exists", maxsize=_CACHE_SIZE, ttl=_TTL)
 
 
 class DirectStartBlockerMiddleware(BaseMiddleware):
@@ -55,7 +55,6 @@ class DirectStartBlockerMiddleware(BaseMiddleware):
 
         tg_id = message.from_user.id
         text = message.text.strip()
-        now = time.time()
         user_in_data = bool(data.get("user"))
 
         async def user_exists_cached() -> bool:
@@ -63,11 +62,11 @@ class DirectStartBlockerMiddleware(BaseMiddleware):
                 return True
 
             cached = _cache_user_exists.get(tg_id)
-            if cached and cached[0] > now:
-                return cached[1]
+            if cached is not None:
+                return cached
 
             exists = await check_user_exists(session, tg_id)
-            _cache_user_exists[tg_id] = (now + _TTL, exists)
+            _cache_user_exists[tg_id] = exists
             return exists
 
         if not text.startswith("/"):
@@ -1,12 +1,99 @@
+from typing import Any
+
 from aiogram import BaseMiddleware
 
 from logger import logger
 
 
+class _DbSlotSessionMixin:
+    """
+    Занимает слот БД апдейта (DbSlot из ConcurrencyLimiterMiddleware) перед первым
+    запросом сессии. Сессия, которой хендлер не воспользовался, слот не занимает.
+    """
+
+    db_slot = None
+
+    async def _acquire_db_slot(self) -> None:
+        if self.db_slot is not None:
+            await self.db_slot.acquire()
+
+    async def _acquire_db_slot_for_flush(self) -> None:
+        if self.new or self.dirty or self.deleted:
+            await self._acquire_db_slot()
+
+    async def execute(self, *args: Any, **kwargs: Any) -> Any:
+        await self._acquire_db_slot()
+        return await super().execute(*args, **kwargs)
+
+    async def scalar(self, *args: Any, **kwargs: Any) -> Any:
+        await self._acquire_db_slot()
+        return await super().scalar(*args, **kwargs)
+
+    async def get(self, *args: Any, **kwargs: Any) -> Any:
+        await self._acquire_db_slot()
+        return await super().get(*args, **kwargs)
+
+    async def get_one(self, *args: Any, **kwargs: Any) -> Any:
+        await self._acquire_db_slot()
+        return await super().get_one(*args, **kwargs)
+
+    async def stream(self, *args: Any, **kwargs: Any) -> Any:
+        await self._acquire_db_slot()
+        return await super().stream(*args, **kwargs)
+
+    async def refresh(self, *args: Any, **kwargs: Any) -> Any:
+        await self._acquire_db_slot()
+        return await super().refresh(*args, **kwargs)
+
+    async def merge(self, *args: Any, **kwargs: Any) -> Any:
+        await self._acquire_db_slot()
+        return await super().merge(*args, **kwargs)
+
+    async def delete(self, *args: Any, **kwargs: Any) -> Any:
+        await self._acquire_db_slot()
+        return await super().delete(*args, **kwargs)
+
+    async def run_sync(self, *args: Any, **kwargs: Any) -> Any:
+        await self._acquire_db_slot()
+        return await super().run_sync(*args, **kwargs)
+
+    async def connection(self, *args: Any, **kwargs: Any) -> Any:
+        await self._acquire_db_slot()
+        return await super().connection(*args, **kwargs)
+
+    async def flush(self, *args: Any, **kwargs: Any) -> Any:
+        await self._acquire_db_slot_for_flush()
+        return await super().flush(*args, **kwargs)
+
+    async def commit(self) -> None:
+        await self._acquire_db_slot_for_flush()
+        return await super().commit()
+
+
+_session_classes: dict[type, type] = {}
+
+
+def _db_slot_session_class(base: type) -> type:
+    cls = _session_classes.get(base)
+    if cls is None:
+        cls = type(base.__name__, (_DbSlotSessionMixin, base), {})
+        _session_classes[base] = cls
+    return cls
+
+
 class SessionMiddleware(BaseMiddleware):
     def __init__(self, sessionmaker):
         self.sessionmaker = sessionmaker
 
+    def _create_session(self, data):
+        db_slot = data.get("db_slot")
+        if db_slot is None or not hasattr(self.sessionmaker, "class_"):
+            return self.sessionmaker()
+
+        session = _db_slot_session_class(self.sessionmaker.class_)(**self.sessionmaker.kw)
+        session.db_slot = db_slot
+        return session
+
     async def _rollback(self, session, context: str) -> None:
         """Attempt rollback so invalid transaction is cleared; log if rollback fails."""
         try:
@@ -24,7 +111,9 @@ class SessionMiddleware(BaseMiddleware):
         if data.get("session"):
             return await handler(event, data)
 
-        session = self.sessionmaker()
+        session = self._create_session(data)
+        if data.get("db_slot") is not None and not isinstance(session, _DbSlotSessionMixin):
+            await data["db_slot"].acquire()
         data["session"] = session
         committed = False
         handler_name = getattr(handler, "__qualname__", getattr(handler, "__name__", str(handler)))
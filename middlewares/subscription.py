@@ -7,6 +7,7 @@ from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InlineKeyboardButton, Message, Update
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from cachetools import TTLCache
 
 from bot import bot
 from config import CHANNEL_EXISTS, CHANNEL_ID, CHANNEL_REQUIRED, CHANNEL_URL
@@ -17,6 +18,48 @@ from handlers.utils import edit_or_send_message
 from logger import logger
 
 
+_MEMBER_STATUSES = ("member", "administrator", "creator")
+_MEMBER_CACHE_TTL = 600
+_NOT_MEMBER_CACHE_TTL = 15
+_CACHE_MAXSIZE = 100_000
+
+_member_cache: TTLCache = TTLCache(maxsize=_CACHE_MAXSIZE, ttl=_MEMBER_CACHE_TTL)
+_not_member_cache: TTLCache = TTLCache(maxsize=_CACHE_MAXSIZE, ttl=_NOT_MEMBER_CACHE_TTL)
+
+
+def remember_subscription_status(tg_id: int, status: str) -> None:
+    """Запоминает статус участника канала: подписчики и неподписанные живут с разными TTL."""
+    if status in _MEMBER_STATUSES:
+        _not_member_cache.pop(tg_id, None)
+        _member_cache[tg_id] = True
+    else:
+        _member_cache.pop(tg_id, None)
+        _not_member_cache[tg_id] = True
+
+
+def invalidate_subscription_cache(tg_id: int) -> None:
+    """Сбрасывает закешированный статус подписки пользователя."""
+    _member_cache.pop(tg_id, None)
+    _not_member_cache.pop(tg_id, None)
+
+
+def is_subscription_channel(chat) -> bool:
+    """Проверяет, что чат — канал из CHANNEL_ID (поддерживаются числовой id и @username)."""
+    if chat is None:
+        return False
+    if str(chat.id) == str(CHANNEL_ID):
+        return True
+    username = getattr(chat, "username", None)
+    return bool(username) and str(CHANNEL_ID).lstrip("@").lower() == username.lower()
+
+
+async def fetch_subscription_status(tg_id: int) -> bool:
+    """Запрашивает статус подписки у Telegram и обновляет кеш."""
+    member = await bot.get_chat_member(CHANNEL_ID, tg_id)
+    remember_subscription_status(tg_id, member.status)
+    return member.status in _MEMBER_STATUSES
+
+
 class SubscriptionMiddleware(BaseMiddleware):
     async def __call__(
         self,
@@ -54,12 +97,20 @@ class SubscriptionMiddleware(BaseMiddleware):
             tg_id = event.callback_query.from_user.id
             message = event.callback_query.message
             from_user = event.callback_query.from_user
+            if event.callback_query.data == "check_subscription":
+                invalidate_subscription_cache(tg_id)
         else:
             return await handler(event, data)
 
+        if tg_id in _member_cache:
+            return await handler(event, data)
+
         try:
-            member = await bot.get_chat_member(CHANNEL_ID, tg_id)
-            if member.status not in ("member", "administrator", "creator"):
+            if tg_id in _not_member_cache:
+                subscribed = False
+            else:
+                subscribed = await fetch_subscription_status(tg_id)
+            if not subscribed:
                 logger.info(f"[SubMiddleware] Пользователь {tg_id} не подписан")
                 await self._store_user_state(data, message, from_user)
                 return await self._ask_to_subscribe(message)
@@ -11,12 +11,17 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from database import upsert_user
 from database.models import User as DbUser
 from logger import logger
+from utils.cache import BoundedCache
+
+
+USER_CACHE_SIZE = 100_000
+USER_CACHE_TTL = 3600
 
 
 class UserMiddleware(BaseMiddleware):
     def __init__(self, debounce_sec: float = 60.0) -> None:
         self._debounce = float(debounce_sec)
-        self._cache: dict[int, tuple[str, float, float, dict | None]] = {}
+        self._cache = BoundedCache("user_middleware", maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
 
     async def __call__(
         self,
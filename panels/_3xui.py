@@ -1,5 +1,3 @@
-import time
-
 from dataclasses import dataclass
 from typing import Any
 
@@ -8,8 +6,9 @@ import py3xui
 
 from py3xui import AsyncApi
 
-from config import ADMIN_PASSWORD, ADMIN_USERNAME, SUPERNODE, USE_XUI_TOKEN, XUI_TOKEN
+from config import SUPERNODE
 from logger import logger
+from panels.xui_pool import get_xui_api
 
 
 @dataclass
@@ -28,35 +27,8 @@ class ClientConfig:
     sub_id: str
 
 
-_xui_instance_cache: dict[str, tuple[AsyncApi, float]] = {}
-SESSION_TTL = 1800
-
-
 async def get_xui_instance(api_url: str) -> AsyncApi:
-    key = f"{api_url}|{ADMIN_USERNAME}"
-    current_time = time.time()
-
-    xui_entry = _xui_instance_cache.get(key)
-    if xui_entry:
-        xui, last_login = xui_entry
-        if current_time - last_login < SESSION_TTL:
-            return xui
-        else:
-            logger.info("[XUI Cache] Сессия устарела (>30 минут), переподключение...")
-            await xui.login()
-            _xui_instance_cache[key] = (xui, current_time)
-            return xui
-
-    xui = AsyncApi(
-        api_url,
-        ADMIN_USERNAME,
-        ADMIN_PASSWORD,
-        token=XUI_TOKEN if USE_XUI_TOKEN else None,
-        logger=logger,
-    )
-    await xui.login()
-    _xui_instance_cache[key] = (xui, current_time)
-    return xui
+    return await get_xui_api(api_url)
 
 
 async def add_client(xui: py3xui.AsyncApi, config: ClientConfig) -> dict[str, Any]:
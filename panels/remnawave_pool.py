@@ -0,0 +1,135 @@
+import asyncio
+import base64
+import contextvars
+import json
+import time
+
+from typing import Any
+
+from logger import logger
+from panels.remnawave import RemnawaveAPI
+
+
+REMNAWAVE_TOKEN_TTL_SEC = 3600
+REMNAWAVE_TOKEN_REFRESH_MARGIN_SEC = 300
+REMNAWAVE_PING_FRESH_SEC = 30
+
+_clients: dict[str, "SharedRemnawaveAPI"] = {}
+# Запросы самого входа не перезапускают вход при 401 (иначе рекурсия под _registry_lock)
+_in_login: contextvars.ContextVar[bool] = contextvars.ContextVar("remnawave_in_login", default=False)
+
+
+def _token_expires_at(token: str | None) -> float | None:
+    """Время истечения JWT (claim exp) без проверки подписи."""
+    if not token or token.count(".") != 2:
+        return None
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp else None
+    except Exception:
+        return None
+
+
+def _is_unauthorized(obj: Any) -> bool:
+    """401 от панели: ответ httpx/aiohttp либо исключение с таким ответом."""
+    response = getattr(obj, "response", None) or obj
+    return 401 in (getattr(response, "status_code", None), getattr(response, "status", None))
+
+
+class SharedRemnawaveAPI(RemnawaveAPI):
+    """
+    Общий клиент панели: одно keep-alive соединение и один bearer-токен на api_url.
+    Повторные login() не ходят в панель, пока токен свежий; токен обновляется заранее,
+    за REMNAWAVE_TOKEN_REFRESH_MARGIN_SEC до истечения, а одновременные логины схлопываются в один.
+    """
+
+    def __init__(self, base_url: str) -> None:
+        super().__init__(base_url)
+        self._registry_url = base_url
+        self._registry_lock = asyncio.Lock()
+        self._registry_creds: tuple[str, str] | None = None
+        self._registry_expires_at = 0.0
+        self._registry_alive_at = 0.0
+
+    def _token_fresh(self, username: str, password: str) -> bool:
+        return self._registry_creds == (username, password) and time.time() < self._registry_expires_at
+
+    async def login(self, username: str, password: str, force: bool = False) -> bool:
+        if not force and self._token_fresh(username, password):
+            return True
+
+        started = time.time()
+        async with self._registry_lock:
+            if self._token_fresh(username, password) and (not force or self._registry_alive_at >= started):
+                return True
+
+            token = _in_login.set(True)
+            try:
+                ok = await super().login(username, password)
+            finally:
+                _in_login.reset(token)
+            if not ok:
+                self._registry_expires_at = 0.0
+                return ok
+
+            now = time.time()
+            expires_at = _token_expires_at(getattr(self, "token", None)) or now + REMNAWAVE_TOKEN_TTL_SEC
+            self._registry_creds = (username, password)
+            self._registry_expires_at = expires_at - REMNAWAVE_TOKEN_REFRESH_MARGIN_SEC
+            self._registry_alive_at = now
+            return ok
+
+    async def ping(self, username: str, password: str) -> bool:
+        """Проверка доступности панели: реальная авторизация, если панель не отвечала последние секунды."""
+        if time.time() - self._registry_alive_at < REMNAWAVE_PING_FRESH_SEC:
+            return True
+        return await self.login(username, password, force=True)
+
+    def invalidate_token(self) -> None:
+        self._registry_expires_at = 0.0
+
+    async def _request(self, *args: Any, **kwargs: Any) -> Any:
+        # Панель перезапущена или сменила секрет: токен отвергнут раньше exp, входим заново и повторяем один раз
+        try:
+            result = await super()._request(*args, **kwargs)
+        except Exception as e:
+            if not _is_unauthorized(e) or not await self._relogin():
+                raise
+        else:
+            if not _is_unauthorized(result) or not await self._relogin():
+                return result
+        return await super()._request(*args, **kwargs)
+
+    async def _relogin(self) -> bool:
+        if self._registry_creds is None or _in_login.get():
+            return False
+        logger.info(f"[Remnawave] Токен панели {self._registry_url} отклонён, повторная авторизация")
+        self.invalidate_token()
+        return await self.login(*self._registry_creds, force=True)
+
+    async def aclose(self) -> None:
+        """Клиент общий — закрывается только при остановке бота через close_remnawave_clients()."""
+
+    async def close(self) -> None:
+        await super().aclose()
+
+
+def get_remnawave_api(base_url: str) -> SharedRemnawaveAPI:
+    """Общий клиент Remnawave для api_url (создаётся при первом обращении)."""
+    client = _clients.get(base_url)
+    if client is None:
+        client = SharedRemnawaveAPI(base_url)
+        _clients[base_url] = client
+    return client
+
+
+async def close_remnawave_clients() -> None:
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"[Remnawave] Ошибка при закрытии клиента {client}: {e}")
@@ -0,0 +1,257 @@
+import asyncio
+import time
+
+from typing import Any
+
+import httpx
+
+from config import ADMIN_PASSWORD, ADMIN_USERNAME, USE_XUI_TOKEN, XUI_TOKEN
+from py3xui import AsyncApi
+from py3xui.async_api import AsyncClientApi, AsyncDatabaseApi, AsyncInboundApi, AsyncServerApi
+
+from logger import logger
+
+
+XUI_HOST_CONCURRENCY = 8
+# Меньше 5 сек., которые ждут проверки доступности серверов (asyncio.wait_for в выдаче ключей)
+XUI_REQUEST_TIMEOUT_SEC = 4.0
+XUI_BREAKER_FAILURES = 3
+XUI_BREAKER_COOLDOWN_SEC = 30
+XUI_PING_FRESH_SEC = 30
+
+
+class XuiPanelUnavailableError(ConnectionError):
+    """Панель помечена недоступной: запрос не отправляется до конца паузы circuit breaker."""
+
+
+class XuiHost:
+    """
+    Состояние одной панели 3x-ui: keep-alive пул соединений, лимит одновременных запросов,
+    общая сессия и circuit breaker. После XUI_BREAKER_FAILURES сетевых ошибок подряд запросы
+    к панели сразу отклоняются на XUI_BREAKER_COOLDOWN_SEC, затем пропускается один пробный.
+    """
+
+    def __init__(self, api_url: str) -> None:
+        self.api_url = api_url
+        self.semaphore = asyncio.Semaphore(XUI_HOST_CONCURRENCY)
+        self.login_lock = asyncio.Lock()
+        self.alive_at = 0.0
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._http: httpx.AsyncClient | None = None
+        self.api = PooledAsyncApi(self)
+
+    def http(self, verify: bool | str) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                verify=verify,
+                timeout=XUI_REQUEST_TIMEOUT_SEC,
+                limits=httpx.Limits(
+                    max_connections=XUI_HOST_CONCURRENCY,
+                    max_keepalive_connections=XUI_HOST_CONCURRENCY,
+                ),
+            )
+        return self._http
+
+    @property
+    def is_open(self) -> bool:
+        return bool(self.opened_at) and time.monotonic() - self.opened_at < XUI_BREAKER_COOLDOWN_SEC
+
+    def before_request(self) -> None:
+        if not self.opened_at:
+            return
+        if self.is_open or self.probing:
+            raise XuiPanelUnavailableError(f"Панель {self.api_url} временно недоступна")
+        self.probing = True
+
+    def record_success(self) -> None:
+        if self.opened_at:
+            logger.info(f"[XUI] Панель {self.api_url} снова доступна")
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.alive_at = time.time()
+
+    def record_failure(self, error: BaseException) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.failures >= XUI_BREAKER_FAILURES:
+            if not self.opened_at:
+                logger.warning(f"[XUI] Панель {self.api_url} недоступна ({error}), запросы приостановлены")
+            self.opened_at = time.monotonic()
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+
+def _is_unauthorized(response: httpx.Response) -> bool:
+    # Новые версии 3x-ui отвечают 401, старые перенаправляют на страницу входа
+    return response.status_code == 401 or response.is_redirect
+
+
+class _PooledRequestMixin:
+    """Подменяет транспорт py3xui: общий пул панели вместо нового соединения на каждый запрос."""
+
+    _xui_host: XuiHost
+
+    async def _request_with_retry(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        **kwargs: Any,
+    ) -> httpx.Response:
+        host = self._xui_host
+        skip_check = kwargs.pop("skip_check", False)
+        is_login = url.endswith("/login")
+
+        session = self.session
+        response = await self._send(method, url, headers, None if is_login else session, **kwargs)
+        if not is_login and _is_unauthorized(response):
+            logger.info(f"[XUI] Сессия панели {host.api_url} истекла, повторный вход")
+            await host.api.login(stale_session=session)
+            response = await self._send(method, url, headers, self.session, **kwargs)
+
+        response.raise_for_status()
+        if not skip_check:
+            await self._check_response(response)
+        return response
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        session: str | None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        host = self._xui_host
+        if session:
+            headers = {**headers, "Cookie": f"3x-ui={session}"}
+        verify = (self._custom_certificate_path or True) if self._use_tls_verify else False
+
+        for retry in range(1, self.max_retries + 1):
+            host.before_request()
+            try:
+                async with host.semaphore:
+                    response = await host.http(verify).request(method, url, headers=headers, **kwargs)
+            except (httpx.RequestError, httpx.TimeoutException) as e:
+                host.record_failure(e)
+                if retry == self.max_retries or host.is_open:
+                    raise
+                logger.warning(f"[XUI] Запрос к {url} не удался: {e}, попытка {retry} из {self.max_retries}")
+                await asyncio.sleep(retry + 1)
+                continue
+            except BaseException as e:
+                # Пробный запрос отменён или упал иначе: без этого панель осталась бы закрытой навсегда
+                if host.probing:
+                    host.record_failure(e)
+                raise
+
+            if response.status_code >= 500:
+                host.record_failure(httpx.HTTPStatusError("", request=response.request, response=response))
+            else:
+                host.record_success()
+            return response
+
+        raise ConnectionError(f"Max retries exceeded with no successful response to {url}")
+
+
+class _PooledClientApi(_PooledRequestMixin, AsyncClientApi):
+    pass
+
+
+class _PooledInboundApi(_PooledRequestMixin, AsyncInboundApi):
+    pass
+
+
+class _PooledDatabaseApi(_PooledRequestMixin, AsyncDatabaseApi):
+    pass
+
+
+class _PooledServerApi(_PooledRequestMixin, AsyncServerApi):
+    pass
+
+
+class PooledAsyncApi(AsyncApi):
+    """
+    AsyncApi поверх общего пула панели. login() выполняет вход один раз на панель:
+    повторные вызовы не ходят в сеть, пока сессия не отвергнута панелью (401).
+    """
+
+    def __init__(self, host: XuiHost) -> None:
+        token = XUI_TOKEN if USE_XUI_TOKEN else None
+        super().__init__(host.api_url, ADMIN_USERNAME, ADMIN_PASSWORD, token=token, logger=logger)
+        self._xui_host = host
+
+        args = (host.api_url, ADMIN_USERNAME, ADMIN_PASSWORD, token, True, None, logger)
+        self.client = _PooledClientApi(*args)
+        self.inbound = _PooledInboundApi(*args)
+        self.database = _PooledDatabaseApi(*args)
+        self.server = _PooledServerApi(*args)
+        for api in (self.client, self.inbound, self.database, self.server):
+            api._xui_host = host
+
+    async def login(self, stale_session: str | None = None, force: bool = False) -> None:
+        host = self._xui_host
+        if not force and self.session and self.session != stale_session:
+            return
+
+        started = time.time()
+        async with host.login_lock:
+            if self.session and self.session != stale_session and (not force or host.alive_at >= started):
+                return
+            await super().login()
+
+
+_hosts: dict[str, XuiHost] = {}
+
+
+def _get_host(api_url: str) -> XuiHost:
+    key = f"{api_url}|{ADMIN_USERNAME}"
+    host = _hosts.get(key)
+    if host is None:
+        host = XuiHost(api_url)
+        _hosts[key] = host
+    return host
+
+
+async def get_xui_api(api_url: str) -> PooledAsyncApi:
+    """Общий авторизованный клиент панели. Если панель помечена недоступной — сразу XuiPanelUnavailableError."""
+    host = _get_host(api_url)
+    if host.is_open:
+        raise XuiPanelUnavailableError(f"Панель {api_url} временно недоступна")
+    await host.api.login()
+    return host.api
+
+
+async def ping_xui(api_url: str) -> None:
+    """Проверка доступности: вход выполняется заново, только если панель не отвечала последние секунды."""
+    host = _get_host(api_url)
+    if time.time() - host.alive_at < XUI_PING_FRESH_SEC and host.api.session:
+        return
+    await host.api.login(force=True)
+
+
+def get_xui_health() -> dict[str, dict[str, Any]]:
+    return {
+        host.api_url: {
+            "open": host.is_open,
+            "failures": host.failures,
+            "logged_in": bool(host.api.session),
+        }
+        for host in _hosts.values()
+    }
+
+
+async def close_xui_clients() -> None:
+    hosts = list(_hosts.values())
+    _hosts.clear()
+    for host in hosts:
+        try:
+            await host.close()
+        except Exception as e:
+            logger.warning(f"[XUI] Ошибка при закрытии пула {host.api_url}: {e}")
@@ -0,0 +1,59 @@
+from typing import Any
+
+from cachetools import TTLCache
+
+
+_caches: dict[str, "BoundedCache"] = {}
+
+
+class BoundedCache(TTLCache):
+    """
+    TTLCache с ограниченным размером (при переполнении вытесняется давно не читавшаяся запись)
+    и счётчиками попаданий, промахов, вытеснений и истечений. Кеш регистрируется по имени,
+    статистика всех кешей доступна через get_cache_stats().
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float) -> None:
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        _caches[name] = self
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        try:
+            value = self[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def popitem(self) -> tuple[Any, Any]:
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def expire(self, time: float | None = None) -> list[tuple[Any, Any]]:
+        expired = super().expire(time)
+        self.expirations += len(expired)
+        return expired
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def get_cache_stats() -> dict[str, dict[str, Any]]:
+    return {name: cache.stats() for name, cache in _caches.items()}
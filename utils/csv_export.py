@@ -1,17 +1,201 @@
+import asyncio
 import csv
+import os
+import tempfile
+import zlib
 
+from collections.abc import AsyncIterator, Callable, Iterable, Sequence
 from datetime import datetime
 from io import StringIO
+from typing import Any
 
-from aiogram.types import BufferedInputFile
-from sqlalchemy import exists, func, join, not_, select
+from aiogram import Bot
+from aiogram.types import InputFile, Message
+from sqlalchemy import Select, exists, func, join, not_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.constants import PAYMENT_SYSTEMS_EXCLUDED
 from database.models import Key, Payment, Referral, Tariff, User
 
 
-async def export_users_csv(session: AsyncSession) -> BufferedInputFile:
+EXPORT_BATCH_SIZE = 5000
+EXPORT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+# Лимит Telegram на документ — 50 МБ, часть берём с запасом на multipart
+EXPORT_PART_SIZE = 45 * 1024 * 1024
+
+
+class CsvExport:
+    """Описание выгрузки: запрос, заголовок CSV и преобразование строки результата в строку файла."""
+
+    def __init__(
+        self,
+        filename: str,
+        query: Select,
+        header: Sequence[str],
+        format_row: Callable[[Any], Iterable[Any]] = tuple,
+        delimiter: str = ",",
+        encoding: str = "utf-8-sig",
+    ) -> None:
+        self.filename = filename
+        self.query = query
+        self.header = header
+        self.format_row = format_row
+        self.delimiter = delimiter
+        self.encoding = encoding
+        # BOM пишется только перед заголовком
+        self.row_encoding = "utf-8" if encoding == "utf-8-sig" else encoding
+
+
+class SpooledInputFile(InputFile):
+    """Документ для отправки из SpooledTemporaryFile: небольшой держится в памяти, большой уходит на диск."""
+
+    def __init__(self, filename: str) -> None:
+        super().__init__(filename=filename)
+        self.file = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE)  # noqa: SIM115
+        self.rows = 0
+
+    @property
+    def size(self) -> int:
+        return self.file.tell()
+
+    async def read(self, bot: Bot) -> AsyncIterator[bytes]:
+        await asyncio.to_thread(self.file.seek, 0)
+        while chunk := await asyncio.to_thread(self.file.read, self.chunk_size):
+            yield chunk
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _CsvEncoder:
+    def __init__(self, export: CsvExport) -> None:
+        self.export = export
+        self._buffer = StringIO()
+        self._writer = csv.writer(self._buffer, delimiter=export.delimiter)
+
+    def _line(self, values: Iterable[Any]) -> str:
+        self._writer.writerow(values)
+        line = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return line
+
+    def header(self) -> bytes:
+        return self._line(self.export.header).encode(self.export.encoding)
+
+    def rows(self, rows: Sequence[Any]) -> list[bytes]:
+        format_row = self.export.format_row
+        encoding = self.export.row_encoding
+        return [self._line(format_row(row)).encode(encoding) for row in rows]
+
+
+class _PartWriter:
+    """Пишет строки в части не больше part_size байт; каждая часть — самостоятельный CSV с заголовком."""
+
+    def __init__(self, export: CsvExport, part_size: int) -> None:
+        self.export = export
+        self.part_size = part_size
+        self.encoder = _CsvEncoder(export)
+        self.header = self.encoder.header()
+        self.parts: list[SpooledInputFile] = []
+        self._new_part()
+
+    def _new_part(self) -> SpooledInputFile:
+        part = SpooledInputFile(self.export.filename)
+        part.file.write(self.header)
+        self.parts.append(part)
+        return part
+
+    def write(self, rows: Sequence[Any]) -> None:
+        part = self.parts[-1]
+        for line in self.encoder.rows(rows):
+            if part.rows and part.size + len(line) > self.part_size:
+                part = self._new_part()
+            part.file.write(line)
+            part.rows += 1
+
+    def finish(self) -> list[SpooledInputFile]:
+        if len(self.parts) > 1:
+            stem, ext = os.path.splitext(self.export.filename)
+            for index, part in enumerate(self.parts, 1):
+                part.filename = f"{stem}_part{index}{ext}"
+        return self.parts
+
+    def close(self) -> None:
+        for part in self.parts:
+            part.close()
+
+
+async def _iter_batches(session: AsyncSession, export: CsvExport) -> AsyncIterator[Sequence[Any]]:
+    # Серверный курсор: строки приходят пачками по EXPORT_BATCH_SIZE, таблица целиком в память не читается
+    result = await session.stream(export.query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for batch in result.partitions():
+        yield batch
+
+
+async def build_export(
+    session: AsyncSession, export: CsvExport, part_size: int = EXPORT_PART_SIZE
+) -> list[SpooledInputFile]:
+    """
+    Выгружает запрос во временные файлы, форматируя пачки строк вне event loop.
+    Файл больше part_size делится на части. Вызывающий отправляет их через answer_export.
+    """
+    writer = _PartWriter(export, part_size)
+    try:
+        async for batch in _iter_batches(session, export):
+            await asyncio.to_thread(writer.write, batch)
+    except BaseException:
+        writer.close()
+        raise
+    return writer.finish()
+
+
+async def stream_export(session: AsyncSession, export: CsvExport, compress: bool = False) -> AsyncIterator[bytes]:
+    """Тот же CSV потоком байтов (для HTTP), при compress — в формате gzip."""
+    encoder = _CsvEncoder(export)
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+
+    def pack(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    def encode_batch(rows: Sequence[Any]) -> bytes:
+        return pack(b"".join(encoder.rows(rows)))
+
+    yield pack(encoder.header())
+    async for batch in _iter_batches(session, export):
+        chunk = await asyncio.to_thread(encode_batch, batch)
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+
+async def answer_export(message: Message, parts: list[SpooledInputFile], caption: str | None = None) -> None:
+    """Отправляет части выгрузки документами и освобождает временные файлы."""
+    try:
+        for index, part in enumerate(parts, 1):
+            part_caption = caption
+            if caption and len(parts) > 1:
+                part_caption = f"{caption} (часть {index}/{len(parts)})"
+            await message.answer_document(document=part, caption=part_caption)
+    finally:
+        for part in parts:
+            part.close()
+
+
+PAYMENT_HEADER = (
+    "tg_id",
+    "username",
+    "first_name",
+    "last_name",
+    "amount",
+    "payment_system",
+    "status",
+    "created_at",
+)
+
+
+def users_export() -> CsvExport:
     query = select(
         User.tg_id,
         User.username,
@@ -24,55 +208,24 @@ async def export_users_csv(session: AsyncSession) -> BufferedInputFile:
         User.created_at,
     ).order_by(User.created_at.asc())
 
-    result = await session.execute(query)
-    users = result.all()
-
-    buffer = StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow([
-        "tg_id",
-        "username",
-        "first_name",
-        "last_name",
-        "language_code",
-        "is_bot",
-        "balance",
-        "trial",
-        "created_at",
-    ])
-
-    for user in users:
-        writer.writerow(user)
-
-    buffer.seek(0)
-    return BufferedInputFile(file=buffer.getvalue().encode("utf-8-sig"), filename="users_export.csv")
-
-
-async def export_payments_csv(session: AsyncSession) -> BufferedInputFile:
-    j = join(User, Payment, User.tg_id == Payment.tg_id)
-    query = (
-        select(
-            User.tg_id,
-            User.username,
-            User.first_name,
-            User.last_name,
-            Payment.amount,
-            Payment.payment_system,
-            Payment.status,
-            Payment.created_at,
-        )
-        .select_from(j)
-        .where(Payment.payment_system.notin_(PAYMENT_SYSTEMS_EXCLUDED))
-        .order_by(Payment.created_at.asc())
+    return CsvExport(
+        "users_export.csv",
+        query,
+        (
+            "tg_id",
+            "username",
+            "first_name",
+            "last_name",
+            "language_code",
+            "is_bot",
+            "balance",
+            "trial",
+            "created_at",
+        ),
     )
 
-    result = await session.execute(query)
-    payments = result.all()
-
-    return _export_payments_csv(payments, "payments_export.csv")
-
 
-async def export_user_payments_csv(tg_id: int, session: AsyncSession) -> BufferedInputFile:
+def payments_export(tg_id: int | None = None) -> CsvExport:
     j = join(User, Payment, User.tg_id == Payment.tg_id)
     query = (
         select(
@@ -86,41 +239,25 @@ async def export_user_payments_csv(tg_id: int, session: AsyncSession) -> Buffere
             Payment.created_at,
         )
         .select_from(j)
-        .where(
-            User.tg_id == tg_id,
-            Payment.payment_system.notin_(PAYMENT_SYSTEMS_EXCLUDED),
-        )
+        .where(Payment.payment_system.notin_(PAYMENT_SYSTEMS_EXCLUDED))
         .order_by(Payment.created_at.asc())
     )
+    if tg_id is not None:
+        query = query.where(User.tg_id == tg_id)
 
-    result = await session.execute(query)
-    payments = result.all()
-
-    return _export_payments_csv(payments, f"payments_export_{tg_id}.csv")
-
-
-def _export_payments_csv(payments, filename: str) -> BufferedInputFile:
-    buffer = StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow([
-        "tg_id",
-        "username",
-        "first_name",
-        "last_name",
-        "amount",
-        "payment_system",
-        "status",
-        "created_at",
-    ])
+    filename = "payments_export.csv" if tg_id is None else f"payments_export_{tg_id}.csv"
+    return CsvExport(filename, query, PAYMENT_HEADER)
 
-    for payment in payments:
-        writer.writerow(payment)
 
-    buffer.seek(0)
-    return BufferedInputFile(file=buffer.getvalue().encode("utf-8-sig"), filename=filename)
+def _format_referral(row: Any) -> list[Any]:
+    invited_id, first_name, last_name, username = row
+    full_name = first_name.strip() or username or str(invited_id)
+    if last_name:
+        full_name = f"{full_name} {last_name}"
+    return [invited_id, full_name.strip()]
 
 
-async def export_referrals_csv(referrer_tg_id: int, session: AsyncSession) -> BufferedInputFile | None:
+def referrals_export(referrer_tg_id: int) -> CsvExport:
     j = join(Referral, User, Referral.referred_tg_id == User.tg_id)
     query = (
         select(
@@ -134,30 +271,17 @@ async def export_referrals_csv(referrer_tg_id: int, session: AsyncSession) -> Bu
         .order_by(Referral.referred_tg_id.asc())
     )
 
-    result = await session.execute(query)
-    rows = result.all()
-
-    if not rows:
-        return None
-
-    output = StringIO()
-    writer = csv.writer(output, delimiter=";")
-    writer.writerow(["Приглашённый (tg_id)", "Имя"])
-
-    for invited_id, first_name, last_name, username in rows:
-        full_name = first_name.strip() or username or str(invited_id)
-        if last_name:
-            full_name = f"{full_name} {last_name}"
-        writer.writerow([invited_id, full_name.strip()])
-
-    output.seek(0)
-    return BufferedInputFile(
-        file=output.getvalue().encode("utf-8"),
-        filename=f"referrals_{referrer_tg_id}.csv",
+    return CsvExport(
+        f"referrals_{referrer_tg_id}.csv",
+        query,
+        ("Приглашённый (tg_id)", "Имя"),
+        format_row=_format_referral,
+        delimiter=";",
+        encoding="utf-8",
     )
 
 
-async def export_hot_leads_csv(session: AsyncSession) -> BufferedInputFile:
+def hot_leads_export() -> CsvExport:
     now_ts = int(datetime.utcnow().timestamp() * 1000)
 
     stmt = (
@@ -181,23 +305,29 @@ async def export_hot_leads_csv(session: AsyncSession) -> BufferedInputFile:
         .order_by(User.updated_at.desc())
     )
 
-    result = await session.execute(stmt)
-    users = result.all()
+    return CsvExport("hot_leads_export.csv", stmt, ("tg_id", "username", "first_name", "last_name", "updated_at"))
 
-    buffer = StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow(["tg_id", "username", "first_name", "last_name", "updated_at"])
-    for user in users:
-        writer.writerow(user)
 
-    buffer.seek(0)
-    return BufferedInputFile(
-        file=buffer.getvalue().encode("utf-8-sig"),
-        filename="hot_leads_export.csv",
-    )
+def _format_ms(value: int | None) -> str:
+    return datetime.utcfromtimestamp(value / 1000).strftime("%Y-%m-%d %H:%M:%S") if value else ""
+
+
+def _format_key(row: Any) -> list[Any]:
+    return [
+        row.tg_id,
+        row.client_id,
+        row.email,
+        _format_ms(row.created_at),
+        _format_ms(row.expiry_time),
+        row.key,
+        row.server_id,
+        row.is_frozen,
+        row.alias or "",
+        row.tariff_name or "—",
+    ]
 
 
-async def export_keys_csv(session: AsyncSession) -> BufferedInputFile:
+def keys_export() -> CsvExport:
     j = join(Key, Tariff, Key.tariff_id == Tariff.id, isouter=True)
     query = (
         select(
@@ -216,51 +346,51 @@ async def export_keys_csv(session: AsyncSession) -> BufferedInputFile:
         .order_by(Key.created_at.asc())
     )
 
-    result = await session.execute(query)
-    keys = result.all()
-
-    buffer = StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow([
-        "tg_id",
-        "client_id",
-        "email",
-        "created_at",
-        "expiry_time",
-        "key",
-        "server_id",
-        "is_frozen",
-        "alias",
-        "tariff",
-    ])
-
-    for row in keys:
-        created_at = (
-            datetime.utcfromtimestamp(row.created_at / 1000).strftime("%Y-%m-%d %H:%M:%S") if row.created_at else ""
-        )
-        expiry_time = (
-            datetime.utcfromtimestamp(row.expiry_time / 1000).strftime("%Y-%m-%d %H:%M:%S") if row.expiry_time else ""
-        )
-        tariff = row.tariff_name or "—"
-
-        writer.writerow([
-            row.tg_id,
-            row.client_id,
-            row.email,
-            created_at,
-            expiry_time,
-            row.key,
-            row.server_id,
-            row.is_frozen,
-            row.alias or "",
-            tariff,
-        ])
-
-    buffer.seek(0)
-    return BufferedInputFile(file=buffer.getvalue().encode("utf-8-sig"), filename="keys_export.csv")
-
-
-async def export_user_all_payments_csv(tg_id: int, session: AsyncSession) -> BufferedInputFile:
+    return CsvExport(
+        "keys_export.csv",
+        query,
+        (
+            "tg_id",
+            "client_id",
+            "email",
+            "created_at",
+            "expiry_time",
+            "key",
+            "server_id",
+            "is_frozen",
+            "alias",
+            "tariff",
+        ),
+        format_row=_format_key,
+    )
+
+
+def _format_full_payment(row: Any) -> list[Any]:
+    (
+        internal_id,
+        user_tg_id,
+        external_payment_id,
+        amount,
+        currency,
+        payment_system,
+        status,
+        original_amount,
+        created_at,
+    ) = row
+    return [
+        internal_id,
+        user_tg_id,
+        external_payment_id or "",
+        amount,
+        currency,
+        payment_system,
+        status,
+        original_amount if original_amount is not None else "",
+        created_at,
+    ]
+
+
+def user_all_payments_export(tg_id: int) -> CsvExport:
     query = (
         select(
             Payment.id,
@@ -277,48 +407,60 @@ async def export_user_all_payments_csv(tg_id: int, session: AsyncSession) -> Buf
         .order_by(Payment.created_at.asc())
     )
 
-    result = await session.execute(query)
-    rows = result.all()
-
-    buffer = StringIO()
-    writer = csv.writer(buffer)
-    writer.writerow([
-        "id",
-        "tg_id",
-        "payment_id",
-        "amount",
-        "currency",
-        "payment_system",
-        "status",
-        "original_amount",
-        "created_at",
-    ])
-
-    for (
-        internal_id,
-        user_tg_id,
-        external_payment_id,
-        amount,
-        currency,
-        payment_system,
-        status,
-        original_amount,
-        created_at,
-    ) in rows:
-        writer.writerow([
-            internal_id,
-            user_tg_id,
-            external_payment_id or "",
-            amount,
-            currency,
-            payment_system,
-            status,
-            original_amount if original_amount is not None else "",
-            created_at,
-        ])
-
-    buffer.seek(0)
-    return BufferedInputFile(
-        file=buffer.getvalue().encode("utf-8-sig"),
-        filename=f"user_{tg_id}_payments_full.csv",
+    return CsvExport(
+        f"user_{tg_id}_payments_full.csv",
+        query,
+        (
+            "id",
+            "tg_id",
+            "payment_id",
+            "amount",
+            "currency",
+            "payment_system",
+            "status",
+            "original_amount",
+            "created_at",
+        ),
+        format_row=_format_full_payment,
     )
+
+
+EXPORTS: dict[str, Callable[[], CsvExport]] = {
+    "users": users_export,
+    "payments": payments_export,
+    "hot_leads": hot_leads_export,
+    "keys": keys_export,
+}
+
+
+async def export_users_csv(session: AsyncSession) -> list[SpooledInputFile]:
+    return await build_export(session, users_export())
+
+
+async def export_payments_csv(session: AsyncSession) -> list[SpooledInputFile]:
+    return await build_export(session, payments_export())
+
+
+async def export_user_payments_csv(tg_id: int, session: AsyncSession) -> list[SpooledInputFile]:
+    return await build_export(session, payments_export(tg_id))
+
+
+async def export_referrals_csv(referrer_tg_id: int, session: AsyncSession) -> list[SpooledInputFile] | None:
+    parts = await build_export(session, referrals_export(referrer_tg_id))
+    if not parts[0].rows:
+        for part in parts:
+            part.close()
+        return None
+    return parts
+
+
+async def export_hot_leads_csv(session: AsyncSession) -> list[SpooledInputFile]:
+    return await build_export(session, hot_leads_export())
+
+
+async def export_keys_csv(session: AsyncSession) -> list[SpooledInputFile]:
+    return await build_export(session, keys_export())
+
+
+async def export_user_all_payments_csv(tg_id: int, session: AsyncSession) -> list[SpooledInputFile]:
+    return await build_export(session, user_all_payments_export(tg_id))
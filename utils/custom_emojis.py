@@ -8,8 +8,9 @@ from aiogram.enums import MessageEntityType
 from aiogram.types import MessageEntity
 
 from logger import logger
+from utils.cache import BoundedCache
 
-_PLACEHOLDER_CACHE: dict[str, str] = {}
+_PLACEHOLDER_CACHE = BoundedCache("custom_emoji_placeholders", maxsize=10_000, ttl=24 * 3600)
 _BOT: Bot | None = None
 
 _MARKER_RE = re.compile(r"\{emoji:(\d+)\}|\[emoji:(\d+)\]")
@@ -45,8 +46,9 @@ def _utf16_len(text: str) -> int:
 
 async def _fetch_placeholder(emoji_id: str) -> str:
     """Resolve a custom emoji id to a visible placeholder emoji."""
-    if emoji_id in _PLACEHOLDER_CACHE:
-        return _PLACEHOLDER_CACHE[emoji_id]
+    cached = _PLACEHOLDER_CACHE.get(emoji_id)
+    if cached is not None:
+        return cached
 
     if _BOT is None:
         return "😀"
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import time
+
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database.temporary_data import delete_expired_fsm_records, get_fsm_record, save_fsm_records
+from logger import logger
+from utils.cache import BoundedCache
+
+
+FSM_FLUSH_INTERVAL_SEC = 1.0
+FSM_STATE_TTL_SEC = 3 * 24 * 3600
+FSM_CLEANUP_INTERVAL_SEC = 3600
+FSM_CACHE_SIZE = 100_000
+FSM_CACHE_TTL_SEC = 600
+
+FsmRecord = tuple[str | None, dict[str, Any]]
+
+
+def _to_json(data: dict[str, Any]) -> dict[str, Any]:
+    # В данных FSM встречаются Decimal/datetime — в БД они сохраняются строками
+    return json.loads(json.dumps(data, default=str))
+
+
+class PostgresStorage(BaseStorage):
+    """
+    Хранилище FSM в таблице fsm_states. Чтение идёт через кеш процесса, запись —
+    write-behind: изменения копятся в памяти и раз в flush_interval пишутся в БД одной пачкой.
+    Записи, не обновлявшиеся state_ttl секунд, периодически удаляются.
+
+    Кеш не сверяется с БД, поэтому состояние пользователя должен менять только один процесс:
+    бот в одном процессе или воркеры с шардированием по пользователю (BOT_WORKERS > 1).
+    Несколько копий бота без шардирования будут читать друг у друга устаревшие состояния.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        key_builder: KeyBuilder | None = None,
+        flush_interval: float = FSM_FLUSH_INTERVAL_SEC,
+        state_ttl: int = FSM_STATE_TTL_SEC,
+        cache_ttl: int = FSM_CACHE_TTL_SEC,
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.flush_interval = flush_interval
+        self.state_ttl = state_ttl
+        self._cache = BoundedCache("fsm_storage", maxsize=FSM_CACHE_SIZE, ttl=cache_ttl)
+        self._dirty: dict[str, FsmRecord] = {}
+        self._flushing: dict[str, FsmRecord] = {}
+        self._flush_lock = asyncio.Lock()
+        self._flusher: asyncio.Task | None = None
+        self._last_cleanup = 0.0
+
+    async def _load(self, key: StorageKey) -> tuple[str, FsmRecord]:
+        storage_key = self.key_builder.build(key)
+        record = self._dirty.get(storage_key) or self._flushing.get(storage_key) or self._cache.get(storage_key)
+        if record is None:
+            async with self.sessionmaker() as session:
+                record = await get_fsm_record(session, storage_key) or (None, {})
+            record = self._dirty.get(storage_key) or self._flushing.get(storage_key) or record
+            self._cache[storage_key] = record
+        return storage_key, record
+
+    def _store(self, storage_key: str, record: FsmRecord) -> None:
+        self._cache[storage_key] = record
+        self._dirty[storage_key] = record
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        storage_key, (_, data) = await self._load(key)
+        self._store(storage_key, (state.state if isinstance(state, State) else state, data))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        _, (state, _) = await self._load(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise TypeError(msg)
+        storage_key, (state, _) = await self._load(key)
+        # Кешируем ровно то, что уйдёт в БД, чтобы чтение из кеша и из БД не расходилось
+        self._store(storage_key, (state, _to_json(data)))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, (_, data) = await self._load(key)
+        return data.copy()
+
+    async def flush(self) -> None:
+        """Пишет накопленные изменения в БД; при ошибке они остаются в очереди."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            self._flushing, self._dirty = self._dirty, {}
+            try:
+                async with self.sessionmaker() as session:
+                    await save_fsm_records(session, dict(self._flushing))
+                    await session.commit()
+            except Exception as e:
+                logger.error(f"[FSM] Не удалось сохранить {len(self._flushing)} состояний: {e}")
+                self._requeue()
+            except asyncio.CancelledError:
+                self._requeue()
+                raise
+            finally:
+                self._flushing = {}
+
+    def _requeue(self) -> None:
+        for key, record in self._flushing.items():
+            self._dirty.setdefault(key, record)
+
+    async def cleanup(self) -> None:
+        older_than = datetime.utcnow() - timedelta(seconds=self.state_ttl)
+        try:
+            async with self.sessionmaker() as session:
+                deleted = await delete_expired_fsm_records(session, older_than)
+                await session.commit()
+            if deleted:
+                logger.info(f"[FSM] Удалено устаревших состояний: {deleted}")
+        except Exception as e:
+            logger.error(f"[FSM] Ошибка очистки устаревших состояний: {e}")
+
+    async def _flush_loop(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.monotonic() - self._last_cleanup >= FSM_CLEANUP_INTERVAL_SEC:
+                self._last_cleanup = time.monotonic()
+                await self.cleanup()
+
+    async def close(self) -> None:
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import os
+
+from collections.abc import Awaitable, Callable
+from datetime import datetime
+
+import aiofiles
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, Message
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from database import async_session_maker
+from database.models import Setting
+from logger import logger
+
+
+FILE_IDS_SETTING_KEY = "TELEGRAM_FILE_IDS"
+
+_file_ids: dict[str, str] = {}
+_file_ids_loaded = False
+_load_lock = asyncio.Lock()
+_upload_locks: dict[str, asyncio.Lock] = {}
+_file_hashes: dict[str, tuple[float, int, str]] = {}
+
+
+async def _file_digest(path: str) -> str:
+    """sha256 содержимого файла; пересчитывается только при изменении mtime/размера."""
+    stat = os.stat(path)
+    cached = _file_hashes.get(path)
+    if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+        return cached[2]
+
+    async with aiofiles.open(path, "rb") as f:
+        data = await f.read()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    _file_hashes[path] = (stat.st_mtime, stat.st_size, digest)
+    return digest
+
+
+async def media_key(bot: Bot, path: str) -> str:
+    """Ключ реестра: бот (file_id действительны только для своего токена), путь и хеш содержимого."""
+    path = os.path.normpath(path)
+    return f"{bot.id}:{path}:{await _file_digest(path)}"
+
+
+async def _ensure_loaded() -> None:
+    global _file_ids_loaded
+
+    if _file_ids_loaded:
+        return
+    async with _load_lock:
+        if _file_ids_loaded:
+            return
+        try:
+            async with async_session_maker() as session:
+                result = await session.execute(select(Setting.value).where(Setting.key == FILE_IDS_SETTING_KEY))
+                stored = result.scalar_one_or_none() or {}
+            for key, file_id in stored.items():
+                _file_ids.setdefault(key, file_id)
+            logger.debug(f"[MediaCache] Загружено file_id: {len(stored)}")
+        except Exception as e:
+            logger.warning(f"[MediaCache] Не удалось загрузить file_id из настроек: {e}")
+        _file_ids_loaded = True
+
+
+async def _persist(key: str, file_id: str) -> None:
+    """Дописывает одну запись в настройку (jsonb ||), не затирая записи других процессов."""
+    try:
+        async with async_session_maker() as session:
+            stmt = insert(Setting).values(
+                key=FILE_IDS_SETTING_KEY,
+                value={key: file_id},
+                description="Кеш file_id загруженных в Telegram изображений",
+            )
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[Setting.key],
+                    set_={
+                        "value": func.coalesce(Setting.value, text("'{}'::jsonb")).op("||")(stmt.excluded.value),
+                        "updated_at": datetime.utcnow(),
+                    },
+                )
+            )
+            await session.commit()
+    except Exception as e:
+        logger.warning(f"[MediaCache] Не удалось сохранить file_id для {key}: {e}")
+
+
+def extract_file_id(message: Message | None) -> str | None:
+    if message is None or isinstance(message, bool):
+        return None
+    if getattr(message, "photo", None):
+        return message.photo[-1].file_id
+    if getattr(message, "video", None):
+        return message.video.file_id
+    if getattr(message, "animation", None):
+        return message.animation.file_id
+    if getattr(message, "document", None):
+        return message.document.file_id
+    return None
+
+
+async def get_cached_file_id(bot: Bot, path: str) -> str | None:
+    await _ensure_loaded()
+    return _file_ids.get(await media_key(bot, path))
+
+
+async def remember_file_id(bot: Bot, path: str, message: Message | None) -> None:
+    file_id = extract_file_id(message)
+    if not file_id:
+        return
+    key = await media_key(bot, path)
+    if _file_ids.get(key) == file_id:
+        return
+    _file_ids[key] = file_id
+    await _persist(key, file_id)
+
+
+async def forget_file_id(bot: Bot, path: str) -> None:
+    _file_ids.pop(await media_key(bot, path), None)
+
+
+async def read_upload(path: str) -> BufferedInputFile:
+    async with aiofiles.open(path, "rb") as f:
+        data = await f.read()
+    return BufferedInputFile(data, filename=os.path.basename(path))
+
+
+async def send_with_cached_media(
+    bot: Bot,
+    path: str,
+    send: Callable[[str | BufferedInputFile], Awaitable[Message]],
+) -> Message:
+    """
+    Отправляет локальный файл через send(media): по сохранённому file_id, а если его нет —
+    загружает файл один раз (остальные отправители ждут) и запоминает полученный file_id.
+    """
+    await _ensure_loaded()
+    key = await media_key(bot, path)
+
+    file_id = _file_ids.get(key)
+    if file_id:
+        try:
+            return await send(file_id)
+        except TelegramBadRequest as e:
+            if "file" not in str(e).lower():
+                raise
+            logger.warning(f"[MediaCache] file_id для {path} отклонён Telegram, загружаем заново: {e}")
+            _file_ids.pop(key, None)
+
+    lock = _upload_locks.setdefault(key, asyncio.Lock())
+    async with lock:
+        file_id = _file_ids.get(key)
+        if file_id:
+            return await send(file_id)
+
+        message = await send(await read_upload(path))
+        new_file_id = extract_file_id(message)
+        if new_file_id:
+            _file_ids[key] = new_file_id
+            await _persist(key, new_file_id)
+        return message
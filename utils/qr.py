@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import qrcode
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import BufferedInputFile, InlineKeyboardMarkup, InputMediaPhoto, Message
+
+from logger import logger
+from utils.cache import BoundedCache
+from utils.media_cache import extract_file_id
+
+
+QR_RENDER_WORKERS = 2
+QR_FILE_ID_CACHE_SIZE = 50_000
+QR_FILE_ID_CACHE_TTL = 7 * 24 * 3600
+
+_executor = ThreadPoolExecutor(max_workers=QR_RENDER_WORKERS, thread_name_prefix="qr")
+_file_ids = BoundedCache("qr_file_ids", maxsize=QR_FILE_ID_CACHE_SIZE, ttl=QR_FILE_ID_CACHE_TTL)
+
+
+def render_qr_png(data: str) -> bytes:
+    """PNG с QR-кодом для data. Синхронная и CPU-ёмкая — вызывать через render_qr."""
+    qr = qrcode.QRCode(version=1, box_size=10, border=4)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def render_qr(data: str) -> BufferedInputFile:
+    """Рендерит QR-код в пуле потоков, не блокируя event loop."""
+    png = await asyncio.get_running_loop().run_in_executor(_executor, render_qr_png, data)
+    return BufferedInputFile(png, filename="qrcode.png")
+
+
+def _cache_key(bot_id: int, data: str) -> str:
+    # file_id действительны только для токена, которым загружены
+    return f"{bot_id}:{hashlib.sha256(data.encode()).hexdigest()}"
+
+
+async def _show_photo(
+    target_message: Message,
+    media: str | BufferedInputFile,
+    caption: str,
+    reply_markup: InlineKeyboardMarkup | None,
+) -> Message | None:
+    try:
+        result = await target_message.edit_media(
+            InputMediaPhoto(media=media, caption=caption), reply_markup=reply_markup
+        )
+    except TelegramBadRequest:
+        result = await target_message.answer_photo(photo=media, caption=caption, reply_markup=reply_markup)
+    return result if isinstance(result, Message) else None
+
+
+async def send_qr_code(
+    target_message: Message,
+    data: str,
+    caption: str,
+    reply_markup: InlineKeyboardMarkup | None = None,
+) -> None:
+    """
+    Показывает QR-код для data вместо target_message (или новым сообщением).
+    Готовый file_id кешируется по содержимому, повторный показ не рендерит и не загружает картинку.
+    """
+    key = _cache_key(target_message.bot.id, data)
+
+    file_id = _file_ids.get(key)
+    if file_id:
+        try:
+            await _show_photo(target_message, file_id, caption, reply_markup)
+            return
+        except TelegramBadRequest as e:
+            logger.warning(f"[QR] file_id отклонён Telegram, рендерим заново: {e}")
+            _file_ids.pop(key, None)
+
+    message = await _show_photo(target_message, await render_qr(data), caption, reply_markup)
+    file_id = extract_file_id(message)
+    if file_id:
+        _file_ids[key] = file_id
@@ -0,0 +1,261 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+
+from collections import deque
+from collections.abc import Awaitable, Callable
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Any
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+    CopyMessage,
+    EditMessageCaption,
+    EditMessageMedia,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    ForwardMessage,
+    SendAnimation,
+    SendAudio,
+    SendDocument,
+    SendMediaGroup,
+    SendMessage,
+    SendPhoto,
+    SendSticker,
+    SendVideo,
+    SendVoice,
+    TelegramMethod,
+)
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+import config as cfg
+
+from logger import logger
+from utils.cache import BoundedCache
+
+
+SEND_RATE = float(getattr(cfg, "BOT_SEND_RATE", 30))
+SEND_MIN_RATE = 5.0
+SEND_BURST = 5
+SEND_CHAT_INTERVAL_SEC = 1.0
+SEND_THROTTLE_FACTOR = 0.7
+SEND_RECOVERY_INTERVAL_SEC = 10.0
+SEND_RECOVERY_STEP = 1.0
+SEND_STATS_WINDOW_SEC = 60.0
+
+SCHEDULED_METHODS = (
+    SendMessage,
+    SendPhoto,
+    SendDocument,
+    SendVideo,
+    SendAnimation,
+    SendAudio,
+    SendVoice,
+    SendSticker,
+    SendMediaGroup,
+    CopyMessage,
+    ForwardMessage,
+    EditMessageText,
+    EditMessageCaption,
+    EditMessageMedia,
+    EditMessageReplyMarkup,
+)
+
+
+class SendPriority(IntEnum):
+    """Классы отправки: меньшее значение обслуживается раньше."""
+
+    INTERACTIVE = 0
+    PAYMENT = 1
+    EXPIRY = 2
+    MARKETING = 3
+
+
+# Вне обработки апдейта (вебхуки платёжных систем и т.п.) сообщения считаются платёжными
+_send_priority: contextvars.ContextVar[SendPriority] = contextvars.ContextVar(
+    "send_priority", default=SendPriority.PAYMENT
+)
+
+
+@contextmanager
+def send_priority(priority: SendPriority):
+    """Отправки внутри блока (и в созданных в нём задачах) идут с приоритетом priority."""
+    token = _send_priority.set(priority)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+
+class SendScheduler:
+    """
+    Общий для процесса планировщик исходящих сообщений Telegram: глобальный token bucket,
+    пауза не чаще раза в SEND_CHAT_INTERVAL_SEC на чат для фоновых отправок и очередь
+    по приоритетам. На TelegramRetryAfter отправки приостанавливаются на retry_after,
+    а скорость снижается и затем постепенно восстанавливается до max_rate.
+    """
+
+    def __init__(
+        self,
+        max_rate: float = SEND_RATE,
+        min_rate: float = SEND_MIN_RATE,
+        burst: int = SEND_BURST,
+        chat_interval: float = SEND_CHAT_INTERVAL_SEC,
+    ) -> None:
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.burst = burst
+        self.chat_interval = chat_interval
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._adjusted_at = 0.0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._dispatcher: asyncio.Task | None = None
+        self._chat_next = BoundedCache("send_scheduler_chats", maxsize=200_000, ttl=chat_interval * 10)
+        self._sent_at: deque[float] = deque()
+        self.sent_by_priority = dict.fromkeys(SendPriority, 0)
+        self.throttled = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    def _take(self, now: float, priority: SendPriority) -> None:
+        self._tokens -= 1
+        self._sent_at.append(now)
+        self.sent_by_priority[priority] += 1
+
+    async def _pace_chat(self, chat_id: int | str) -> None:
+        now = time.monotonic()
+        ready_at = max(now, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = ready_at + self.chat_interval
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    async def acquire(self, chat_id: int | str | None = None, priority: SendPriority | None = None) -> None:
+        """Ждёт разрешения на одну отправку в chat_id."""
+        priority = _send_priority.get() if priority is None else priority
+        if chat_id is not None and priority > SendPriority.INTERACTIVE:
+            await self._pace_chat(chat_id)
+
+        now = time.monotonic()
+        if not self._waiters and now >= self._paused_until:
+            self._refill(now)
+            if self._tokens >= 1:
+                self._take(now, priority)
+                return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._refill(now)
+            if self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                continue
+
+            priority, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._take(now, SendPriority(priority))
+            future.set_result(None)
+
+    def report_retry_after(self, retry_after: float) -> None:
+        """Telegram ответил flood control: останавливаем все отправки и снижаем скорость."""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + retry_after)
+        self._tokens = min(self._tokens, 0.0)
+        self.rate = max(self.min_rate, self.rate * SEND_THROTTLE_FACTOR)
+        self._adjusted_at = now
+        self.throttled += 1
+        logger.warning(f"[SendScheduler] Flood control на {retry_after} сек., скорость снижена до {self.rate:.1f}/сек")
+
+    def report_success(self) -> None:
+        if self.rate >= self.max_rate:
+            return
+        now = time.monotonic()
+        if now - self._adjusted_at >= SEND_RECOVERY_INTERVAL_SEC:
+            self.rate = min(self.max_rate, self.rate + SEND_RECOVERY_STEP)
+            self._adjusted_at = now
+
+    def sustained_rate(self) -> float:
+        """Средняя фактическая скорость отправки за последние SEND_STATS_WINDOW_SEC, сообщений/сек."""
+        cutoff = time.monotonic() - SEND_STATS_WINDOW_SEC
+        while self._sent_at and self._sent_at[0] < cutoff:
+            self._sent_at.popleft()
+        return len(self._sent_at) / SEND_STATS_WINDOW_SEC
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "rate_limit": round(self.rate, 2),
+            "max_rate": self.max_rate,
+            "sustained_rate": round(self.sustained_rate(), 2),
+            "queued": len(self._waiters),
+            "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            "throttled": self.throttled,
+            "sent": {priority.name.lower(): count for priority, count in self.sent_by_priority.items()},
+        }
+
+
+send_scheduler = SendScheduler()
+
+
+class SendSchedulerRequestMiddleware(BaseRequestMiddleware):
+    """Пропускает методы отправки сообщений бота через send_scheduler."""
+
+    def __init__(self, scheduler: SendScheduler) -> None:
+        self.scheduler = scheduler
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not isinstance(method, SCHEDULED_METHODS):
+            return await make_request(bot, method)
+
+        await self.scheduler.acquire(getattr(method, "chat_id", None))
+        try:
+            response = await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            self.scheduler.report_retry_after(e.retry_after)
+            raise
+        self.scheduler.report_success()
+        return response
+
+
+class InteractivePriorityMiddleware(BaseMiddleware):
+    """Ответы в рамках обработки апдейта получают наивысший приоритет."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        with send_priority(SendPriority.INTERACTIVE):
+            return await handler(event, data)
+
+
+def setup_send_scheduler(bot: Bot, dp: Dispatcher) -> None:
+    bot.session.middleware(SendSchedulerRequestMiddleware(send_scheduler))
+    dp.update.outer_middleware(InteractivePriorityMiddleware())
@@ -0,0 +1,404 @@
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+import secrets
+import signal
+import sys
+
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import aiohttp
+import asyncpg
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.types import TelegramObject, Update
+from aiohttp import web
+
+import config as cfg
+
+from database.invalidation import add_commit_publisher, fire_tables_changed, watched_tables
+from logger import logger
+
+
+BOT_WORKERS = max(1, int(getattr(cfg, "BOT_WORKERS", 1) or 1))
+BOT_WORKERS_HOST = "127.0.0.1"
+BOT_WORKERS_PORT = int(getattr(cfg, "BOT_WORKERS_PORT", 8200))
+WORKER_UPDATES_PATH = "/updates"
+WORKER_INDEX_ENV = "SOLOBOT_WORKER_INDEX"
+WORKER_TOKEN_ENV = "SOLOBOT_WORKER_TOKEN"  # noqa: S105
+WORKER_TOKEN_HEADER = "X-Solobot-Worker-Token"  # noqa: S105
+WORKER_BATCH_SIZE = 100
+# Очередь апдейтов к одному воркеру: пока он перезапускается, лишнее получает ответ «высокая нагрузка»
+WORKER_QUEUE_SIZE = int(getattr(cfg, "BOT_WORKER_QUEUE_SIZE", 2000))
+WORKER_RETRY_DELAY_SEC = 1.0
+WORKER_RESTART_DELAY_SEC = 3.0
+HASH_RING_REPLICAS = 160
+INVALIDATION_CHANNEL = "solobot_invalidation"
+INVALIDATION_RECONNECT_DELAY_SEC = 1.0
+INVALIDATION_RECONNECT_MAX_DELAY_SEC = 30.0
+
+SHARDING_ENABLED = BOT_WORKERS > 1
+IS_SHARD_WORKER = os.getenv(WORKER_INDEX_ENV) is not None
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Консистентное хеширование: ключ -> номер воркера. Каждый воркер занимает replicas точек на кольце."""
+
+    def __init__(self, nodes: int, replicas: int = HASH_RING_REPLICAS) -> None:
+        points = sorted((_hash(f"{node}:{i}"), node) for node in range(nodes) for i in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: int | str) -> int:
+        idx = bisect.bisect(self._hashes, _hash(str(key))) % len(self._hashes)
+        return self._nodes[idx]
+
+
+def shard_key(event: TelegramObject, data: dict[str, Any]) -> int | None:
+    """
+    Ключ шардирования апдейта: id пользователя, к которому относится апдейт, для апдейтов без
+    пользователя — id чата. В chat_member event_from_user — это тот, кто изменил статус (админ канала),
+    а кеш подписки на канал хранится по участнику, поэтому такие апдейты идут к воркеру участника.
+    """
+    if isinstance(event, Update) and event.chat_member is not None:
+        return event.chat_member.new_chat_member.user.id
+    user = data.get("event_from_user")
+    if user is not None:
+        return user.id
+    chat = data.get("event_chat")
+    if chat is not None:
+        return chat.id
+    return None
+
+
+class ShardRouterMiddleware(BaseMiddleware):
+    """
+    Фронт-процесс: апдейт с пользователем не обрабатывается локально, а уходит воркеру,
+    выбранному по консистентному хешу shard_key. Апдейты одного пользователя всегда попадают
+    к одному воркеру и отправляются ему в порядке поступления.
+    """
+
+    def __init__(self, workers: int, token: str) -> None:
+        self.ring = HashRing(workers)
+        self.token = token
+        self._queues = [asyncio.Queue(maxsize=WORKER_QUEUE_SIZE) for _ in range(workers)]
+        self._senders: list[asyncio.Task] = []
+        self._http: aiohttp.ClientSession | None = None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        key = shard_key(event, data)
+        if key is None or not isinstance(event, Update):
+            return await handler(event, data)
+
+        index = self.ring.node_for(key)
+        try:
+            self._queues[index].put_nowait(event.model_dump_json(exclude_unset=True, by_alias=True))
+        except asyncio.QueueFull:
+            from middlewares.concurrency import send_overload_reply
+
+            logger.warning(f"[Sharding] Очередь воркера {index} переполнена, апдейт {event.update_id} отклонён")
+            await send_overload_reply(event, data)
+        return None
+
+    async def start(self) -> None:
+        self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+        self._senders = [asyncio.create_task(self._send_loop(index)) for index in range(len(self._queues))]
+
+    async def close(self) -> None:
+        for task in self._senders:
+            task.cancel()
+        await asyncio.gather(*self._senders, return_exceptions=True)
+        if self._http is not None:
+            await self._http.close()
+
+    async def _send_loop(self, index: int) -> None:
+        queue = self._queues[index]
+        url = f"http://{BOT_WORKERS_HOST}:{BOT_WORKERS_PORT + index}{WORKER_UPDATES_PATH}"
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < WORKER_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            body = "\n".join(batch)
+            while True:
+                try:
+                    async with self._http.post(url, data=body, headers={WORKER_TOKEN_HEADER: self.token}) as resp:
+                        resp.raise_for_status()
+                    break
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"[Sharding] Воркер {index} недоступен ({len(batch)} апдейтов в очереди): {e}")
+                    await asyncio.sleep(WORKER_RETRY_DELAY_SEC)
+
+
+class WorkerSupervisor:
+    """Запускает процессы-воркеры и перезапускает упавшие."""
+
+    def __init__(self, workers: int, token: str) -> None:
+        self.workers = workers
+        self.token = token
+        self._tasks: list[asyncio.Task] = []
+        self._procs: dict[int, asyncio.subprocess.Process] = {}
+
+    async def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._keep_alive(index)) for index in range(self.workers)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for proc in self._procs.values():
+            if proc.returncode is None:
+                proc.terminate()
+        await asyncio.gather(*(proc.wait() for proc in self._procs.values()), return_exceptions=True)
+
+    async def _keep_alive(self, index: int) -> None:
+        env = {**os.environ, WORKER_INDEX_ENV: str(index), WORKER_TOKEN_ENV: self.token}
+        while True:
+            proc = await asyncio.create_subprocess_exec(sys.executable, "-m", "utils.sharding", env=env)
+            self._procs[index] = proc
+            logger.info(f"[Sharding] Воркер {index} запущен, pid={proc.pid}")
+            code = await proc.wait()
+            logger.error(f"[Sharding] Воркер {index} завершился с кодом {code}, перезапуск")
+            await asyncio.sleep(WORKER_RESTART_DELAY_SEC)
+
+
+class InvalidationBus:
+    """
+    Рассылает изменённые таблицы между процессами через LISTEN/NOTIFY Postgres,
+    чтобы кеши on_tables_committed, настройки и роли админов оставались согласованными во всех воркерах.
+    Потерянное соединение восстанавливается в фоне, после чего локальные кеши сбрасываются целиком.
+    """
+
+    def __init__(self, dsn: str) -> None:
+        self.dsn = dsn
+        self.origin = secrets.token_hex(8)
+        self._conn: asyncpg.Connection | None = None
+        self._pending: set[str] = set()
+        self._publisher: asyncio.Task | None = None
+        self._reconnector: asyncio.Task | None = None
+        self._closed = False
+        self._tasks: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        await self._connect()
+        add_commit_publisher(self.publish)
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._reconnector is not None:
+            self._reconnector.cancel()
+            await asyncio.gather(self._reconnector, return_exceptions=True)
+        if self._publisher is not None:
+            await asyncio.gather(self._publisher, return_exceptions=True)
+        if self._conn is not None:
+            await self._conn.close()
+
+    async def _connect(self) -> None:
+        conn = await asyncpg.connect(self.dsn)
+        try:
+            await conn.add_listener(INVALIDATION_CHANNEL, self._on_notify)
+        except Exception:
+            await conn.close()
+            raise
+        conn.add_termination_listener(self._on_terminated)
+        self._conn = conn
+
+    def _on_terminated(self, conn: asyncpg.Connection) -> None:
+        if self._closed or conn is not self._conn:
+            return
+        logger.warning("[Sharding] Соединение шины инвалидации потеряно, переподключение")
+        self._conn = None
+        if self._reconnector is None or self._reconnector.done():
+            self._reconnector = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self) -> None:
+        delay = INVALIDATION_RECONNECT_DELAY_SEC
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self._connect()
+                break
+            except Exception as e:
+                logger.error(f"[Sharding] Не удалось переподключить шину инвалидации: {e}")
+                delay = min(delay * 2, INVALIDATION_RECONNECT_MAX_DELAY_SEC)
+
+        # Пока соединения не было, чужие инвалидации могли потеряться: сбрасываем все кеши целиком
+        logger.info("[Sharding] Шина инвалидации переподключена, локальные кеши сброшены")
+        self._invalidate(watched_tables() | {"settings"})
+        if self._pending and (self._publisher is None or self._publisher.done()):
+            self._publisher = asyncio.get_running_loop().create_task(self._flush())
+
+    def publish(self, tables: set[str]) -> None:
+        tables = tables & (watched_tables() | {"settings"})
+        if not tables:
+            return
+        self._pending |= tables
+        if self._conn is not None and (self._publisher is None or self._publisher.done()):
+            self._publisher = asyncio.get_running_loop().create_task(self._flush())
+
+    async def _flush(self) -> None:
+        while self._pending and self._conn is not None:
+            tables, self._pending = self._pending, set()
+            payload = json.dumps({"origin": self.origin, "tables": sorted(tables)})
+            try:
+                await self._conn.execute("SELECT pg_notify($1, $2)", INVALIDATION_CHANNEL, payload)
+            except Exception as e:
+                # Таблицы остаются в очереди и уйдут со следующей публикацией или после переподключения
+                logger.error(f"[Sharding] Не удалось разослать инвалидацию {sorted(tables)}: {e}")
+                self._pending |= tables
+                return
+
+    def _on_notify(self, conn: asyncpg.Connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            return
+        if message.get("origin") == self.origin:
+            return
+        self._invalidate(set(message.get("tables") or ()))
+
+    def _invalidate(self, tables: set[str]) -> None:
+        fire_tables_changed(tables)
+        if "settings" in tables:
+            task = asyncio.get_running_loop().create_task(_reload_settings())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+
+async def _reload_settings() -> None:
+    from core.bootstrap import (
+        load_buttons_config,
+        load_management_config,
+        load_modes_config,
+        load_money_config,
+        load_notifications_config,
+        load_payments_config,
+        load_providers_order,
+        load_tariffs_config,
+    )
+    from database.db import async_session_maker
+
+    try:
+        async with async_session_maker() as session:
+            for load in (
+                load_buttons_config,
+                load_notifications_config,
+                load_modes_config,
+                load_payments_config,
+                load_providers_order,
+                load_money_config,
+                load_management_config,
+                load_tariffs_config,
+            ):
+                await load(session)
+            await session.rollback()
+    except Exception as e:
+        logger.error(f"[Sharding] Ошибка перезагрузки настроек: {e}")
+
+
+def _invalidation_dsn() -> str:
+    from database.db import engine
+
+    return engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+def setup_sharding(dp: Dispatcher) -> None:
+    """
+    Включает многопроцессный режим (BOT_WORKERS > 1 в config). Во фронт-процессе апдейты
+    пользователей уходят воркерам, а сами воркеры запускаются и перезапускаются фронтом.
+    """
+    if not SHARDING_ENABLED:
+        return
+
+    bus = InvalidationBus(_invalidation_dsn())
+    dp.startup.register(bus.start)
+    dp.shutdown.register(bus.close)
+    if IS_SHARD_WORKER:
+        return
+
+    token = secrets.token_hex(16)
+    router = ShardRouterMiddleware(BOT_WORKERS, token)
+    supervisor = WorkerSupervisor(BOT_WORKERS, token)
+    dp.update.outer_middleware(router)
+    dp.startup.register(router.start)
+    dp.startup.register(supervisor.start)
+    dp.shutdown.register(supervisor.close)
+    dp.shutdown.register(router.close)
+
+
+async def _run_worker(index: int) -> None:
+    from bot import bot, dp
+    from core.bootstrap import bootstrap
+    from database.db import async_session_maker
+    from handlers import router
+    from handlers.fallback_router import fallback_router
+    from middlewares import register_middleware
+
+    await bootstrap()
+    dp.include_router(router)
+    dp.include_router(fallback_router)
+    register_middleware(dp, sessionmaker=async_session_maker)
+
+    token = os.environ[WORKER_TOKEN_ENV]
+    tasks: set[asyncio.Task] = set()
+
+    async def receive_updates(request: web.Request) -> web.Response:
+        if request.headers.get(WORKER_TOKEN_HEADER) != token:
+            return web.Response(status=403)
+        for line in (await request.text()).splitlines():
+            # Пакет принимается целиком: битый апдейт пропускается, иначе фронт повторял бы пакет бесконечно
+            try:
+                update = Update.model_validate_json(line, context={"bot": bot})
+            except ValueError as e:
+                logger.error(f"[Sharding] Пропущен некорректный апдейт: {e}")
+                continue
+            task = asyncio.create_task(_feed_update(dp, bot, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WORKER_UPDATES_PATH, receive_updates)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, BOT_WORKERS_HOST, BOT_WORKERS_PORT + index).start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    workflow_data = {"dispatcher": dp, "bots": [bot], **dp.workflow_data}
+    await dp.emit_startup(bot=bot, **workflow_data)
+    logger.info(f"[Sharding] Воркер {index} принимает апдейты на порту {BOT_WORKERS_PORT + index}")
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await dp.emit_shutdown(bot=bot, **workflow_data)
+        await bot.session.close()
+
+
+async def _feed_update(dp: Dispatcher, bot: Bot, update: Update) -> None:
+    try:
+        await dp.feed_update(bot, update)
+    except Exception as e:
+        logger.error(f"[Sharding] Ошибка обработки апдейта {update.update_id}: {e}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_run_worker(int(os.environ[WORKER_INDEX_ENV])))